@@ -0,0 +1,151 @@
+"""
+Admission Control
+Token-bucket rate limiting for the API, keyed by client and by target device
+
+Each budget is a set of token buckets: a bucket holds up to `burst` tokens and refills
+at `rate` tokens per second, and every admitted request spends one token. A request
+that finds an empty bucket is rejected immediately with the time until a token is
+available, instead of queueing behind SQLite writes.
+
+State is kept in memory per worker process; with N workers a client's effective
+budget is up to N times the configured rate.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Requests per second and burst size for each budget, overridable with environment variables
+DEFAULT_BUDGETS = {
+    # GET /api/* per client
+    'client_read': (50.0, 100),
+    # POST/PUT/DELETE /api/* per client
+    'client_write': (10.0, 20),
+    # Writes per target device, scene or group, across all clients
+    'target_write': (5.0, 10)
+}
+
+# Buckets tracked per budget; beyond this the least recently used are evicted
+MAX_TRACKED_KEYS = 10000
+
+Budget = namedtuple('Budget', ['rate', 'burst'])
+
+
+def load_budgets(environ=os.environ):
+    """
+    Read budgets from RATE_LIMIT_<NAME>_RATE and RATE_LIMIT_<NAME>_BURST.
+
+    Example: RATE_LIMIT_CLIENT_WRITE_RATE=20 RATE_LIMIT_CLIENT_WRITE_BURST=40
+    """
+    budgets = {}
+    for name, (rate, burst) in DEFAULT_BUDGETS.items():
+        prefix = f'RATE_LIMIT_{name.upper()}'
+        try:
+            rate = float(environ.get(f'{prefix}_RATE', rate))
+            burst = int(environ.get(f'{prefix}_BURST', burst))
+        except ValueError:
+            print(f"Warning: invalid {prefix}_RATE/{prefix}_BURST. Using defaults for '{name}'.")
+            rate, burst = DEFAULT_BUDGETS[name]
+        if rate <= 0 or burst < 1:
+            print(f"Warning: {prefix}_RATE must be > 0 and {prefix}_BURST >= 1. Using defaults for '{name}'.")
+            rate, burst = DEFAULT_BUDGETS[name]
+        budgets[name] = Budget(rate, burst)
+    return budgets
+
+
+class TokenBuckets:
+    """Token buckets for one budget, keyed by an arbitrary string."""
+
+    def __init__(self, rate, burst, max_keys=MAX_TRACKED_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, time of last refill], least recently used first
+        self._buckets = OrderedDict()
+        self.admitted = 0
+        self.shed = 0
+
+    def refill(self, key, now):
+        """Return the [tokens, last refill] bucket for key, topped up to now."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now):
+        # Buckets are in order of last use, so idle ones are at the front. A bucket idle
+        # long enough to be full again is equivalent to no bucket; when every bucket is
+        # active, the least recently used one is dropped (its client starts over at burst)
+        idle = self.burst / self.rate
+        buckets = self._buckets
+        while buckets:
+            _, last = next(iter(buckets.values()))
+            if now - last < idle and len(buckets) < self.max_keys:
+                break
+            buckets.popitem(last=False)
+
+    def wait_time(self, bucket):
+        """Seconds until the bucket holds a whole token (0 when it already does)."""
+        return 0.0 if bucket[0] >= 1 else (1 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Admits or sheds requests against several token-bucket budgets at once."""
+
+    def __init__(self, budgets=None):
+        budgets = budgets or load_budgets()
+        self.budgets = {name: TokenBuckets(budget.rate, budget.burst) for name, budget in budgets.items()}
+        self._lock = threading.Lock()
+
+    def try_admit(self, checks, now=None):
+        """
+        Spend one token from every (budget name, key) in checks, or none of them.
+
+        Returns 0 when the request is admitted, otherwise the seconds until it
+        would be. Shed requests are counted against the budgets that were empty.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            buckets = [(self.budgets[name], self.budgets[name].refill(key, now)) for name, key in checks]
+            retry_after = 0.0
+            for budget, bucket in buckets:
+                wait = budget.wait_time(bucket)
+                if wait:
+                    budget.shed += 1
+                    retry_after = max(retry_after, wait)
+            if retry_after:
+                return retry_after
+            for budget, bucket in buckets:
+                bucket[0] -= 1
+                budget.admitted += 1
+            return 0.0
+
+    def stats(self):
+        """Admitted/shed counters and configuration for each budget."""
+        with self._lock:
+            return {
+                name: {
+                    'rate': budget.rate,
+                    'burst': budget.burst,
+                    'admitted': budget.admitted,
+                    'shed': budget.shed,
+                    'tracked_keys': len(budget)
+                }
+                for name, budget in self.budgets.items()
+            }
+
+
+def retry_after_header(seconds):
+    """Retry-After takes whole seconds; round up so clients never retry too early."""
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,522 @@
+"""
+Anomaly Detection
+Streaming detection of stuck sensors, spikes and sudden drops in device readings
+
+Three readings are watched per device: the temperature sensor value, power readings
+appended to energy_logs, and battery_level. Each (device, reading) keeps a fixed
+amount of state: an exponentially weighted moving average and variance, the previous
+reading and its time, a repeat counter and the time of the last alert. Each new
+reading updates that state in O(1) and is checked against its rule:
+
+    spike / dip    more than z_threshold standard deviations (and min_deviation
+                   units) away from the moving average
+    rapid_rise /   changed by at least min_step, faster than max_rise_rate or
+    rapid_drop     max_drop_rate units per second
+    stuck          the same value stuck_readings times in a row
+
+Readings arrive by tailing the change log (see replication.py) and, for power, by
+reading energy_logs rows past the last id seen (appends are not copied into the change
+log), so writes from every worker process and from the telemetry gateway are seen. State lives in flat arrays
+indexed by a per-device slot, about 48 bytes per device and reading, and at most
+MAX_TRACKED_DEVICES devices are tracked.
+
+On startup, recent energy_logs history is replayed to warm up the power state and
+to record alerts that were missed while detection was not running. The replay
+advances every device one reading at a time with NumPy, falling back to the
+streaming path when NumPy is not installed.
+"""
+
+import calendar
+import json
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+# Try to import NumPy, make it optional
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: numpy not installed. Anomaly backfill will be slower. Install with: pip install numpy")
+
+Rule = namedtuple('Rule', ['alpha', 'z_threshold', 'min_deviation', 'min_step',
+                           'max_rise_rate', 'max_drop_rate', 'stuck_readings', 'unit'])
+
+# None disables a check
+RULES = {
+    # Temperature sensor value (devices.value where type = 'sensor'), °C
+    'temperature': Rule(alpha=0.05, z_threshold=4.0, min_deviation=3.0, min_step=3.0,
+                        max_rise_rate=0.5, max_drop_rate=0.5, stuck_readings=60, unit='°C'),
+    # Power readings (energy_logs.power_consumption), W
+    'power': Rule(alpha=0.05, z_threshold=5.0, min_deviation=100.0, min_step=None,
+                  max_rise_rate=None, max_drop_rate=None, stuck_readings=None, unit='W'),
+    # Battery level (devices.battery_level), %
+    'battery': Rule(alpha=0.1, z_threshold=None, min_deviation=None, min_step=5.0,
+                    max_rise_rate=None, max_drop_rate=0.05, stuck_readings=None, unit='%')
+}
+KINDS = ('spike', 'dip', 'rapid_rise', 'rapid_drop', 'stuck')
+
+# Readings needed before a moving average is trusted
+WARMUP_READINGS = 10
+# Shortest time between readings used for rates, in seconds
+MIN_RATE_INTERVAL = 1.0
+# Seconds during which further alerts for the same device and reading are suppressed
+ALERT_COOLDOWN = 300
+
+MAX_TRACKED_DEVICES = 200000
+
+# Seconds between checks of the change log, and entries read per check
+POLL_INTERVAL = 0.05
+BATCH_SIZE = 5000
+# Hours of energy_logs replayed on startup
+BACKFILL_HOURS = 24
+# Days of alerts kept, and seconds between prunes
+ALERT_RETENTION_DAYS = 30
+PRUNE_INTERVAL = 3600
+
+
+def init_alerts_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS anomaly_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value REAL,
+            expected REAL,
+            score REAL,
+            created_at REAL NOT NULL,
+            acknowledged INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (device_id, field, kind, created_at)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_anomaly_alerts_created_at ON anomaly_alerts(created_at)')
+    conn.commit()
+
+
+def describe(field, kind, value, expected):
+    """One-line message for an alert."""
+    rule = RULES.get(field)
+    unit = rule.unit if rule else ''
+    if kind == 'stuck':
+        return f'{field} stuck at {value:g}{unit} for {rule.stuck_readings} readings'
+    if kind in ('rapid_rise', 'rapid_drop'):
+        direction = 'rose' if kind == 'rapid_rise' else 'dropped'
+        return f'{field} {direction} to {value:g}{unit} from {expected:g}{unit}'
+    direction = 'above' if kind == 'spike' else 'below'
+    return f'{field} {value:g}{unit} far {direction} its average of {expected:.1f}{unit}'
+
+
+def parse_timestamp(text):
+    """Unix seconds for a 'YYYY-MM-DD HH:MM:SS' UTC timestamp (as strftime('%s') computes it)."""
+    return calendar.timegm(time.strptime(text[:19], '%Y-%m-%d %H:%M:%S'))
+
+
+class FieldState:
+    """Per-slot detector state for one reading, in flat typed arrays."""
+
+    COLUMNS = (('mean', 'd'), ('var', 'd'), ('last_value', 'd'), ('last_time', 'd'),
+               ('last_alert', 'd'), ('count', 'I'), ('repeats', 'I'))
+
+    def __init__(self):
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def grow(self, size):
+        for name, typecode in self.COLUMNS:
+            column = getattr(self, name)
+            if len(column) < size:
+                column.extend(array(typecode, bytes(column.itemsize * (size - len(column)))))
+
+    def nbytes(self):
+        return sum(len(column) * column.itemsize for column in (getattr(self, name) for name, _ in self.COLUMNS))
+
+    def views(self):
+        """Writable NumPy views of every column, by name."""
+        return {name: np.frombuffer(getattr(self, name), dtype=np.float64 if typecode == 'd' else np.uint32)
+                for name, typecode in self.COLUMNS}
+
+
+class AnomalyDetector:
+    """Incremental per-device detectors fed from the change log, writing alerts to anomaly_alerts."""
+
+    def __init__(self, connect, rules=RULES, max_devices=MAX_TRACKED_DEVICES):
+        self.connect = connect
+        self.rules = rules
+        self.max_devices = max_devices
+        # device id -> slot in every FieldState
+        self.slots = {}
+        self.fields = {field: FieldState() for field in rules}
+        self.capacity = 0
+        self.seq = 0
+        # Highest energy_logs id evaluated
+        self.energy_id = 0
+        self.running = False
+        self.stats = {'readings': 0, 'alerts': 0, 'untracked': 0, 'batches': 0, 'skipped': 0}
+        self.backfill_stats = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def slot(self, device_id):
+        slot = self.slots.get(device_id)
+        if slot is None:
+            if len(self.slots) >= self.max_devices:
+                self.stats['untracked'] += 1
+                return None
+            slot = self.slots[device_id] = len(self.slots)
+            if slot >= self.capacity:
+                # Grow geometrically, up to the device limit
+                self.capacity = min(max(slot + 1, self.capacity * 2, 1024), self.max_devices)
+                for state in self.fields.values():
+                    state.grow(self.capacity)
+        return slot
+
+    def observe(self, device_id, field, value, timestamp):
+        """
+        Update one device's state with a reading.
+
+        Returns an alert (device_id, field, kind, value, expected, score, timestamp)
+        or None.
+        """
+        slot = self.slot(device_id)
+        if slot is None:
+            return None
+        rule = self.rules[field]
+        state = self.fields[field]
+        self.stats['readings'] += 1
+        count = state.count[slot]
+        if count == 0:
+            state.mean[slot] = value
+            state.var[slot] = 0.0
+            state.last_value[slot] = value
+            state.last_time[slot] = timestamp
+            state.last_alert[slot] = float('-inf')
+            state.count[slot] = 1
+            state.repeats[slot] = 0
+            return None
+
+        mean = state.mean[slot]
+        var = state.var[slot]
+        last = state.last_value[slot]
+        step = value - last
+        alert = None
+
+        repeats = state.repeats[slot] + 1 if step == 0 else 0
+        state.repeats[slot] = repeats
+        if rule.stuck_readings and repeats == rule.stuck_readings:
+            alert = ('stuck', last, float(repeats))
+        elif rule.min_step is not None and abs(step) >= rule.min_step:
+            rate = step / max(timestamp - state.last_time[slot], MIN_RATE_INTERVAL)
+            if rule.max_rise_rate is not None and rate > rule.max_rise_rate:
+                alert = ('rapid_rise', last, rate)
+            elif rule.max_drop_rate is not None and -rate > rule.max_drop_rate:
+                alert = ('rapid_drop', last, rate)
+        if alert is None and rule.z_threshold is not None and count >= WARMUP_READINGS:
+            deviation = value - mean
+            if abs(deviation) >= rule.min_deviation and deviation * deviation > rule.z_threshold ** 2 * var:
+                score = deviation / math.sqrt(var) if var > 0 else float('inf')
+                alert = ('spike' if deviation > 0 else 'dip', mean, score)
+
+        # Exponentially weighted mean and variance
+        diff = value - mean
+        increment = rule.alpha * diff
+        state.mean[slot] = mean + increment
+        state.var[slot] = (1 - rule.alpha) * (var + diff * increment)
+        state.last_value[slot] = value
+        state.last_time[slot] = timestamp
+        state.count[slot] = min(count + 1, 0xFFFFFFFF)
+
+        if alert is None or timestamp - state.last_alert[slot] < ALERT_COOLDOWN:
+            return None
+        state.last_alert[slot] = timestamp
+        kind, expected, score = alert
+        return (device_id, field, kind, value, expected, score, timestamp)
+
+    def readings_from_change(self, table, data, created_at):
+        """Yield (device_id, field, value, timestamp) readings carried by one change-log upsert."""
+        if table == 'energy_logs':
+            if data.get('device_id') is not None and data.get('power_consumption') is not None:
+                timestamp = parse_timestamp(data['timestamp']) if data.get('timestamp') else created_at
+                yield data['device_id'], 'power', float(data['power_consumption']), float(timestamp)
+        elif table == 'devices':
+            if data.get('type') == 'sensor' and data.get('value') is not None:
+                yield data['id'], 'temperature', float(data['value']), created_at
+            if data.get('battery_level') is not None:
+                yield data['id'], 'battery', float(data['battery_level']), created_at
+
+    def process_changes(self, conn):
+        """
+        Evaluate the next batch of change-log entries and appended energy_logs rows.
+
+        Returns the larger of the two counts read, so callers drain until both are short.
+        """
+        # Both are read from one snapshot
+        conn.execute('BEGIN')
+        try:
+            rows = conn.execute(
+                "SELECT seq, table_name, data, created_at FROM change_log "
+                "WHERE seq > ? AND op = 'upsert' AND table_name IN ('devices', 'energy_logs') "
+                "ORDER BY seq LIMIT ?",
+                (self.seq, BATCH_SIZE)
+            ).fetchall()
+            appended = conn.execute(
+                'SELECT id, device_id, power_consumption, timestamp FROM energy_logs WHERE id > ? ORDER BY id LIMIT ?',
+                (self.energy_id, BATCH_SIZE)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        if not rows and not appended:
+            return 0
+        alerts = []
+        now = time.time()
+        with self._lock:
+            for seq, table, data, created_at in rows:
+                self.observe_change(table, data, created_at, alerts)
+                self.seq = seq
+            for energy_id, device_id, power, timestamp in appended:
+                data = {'device_id': device_id, 'power_consumption': power, 'timestamp': timestamp}
+                self.observe_change('energy_logs', data, now, alerts)
+                self.energy_id = energy_id
+            self.stats['batches'] += 1
+        self.record_alerts(conn, alerts)
+        return max(len(rows), len(appended))
+
+    def observe_change(self, table, data, created_at, alerts):
+        """
+        Observe the readings in one row (a dict, or change-log JSON text), appending any alerts.
+
+        A malformed row (e.g. an imported timestamp in another format) is counted and
+        skipped; it must not stop the detector or replay the rows before it.
+        """
+        try:
+            if isinstance(data, str):
+                data = json.loads(data)
+            readings = list(self.readings_from_change(table, data, created_at))
+            if not all(math.isfinite(value) and math.isfinite(timestamp)
+                       for _, _, value, timestamp in readings):
+                raise ValueError('non-finite reading')
+            for device_id, field, value, timestamp in readings:
+                alert = self.observe(int(device_id), field, value, timestamp)
+                if alert:
+                    alerts.append(alert)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            self.stats['skipped'] += 1
+
+    def record_alerts(self, conn, alerts):
+        if not alerts:
+            return 0
+        cursor = conn.executemany(
+            'INSERT OR IGNORE INTO anomaly_alerts (device_id, field, kind, value, expected, score, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(device_id, field, kind, value, expected,
+              score if score not in (float('inf'), float('-inf')) else None, timestamp)
+             for device_id, field, kind, value, expected, score, timestamp in alerts]
+        )
+        conn.commit()
+        # Alerts already recorded (e.g. found again by a backfill) are ignored
+        inserted = cursor.rowcount
+        self.stats['alerts'] += inserted
+        return inserted
+
+    def backfill(self, conn, hours=BACKFILL_HOURS):
+        """
+        Replay the last `hours` of energy_logs through the power detector.
+
+        Reads the history and the current change-log position in one snapshot,
+        so no reading is evaluated twice. Returns backfill statistics.
+        """
+        started = time.perf_counter()
+        since = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - hours * 3600))
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+            seq = row[0] if row else 0
+            energy_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM energy_logs').fetchone()[0]
+            if NUMPY_AVAILABLE:
+                import energy_analytics
+                device_ids, timestamps, power = energy_analytics.load_energy_arrays(conn, start=since)
+            else:
+                rows = conn.execute(
+                    "SELECT device_id, CAST(strftime('%s', timestamp) AS INTEGER), power_consumption FROM energy_logs "
+                    "WHERE device_id IS NOT NULL AND power_consumption IS NOT NULL AND timestamp >= ? "
+                    "ORDER BY device_id, timestamp, id", (since,)
+                ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+
+        with self._lock:
+            if NUMPY_AVAILABLE:
+                readings = len(power)
+                alerts = self.backfill_arrays('power', device_ids, timestamps.astype(np.float64), power)
+            else:
+                readings = len(rows)
+                alerts = [alert for alert in (self.observe(device_id, 'power', float(value), float(timestamp))
+                                              for device_id, timestamp, value in rows) if alert]
+            self.seq = max(self.seq, seq)
+            self.energy_id = max(self.energy_id, energy_id)
+        inserted = self.record_alerts(conn, alerts)
+        self.backfill_stats = {
+            'hours': hours,
+            'readings': readings,
+            'alerts': inserted,
+            'vectorized': NUMPY_AVAILABLE,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+        return self.backfill_stats
+
+    def backfill_arrays(self, field, device_ids, timestamps, values):
+        """
+        Vectorized equivalent of calling observe() for each reading in order.
+
+        Readings are grouped by device; step k advances every device that has a
+        k-th reading at once, so the loop runs once per reading of the busiest device.
+        """
+        if not len(values):
+            return []
+        rule = self.rules[field]
+        order = np.lexsort((timestamps, device_ids))
+        device_ids, timestamps, values = device_ids[order], timestamps[order], values[order]
+        unique_ids, starts, counts = np.unique(device_ids, return_index=True, return_counts=True)
+
+        slots = np.array([-1 if slot is None else slot for slot in map(self.slot, unique_ids.tolist())], dtype=np.int64)
+        tracked = slots >= 0
+        unique_ids, starts, counts, slots = unique_ids[tracked], starts[tracked], counts[tracked], slots[tracked]
+        self.stats['readings'] += int(counts.sum())
+        s = self.fields[field].views()
+        alerts = []
+
+        for k in range(int(counts.max()) if len(counts) else 0):
+            active = counts > k
+            slot = slots[active]
+            rows = starts[active] + k
+            ids, value, timestamp = unique_ids[active], values[rows], timestamps[rows]
+            count = s['count'][slot].astype(np.int64)
+
+            first = count == 0
+            if first.any():
+                fs = slot[first]
+                s['mean'][fs] = value[first]
+                s['var'][fs] = 0.0
+                s['last_value'][fs] = value[first]
+                s['last_time'][fs] = timestamp[first]
+                s['last_alert'][fs] = -np.inf
+                s['count'][fs] = 1
+                s['repeats'][fs] = 0
+            rest = ~first
+            if not rest.any():
+                continue
+            slot, ids, value, timestamp, count = slot[rest], ids[rest], value[rest], timestamp[rest], count[rest]
+            mean, var, last = s['mean'][slot], s['var'][slot], s['last_value'][slot]
+            step = value - last
+
+            repeats = np.where(step == 0, s['repeats'][slot].astype(np.int64) + 1, 0)
+            s['repeats'][slot] = repeats
+            kind = np.full(len(slot), -1, dtype=np.int64)
+            expected = np.zeros(len(slot))
+            score = np.zeros(len(slot))
+            if rule.stuck_readings:
+                stuck = repeats == rule.stuck_readings
+                kind[stuck], expected[stuck], score[stuck] = KINDS.index('stuck'), last[stuck], repeats[stuck]
+            if rule.min_step is not None:
+                rate = step / np.maximum(timestamp - s['last_time'][slot], MIN_RATE_INTERVAL)
+                candidate = (kind < 0) & (np.abs(step) >= rule.min_step)
+                if rule.max_rise_rate is not None:
+                    rise = candidate & (rate > rule.max_rise_rate)
+                    kind[rise], expected[rise], score[rise] = KINDS.index('rapid_rise'), last[rise], rate[rise]
+                    candidate &= ~rise
+                if rule.max_drop_rate is not None:
+                    drop = candidate & (-rate > rule.max_drop_rate)
+                    kind[drop], expected[drop], score[drop] = KINDS.index('rapid_drop'), last[drop], rate[drop]
+            if rule.z_threshold is not None:
+                deviation = value - mean
+                outlier = ((kind < 0) & (count >= WARMUP_READINGS) & (np.abs(deviation) >= rule.min_deviation)
+                           & (deviation * deviation > rule.z_threshold ** 2 * var))
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    z = np.where(var > 0, deviation / np.sqrt(var), np.inf)
+                kind[outlier] = np.where(deviation[outlier] > 0, KINDS.index('spike'), KINDS.index('dip'))
+                expected[outlier], score[outlier] = mean[outlier], z[outlier]
+
+            diff = value - mean
+            increment = rule.alpha * diff
+            s['mean'][slot] = mean + increment
+            s['var'][slot] = (1 - rule.alpha) * (var + diff * increment)
+            s['last_value'][slot] = value
+            s['last_time'][slot] = timestamp
+            s['count'][slot] = np.minimum(count + 1, 0xFFFFFFFF)
+
+            fired = (kind >= 0) & (timestamp - s['last_alert'][slot] >= ALERT_COOLDOWN)
+            if fired.any():
+                s['last_alert'][slot[fired]] = timestamp[fired]
+                alerts.extend(
+                    (int(device_id), field, KINDS[kind_index], float(reading), float(baseline), float(z), float(t))
+                    for device_id, kind_index, reading, baseline, z, t in zip(
+                        ids[fired], kind[fired], value[fired], expected[fired], score[fired], timestamp[fired])
+                )
+        return alerts
+
+    def start(self):
+        """Backfill, then follow the change log in a background thread."""
+        if self.running:
+            return
+        self.running = True
+        self._stop.clear()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.running = False
+
+    def _run(self):
+        conn = None
+        data_version = None
+        last_prune = 0.0
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = self.connect()
+                    if self.backfill_stats is None:
+                        self.backfill(conn)
+                    data_version = None
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current != data_version:
+                    while self.process_changes(conn) == BATCH_SIZE:
+                        pass
+                    data_version = current
+                if time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                    conn.execute('DELETE FROM anomaly_alerts WHERE created_at < ?',
+                                 (time.time() - ALERT_RETENTION_DAYS * 86400,))
+                    conn.commit()
+                    last_prune = time.monotonic()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error detecting anomalies: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self._stop.wait(1)
+                continue
+            self._stop.wait(POLL_INTERVAL)
+        if conn is not None:
+            conn.close()
+
+    def status(self):
+        with self._lock:
+            memory = sum(state.nbytes() for state in self.fields.values()) + sys.getsizeof(self.slots)
+            return {
+                'running': self.running,
+                'seq': self.seq,
+                'energy_id': self.energy_id,
+                'tracked_devices': len(self.slots),
+                'max_devices': self.max_devices,
+                'state_bytes': memory,
+                'backfill': self.backfill_stats,
+                'last_error': self.last_error,
+                'rules': {field: rule._asdict() for field, rule in self.rules.items()},
+                **self.stats
+            }
@@ -31,15 +31,12 @@ try:
     
     print("Step 2: Initializing database...")
     try:
-        from app import init_db, init_scenes_table, init_schedules_table, init_energy_table
-        init_db()
+        import schema
+        from app import DATABASE, init_tables
+        schema.init_db(DATABASE)
         print("✓ init_db() completed")
-        init_scenes_table()
-        print("✓ init_scenes_table() completed")
-        init_schedules_table()
-        print("✓ init_schedules_table() completed")
-        init_energy_table()
-        print("✓ init_energy_table() completed")
+        init_tables()
+        print("✓ init_tables() completed")
         print("✓ Database initialization complete")
     except Exception as db_err:
         print(f"⚠ Database initialization error: {db_err}")
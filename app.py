@@ -10,7 +10,24 @@ import threading
 import random
 import time
 import json
-from flask import Flask, render_template, jsonify, request
+import hashlib
+import hmac
+import functools
+from datetime import datetime, timezone
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context
+import energy_analytics
+import bulk_transfer
+import groups
+import command_dispatch
+import coherence
+import static_assets
+import admission
+import backup
+import replication
+import profiler
+import anomaly
+import hot_tier
+import schema
 
 # Try to import CORS, make it optional
 try:
@@ -52,71 +69,40 @@ if os.environ.get('VERCEL'):
         # If /tmp is not writable, use current directory
         DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices.db')
 
-def init_db():
-    """Initialize the database with the devices table and sample data."""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Create devices table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS devices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            state TEXT NOT NULL,
-            value INTEGER,
-            light_effect TEXT DEFAULT 'natural',
-            ac_mode TEXT DEFAULT 'cool',
-            device_mode TEXT,
-            battery_level INTEGER,
-            power_consumption REAL
-        )
-    ''')
-    
-    # Check and add columns if they don't exist
-    cursor.execute("PRAGMA table_info(devices)")
-    columns = [column[1] for column in cursor.fetchall()]
-    column_additions = {
-        'light_effect': 'TEXT DEFAULT "natural"',
-        'ac_mode': 'TEXT DEFAULT "cool"',
-        'device_mode': 'TEXT',
-        'battery_level': 'INTEGER',
-        'power_consumption': 'REAL'
-    }
-    for col_name, col_def in column_additions.items():
-        if col_name not in columns:
-            cursor.execute(f'ALTER TABLE devices ADD COLUMN {col_name} {col_def}')
-    
-    # Insert sample data - all 15 devices
-    sample_devices = [
-        ('Light', 'light', 'off', None, 'natural', None, None, None, None),
-        ('Fan', 'fan', 'off', 0, None, None, None, None, None),
-        ('Temperature', 'sensor', 'on', 26, None, None, None, None, None),
-        ('Air Conditioner', 'ac', 'off', 24, None, 'cool', None, None, None),
-        ('Smart Lock', 'lock', 'locked', None, None, None, 'locked', None, None),
-        ('Smart Blinds', 'blinds', 'closed', 0, None, None, None, None, None),
-        ('Smart Plug', 'plug', 'off', None, None, None, None, None, 0.0),
-        ('Security Camera', 'camera', 'off', None, None, None, 'idle', None, None),
-        ('Smart Speaker', 'speaker', 'off', 50, None, None, 'bluetooth', None, None),
-        ('Garage Door', 'garage', 'closed', None, None, None, 'closed', None, None),
-        ('Smart Thermostat', 'thermostat', 'off', 22, None, None, 'auto', None, None),
-        ('Smart Vacuum', 'vacuum', 'off', None, None, None, 'auto', 85, None),
-        ('Smart Doorbell', 'doorbell', 'on', None, None, None, 'idle', 90, None),
-        ('Smart Sprinkler', 'sprinkler', 'off', None, None, None, 'zone1', None, None),
-        ('Motion Sensor', 'motion', 'on', None, None, None, None, None, None),
-        ('Smart TV', 'tv', 'off', 30, None, None, 'hdmi1', None, None)
-    ]
-    
-    # Check if devices already exist
-    cursor.execute('SELECT COUNT(*) FROM devices')
-    if cursor.fetchone()[0] == 0:
-        cursor.executemany('''
-            INSERT INTO devices (name, type, state, value, light_effect, ac_mode, device_mode, battery_level, power_consumption)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_devices)
-    
-    conn.commit()
-    conn.close()
+# Database file override (e.g. to run a second instance next to the first)
+if os.environ.get('DATABASE_PATH'):
+    DATABASE = os.path.abspath(os.environ['DATABASE_PATH'])
+
+# Warm standby mode: STANDBY_OF names the primary's database file. The standby keeps its
+# own copy (DATABASE_PATH, default devices-standby.db next to the primary), applies the
+# primary's change log to it, and serves read-only API traffic until promoted.
+STANDBY_OF = os.environ.get('STANDBY_OF')
+standby = None
+if STANDBY_OF:
+    STANDBY_OF = os.path.abspath(STANDBY_OF)
+    if not os.environ.get('DATABASE_PATH'):
+        DATABASE = os.path.join(os.path.dirname(STANDBY_OF), 'devices-standby.db')
+    standby = replication.Standby(STANDBY_OF, DATABASE)
+
+# Online backups; on serverless, point BACKUP_DIR at storage that outlives the instance
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(DATABASE), 'backups'))
+try:
+    BACKUP_INTERVAL = int(os.environ.get('BACKUP_INTERVAL', backup.BACKUP_INTERVAL))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', backup.BACKUP_KEEP))
+except ValueError:
+    print("Warning: invalid BACKUP_INTERVAL/BACKUP_KEEP. Using defaults.")
+    BACKUP_INTERVAL, BACKUP_KEEP = backup.BACKUP_INTERVAL, backup.BACKUP_KEEP
+
+# Hot tier for the latest sensor readings, shared by every worker through an mmap'd
+# file next to the database; HOT_TIER=0 sends every reading straight to SQLite
+HOT_TIER_PATH = hot_tier.path_for(DATABASE)
+HOT_TIER_ENABLED = (hot_tier.HOT_TIER_AVAILABLE and not os.environ.get('VERCEL')
+                    and os.environ.get('HOT_TIER', '1') != '0')
+try:
+    HOT_TIER_INTERVAL = float(os.environ.get('HOT_TIER_CHECKPOINT_INTERVAL', hot_tier.CHECKPOINT_INTERVAL))
+except ValueError:
+    print("Warning: invalid HOT_TIER_CHECKPOINT_INTERVAL. Using default.")
+    HOT_TIER_INTERVAL = hot_tier.CHECKPOINT_INTERVAL
 
 def get_db_connection():
     """Get a database connection."""
@@ -124,76 +110,43 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_scenes_table():
-    """Initialize scenes table for scene control."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scenes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            device_states TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Insert default scenes if they don't exist
-    cursor.execute('SELECT COUNT(*) FROM scenes')
-    if cursor.fetchone()[0] == 0:
-        default_scenes = [
-            ('Good Morning', json.dumps({'1': {'state': 'on'}, '6': {'state': 'open', 'value': 100}, '4': {'state': 'off'}})),
-            ('Movie Night', json.dumps({'1': {'state': 'on', 'light_effect': 'dim'}, '16': {'state': 'on'}, '4': {'state': 'off'}})),
-            ('Away', json.dumps({'1': {'state': 'off'}, '2': {'state': 'off'}, '4': {'state': 'off'}, '5': {'state': 'locked'}, '8': {'state': 'on', 'device_mode': 'recording'}})),
-            ('Sleep', json.dumps({'1': {'state': 'off'}, '2': {'state': 'off'}, '4': {'state': 'off'}, '6': {'state': 'closed', 'value': 0}}))
-        ]
-        cursor.executemany('INSERT INTO scenes (name, device_states) VALUES (?, ?)', default_scenes)
-    
-    conn.commit()
-    conn.close()
-
-def init_schedules_table():
-    """Initialize schedules table for automation."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS schedules (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            device_id INTEGER,
-            action TEXT NOT NULL,
-            time TEXT NOT NULL,
-            days TEXT NOT NULL,
-            enabled INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+def init_change_log_table():
+    """Initialize the replication change log and its capture triggers."""
+    if STANDBY_OF:
+        # A standby receives changes from the primary; promotion creates the triggers
+        return
+    schema.init_change_log_table(DATABASE)
 
-def init_energy_table():
-    """Initialize energy monitoring table."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS energy_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id INTEGER,
-            power_consumption REAL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+def init_tables():
+    """Initialize every table other than devices."""
+    schema.init_tables(DATABASE, change_log=False)
+    init_change_log_table()
+
+# Restore the newest backup before falling back to sample data
+if standby is None and not os.path.exists(DATABASE):
+    # Readings left over from a database that is gone do not belong to the new one
+    if os.path.exists(HOT_TIER_PATH):
+        os.remove(HOT_TIER_PATH)
+    try:
+        restored_backup = backup.restore_latest(DATABASE, BACKUP_DIR)
+        if restored_backup:
+            print(f"Database restored from backup {restored_backup}")
+    except Exception as e:
+        print(f"Warning: Database restore failed: {e}")
 
 # Initialize database if it doesn't exist
 # Wrap in try-except to prevent import-time crashes
 try:
-    if not os.path.exists(DATABASE):
+    if standby is not None:
+        # A standby's schema and rows come from the primary
+        try:
+            standby.bootstrap_if_needed()
+        except Exception as standby_err:
+            print(f"Warning: Standby bootstrap failed: {standby_err}")
+    elif not os.path.exists(DATABASE):
         try:
-            init_db()
-            init_scenes_table()
-            init_schedules_table()
-            init_energy_table()
+            schema.init_db(DATABASE)
+            init_tables()
         except Exception as init_err:
             print(f"Warning: Database initialization failed: {init_err}")
             # Continue - database will be initialized on first request if needed
@@ -201,6 +154,7 @@ try:
         # Check and add columns if missing, add new devices
         try:
             conn = get_db_connection()
+            schema.init_journal_mode(conn)
             cursor = conn.cursor()
             cursor.execute("PRAGMA table_info(devices)")
             columns = [column[1] for column in cursor.fetchall()]
@@ -220,6 +174,8 @@ try:
                     if update_sql:
                         cursor.execute(update_sql)
             
+            schema.init_device_indexes(cursor)
+            
             # Add new devices if they don't exist
             new_devices = [
                 ('Smart Lock', 'lock', 'locked', None, None, None, 'locked', None, None),
@@ -249,9 +205,7 @@ try:
             
             # Initialize additional tables
             try:
-                init_scenes_table()
-                init_schedules_table()
-                init_energy_table()
+                init_tables()
             except Exception as table_err:
                 print(f"Warning: Additional table initialization failed: {table_err}")
         except Exception as e:
@@ -261,8 +215,27 @@ except Exception as e:
     print(f"Warning: Database initialization error (non-fatal): {e}")
     # Don't crash on import - let it initialize on first request
 
-def device_to_dict(row):
-    """Convert a database row to a dictionary."""
+# Device columns in API order
+DEVICE_FIELDS = ('id', 'name', 'type', 'state', 'value', 'light_effect', 'ac_mode',
+                 'device_mode', 'battery_level', 'power_consumption')
+# Columns that may be missing on older databases, with the value used when missing or NULL
+OPTIONAL_DEVICE_FIELDS = {
+    'light_effect': 'natural',
+    'ac_mode': 'cool',
+    'device_mode': None,
+    'battery_level': None,
+    'power_consumption': None
+}
+
+# Accepted light effects and AC modes
+VALID_LIGHT_EFFECTS = schema.VALID_LIGHT_EFFECTS
+VALID_AC_MODES = schema.VALID_AC_MODES
+
+# Page size limits for /api/devices keyset pagination
+DEVICES_MAX_PAGE_SIZE = 1000
+
+def device_to_dict(row, fields=DEVICE_FIELDS):
+    """Convert a database row to a dictionary, keeping only the given fields."""
     # Safely get optional fields with defaults
     def safe_get(field, default=None):
         try:
@@ -271,28 +244,337 @@ def device_to_dict(row):
         except (KeyError, IndexError):
             return default
     
-    light_effect = safe_get('light_effect', 'natural')
-    ac_mode = safe_get('ac_mode', 'cool')
-    device_mode = safe_get('device_mode')
-    battery_level = safe_get('battery_level')
-    power_consumption = safe_get('power_consumption')
+    device = {}
+    for field in fields:
+        if field in OPTIONAL_DEVICE_FIELDS:
+            device[field] = safe_get(field, OPTIONAL_DEVICE_FIELDS[field])
+        else:
+            device[field] = row[field]
+    # Readings not yet checkpointed to SQLite are newer than the row
+    readings = hot_readings.read(device['id'])
+    if readings:
+        for field, value in readings.items():
+            if field in device:
+                device[field] = value
+    return device
+
+# Command delivery to physical devices; the adapter is chosen with COMMAND_ADAPTER
+adapter_name = os.environ.get('COMMAND_ADAPTER', 'simulated')
+if adapter_name not in command_dispatch.ADAPTERS:
+    print(f"Warning: unknown command adapter '{adapter_name}'. Using simulated adapter.")
+    adapter_name = 'simulated'
+command_dispatcher = command_dispatch.CommandDispatcher(get_db_connection, command_dispatch.ADAPTERS[adapter_name]())
+# Commands are recorded by every worker but delivered by the one that owns background jobs
+COMMAND_DISPATCH_ENABLED = not os.environ.get('VERCEL')
+
+# Cross-process cache invalidation and background job ownership
+change_bus = coherence.ChangeBus(get_db_connection)
+leader_election = coherence.LeaderElection(DATABASE + '.leader')
+
+hot_readings = hot_tier.HotTier(HOT_TIER_PATH, get_db_connection, interval=HOT_TIER_INTERVAL)
+if HOT_TIER_ENABLED:
+    try:
+        hot_readings.open()
+    except OSError as e:
+        print(f"Warning: Hot tier unavailable, readings go straight to SQLite: {e}")
+change_bus.subscribe('groups', groups.membership_index.invalidate)
+change_bus.subscribe('device_commands', command_dispatcher.poll)
+
+def queue_device_commands(cursor, commands):
+    """
+    Record (device_id, action, payload) commands in the caller's transaction.
+    
+    Returns the recorded commands, or an empty list when dispatch is disabled.
+    Pass the result to command_dispatcher.submit() once the transaction commits;
+    if another worker runs the dispatcher, it picks them up from the change bus.
+    """
+    if not COMMAND_DISPATCH_ENABLED or not commands:
+        return []
+    recorded = [command_dispatcher.record(cursor, device_id, action, payload)
+                for device_id, action, payload in commands]
+    coherence.bump(cursor, 'device_commands')
+    return recorded
+
+def device_command_response(device, commands):
+    """Build a device mutation response: 202 with the command ID when one was queued."""
+    if not commands:
+        return jsonify(device), 200
+    device = dict(device, command_id=commands[0].id, command_status='queued')
+    return jsonify(device), 202
+
+def fetch_devices(cursor):
+    """Return every device as a dictionary, ordered by ID."""
+    cursor.execute(f'SELECT {", ".join(DEVICE_FIELDS)} FROM devices ORDER BY id')
+    return [device_to_dict(row) for row in cursor.fetchall()]
+
+def fetch_scenes(cursor):
+    """Return every scene as a dictionary, ordered by ID."""
+    cursor.execute('SELECT * FROM scenes ORDER BY id')
+    scenes = []
+    for row in cursor.fetchall():
+        scenes.append({
+            'id': row['id'],
+            'name': row['name'],
+            'device_states': json.loads(row['device_states']),
+            'created_at': row['created_at']
+        })
+    return scenes
+
+def fetch_energy_summary(cursor):
+    """Return current power per device, total power and energy logged in the last 24 hours."""
+    # Get current power consumption for all devices
+    cursor.execute('''
+        SELECT d.id, d.name, d.power_consumption, d.state
+        FROM devices d
+        WHERE d.power_consumption IS NOT NULL
+    ''')
+    
+    devices = []
+    total_power = 0.0
+    for row in cursor.fetchall():
+        readings = hot_readings.read(row['id']) or {}
+        state = readings.get('state', row['state'])
+        power = readings.get('power_consumption', row['power_consumption']) if state == 'on' else 0.0
+        devices.append({
+            'id': row['id'],
+            'name': row['name'],
+            'power': power,
+            'state': state
+        })
+        total_power += power
+    
+    # Get daily energy usage (last 24 hours)
+    cursor.execute('''
+        SELECT SUM(power_consumption) as total_energy
+        FROM energy_logs
+        WHERE timestamp >= datetime('now', '-24 hours')
+    ''')
+    daily_energy = cursor.fetchone()['total_energy'] or 0.0
     
     return {
-        'id': row['id'],
-        'name': row['name'],
-        'type': row['type'],
-        'state': row['state'],
-        'value': row['value'],
-        'light_effect': light_effect,
-        'ac_mode': ac_mode,
-        'device_mode': device_mode,
-        'battery_level': battery_level,
-        'power_consumption': power_consumption
+        'devices': devices,
+        'total_power': total_power,
+        'daily_energy': daily_energy
     }
 
+# Device, scene and energy snapshot embedded in the index page so the dashboard
+# renders without API round-trips. Rebuilt after any commit (via the change bus)
+# and at most SNAPSHOT_MAX_AGE seconds old when the bus is not running (Vercel).
+SNAPSHOT_MAX_AGE = 1.0
+snapshot_lock = threading.Lock()
+snapshot_cache = {'generation': 0, 'built_generation': None, 'built_at': 0.0, 'version': None, 'json': None}
+
+def invalidate_snapshot():
+    snapshot_cache['generation'] += 1
+
+def get_dashboard_snapshot():
+    """
+    Return (version, JSON text) of the dashboard snapshot, safe to embed in a <script> tag.
+    
+    The version is a hash of the JSON, so pages built from it only change when the data does.
+    """
+    with snapshot_lock:
+        generation = snapshot_cache['generation']
+        if (snapshot_cache['built_generation'] != generation
+                or time.monotonic() - snapshot_cache['built_at'] > SNAPSHOT_MAX_AGE):
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                snapshot = {
+                    'devices': fetch_devices(cursor),
+                    'scenes': fetch_scenes(cursor),
+                    'energy': fetch_energy_summary(cursor)
+                }
+            finally:
+                conn.close()
+            # Escape characters that could end the <script> element or open a comment
+            text = (json.dumps(snapshot, separators=(',', ':'))
+                    .replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026'))
+            snapshot_cache.update(
+                built_generation=generation,
+                built_at=time.monotonic(),
+                version=hashlib.sha256(text.encode('utf-8')).hexdigest()[:16],
+                json=text
+            )
+        return snapshot_cache['version'], snapshot_cache['json']
+
+change_bus.subscribe_any(invalidate_snapshot)
+
+# Fingerprinted, precompressed static files and the rendered index page, built once per process
+asset_manifest = static_assets.AssetManifest(app.static_folder, app.static_url_path).build()
+page_cache = static_assets.PageCache()
+
+@app.context_processor
+def inject_asset_url():
+    return {'asset_url': asset_manifest.url}
+
+@app.after_request
+def compress_large_response(response):
+    """Gzip large JSON responses for clients that accept it."""
+    return static_assets.compress_response(response, request.headers.get('Accept-Encoding'))
+
+def render_index():
+    """Serve the cached index page with the embedded snapshot, revalidated by ETag."""
+    try:
+        version, snapshot = get_dashboard_snapshot()
+    except Exception as e:
+        # The dashboard falls back to loading everything from the API
+        print(f"Error building dashboard snapshot: {e}")
+        version, snapshot = None, None
+    etag, bodies = page_cache.get(
+        'index', lambda: render_template('index.html', initial_snapshot=snapshot), version=version
+    )
+    coding = static_assets.choose_encoding(request.headers.get('Accept-Encoding'), bodies)
+    response = Response(bodies[coding], mimetype='text/html')
+    response.set_etag(f'{etag}-{coding}')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    if coding != 'identity':
+        response.headers['Content-Encoding'] = coding
+    return response.make_conditional(request)
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    """
+    Serve a fingerprinted static file from memory.
+    
+    Args:
+        filename: Fingerprinted path from asset_url(), e.g. css/style.<hash>.css
+    
+    Returns:
+        The file (precompressed when the client accepts it) with immutable cache headers
+    """
+    found = asset_manifest.get(filename, request.headers.get('Accept-Encoding'))
+    if found is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    asset, coding, body = found
+    response = Response(body, mimetype=asset.mimetype)
+    response.set_etag(f'{asset.etag}-{coding}')
+    response.headers['Cache-Control'] = static_assets.ASSET_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    if coding != 'identity':
+        response.headers['Content-Encoding'] = coding
+    return response.make_conditional(request)
+
+# Admin endpoints require ADMIN_TOKEN, sent as 'Authorization: Bearer <token>'; unset disables them
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# An admin request sent with 'X-Profile: 1' is profiled on its own
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FORMATS = ('speedscope', 'collapsed', 'summary')
+request_profiles = profiler.RequestProfiles()
+# One whole-process profile at a time
+process_profile_lock = threading.Lock()
+
+def is_admin_request():
+    """Check the request's bearer token against ADMIN_TOKEN in constant time."""
+    if not ADMIN_TOKEN:
+        return False
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode())
+
+def admin_required(view):
+    """Reject requests without the admin token (403 when admin endpoints are disabled)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({
+                'error': 'Admin endpoints disabled',
+                'message': 'Set the ADMIN_TOKEN environment variable to enable them'
+            }), 403
+        if not is_admin_request():
+            response = jsonify({'error': 'Unauthorized', 'message': 'Send Authorization: Bearer <ADMIN_TOKEN>'})
+            response.status_code = 401
+            response.headers['WWW-Authenticate'] = 'Bearer'
+            return response
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def start_request_profile():
+    """Sample the request thread while an admin request sent with X-Profile: 1 is handled."""
+    if request.headers.get(PROFILE_HEADER) == '1' and is_admin_request():
+        g.request_profiler = profiler.SamplingProfiler(
+            profiler.REQUEST_INTERVAL, thread_ids=[threading.get_ident()]
+        ).start()
+    return None
+
+@app.after_request
+def finish_request_profile(response):
+    """Store the request's profile and point to it from the response headers."""
+    sampler = g.pop('request_profiler', None)
+    if sampler is None:
+        return response
+    profile = sampler.stop()
+    profile_id = request_profiles.add(f"{request.method} {request.full_path.rstrip('?')}", profile)
+    response.headers['X-Profile-Id'] = profile_id
+    response.headers['Server-Timing'] = f'profile;dur={profile.duration * 1000:.1f}'
+    return response
+
+@app.teardown_request
+def discard_request_profile(exc):
+    sampler = g.pop('request_profiler', None)
+    if sampler is not None:
+        sampler.stop()
+
+def profile_response(profile, fmt, name):
+    if fmt == 'collapsed':
+        return Response(profile.collapsed(), mimetype='text/plain')
+    if fmt == 'summary':
+        return jsonify(profile.summary())
+    return jsonify(profile.speedscope(name))
+
+# Token-bucket admission control for the API; set RATE_LIMIT_ENABLED=0 to turn it off
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+admission_controller = admission.AdmissionController()
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+# URL parameters naming the device, scene or group a write targets
+WRITE_TARGETS = ('device_id', 'scene_id', 'group_id')
+
+def client_key():
+    """Identify the calling client; on Vercel the client address comes from X-Forwarded-For."""
+    if os.environ.get('VERCEL') and request.headers.get('X-Forwarded-For'):
+        return request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+@app.before_request
+def admit_request():
+    """Shed API requests over the client's read/write budget or the target's write budget."""
+    if not RATE_LIMIT_ENABLED or request.method == 'OPTIONS' or not request.path.startswith('/api/'):
+        return None
+    client = client_key()
+    if request.method in WRITE_METHODS:
+        checks = [('client_write', client)]
+        view_args = request.view_args or {}
+        checks.extend(('target_write', f'{name}:{view_args[name]}') for name in WRITE_TARGETS if name in view_args)
+    else:
+        checks = [('client_read', client)]
+    retry_after = admission_controller.try_admit(checks)
+    if not retry_after:
+        return None
+    response = jsonify({
+        'error': 'Too many requests',
+        'message': f'Rate limit exceeded. Retry in {retry_after:.2f}s',
+        'retry_after': round(retry_after, 3)
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = admission.retry_after_header(retry_after)
+    return response
+
+@app.before_request
+def reject_writes_on_standby():
+    """A standby serves reads only until it is promoted."""
+    if standby is None or standby.promoted:
+        return None
+    if request.method in WRITE_METHODS and request.path.startswith('/api/') and request.endpoint != 'promote_standby':
+        return jsonify({
+            'error': 'Read-only standby',
+            'message': f'This instance is a standby of {STANDBY_OF}. Send writes to the primary.'
+        }), 503
+    return None
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_index()
 
 @app.route('/health')
 def health():
@@ -303,21 +585,86 @@ def health():
         'vercel': os.environ.get('VERCEL', 'false')
     }), 200
 
+@app.route('/api/admission', methods=['GET'])
+def get_admission_stats():
+    """
+    Get admission control counters.
+    
+    Returns:
+        JSON object with rate, burst, admitted, shed and tracked_keys per budget
+    """
+    return jsonify({
+        'enabled': RATE_LIMIT_ENABLED,
+        'budgets': admission_controller.stats()
+    }), 200
+
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
     """
-    Get all devices.
+    Get devices, optionally filtered, projected and paginated.
+    
+    Query Parameters:
+        type: Optional comma-separated device types to include
+        state: Optional comma-separated device states to include (matched against the
+            stored state, which trails hot-tier readings by up to a checkpoint interval)
+        fields: Optional comma-separated fields to return (id is always included)
+        limit: Optional page size (1-1000); enables keyset pagination
+        after: Optional device ID cursor; only devices with a greater ID are returned
     
     Returns:
-        JSON array of device objects with id, name, type, state, and value.
+        JSON array of device objects. When more devices remain after a page,
+        the X-Next-Cursor header holds the value to pass as 'after'.
     """
+    fields = DEVICE_FIELDS
+    if request.args.get('fields'):
+        requested = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        invalid = [f for f in requested if f not in DEVICE_FIELDS]
+        if invalid:
+            return jsonify({'error': f'Invalid fields: {", ".join(invalid)}. Must be from: {", ".join(DEVICE_FIELDS)}'}), 400
+        fields = tuple(f for f in DEVICE_FIELDS if f == 'id' or f in requested)
+    
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        after = int(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return jsonify({'error': 'limit and after must be integers'}), 400
+    if limit is not None and not 1 <= limit <= DEVICES_MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {DEVICES_MAX_PAGE_SIZE}'}), 400
+    
+    where = []
+    params = []
+    for column in ('type', 'state'):
+        if request.args.get(column):
+            values = [v.strip() for v in request.args[column].split(',') if v.strip()]
+            where.append(f'{column} IN ({",".join("?" * len(values))})')
+            params.extend(values)
+    if after is not None:
+        where.append('id > ?')
+        params.append(after)
+    
+    query = f'SELECT {", ".join(fields)} FROM devices'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += ' ORDER BY id'
+    if limit is not None:
+        # Fetch one extra row to learn whether another page exists
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM devices ORDER BY id')
-        devices = [device_to_dict(row) for row in cursor.fetchall()]
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
         conn.close()
-        return jsonify(devices), 200
+        
+        headers = {}
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            headers['X-Next-Cursor'] = str(rows[-1]['id'])
+        
+        devices = [device_to_dict(row, fields) for row in rows]
+        return jsonify(devices), 200, headers
     except Exception as e:
         return jsonify({'error': 'Failed to fetch devices', 'message': str(e)}), 500
 
@@ -369,19 +716,23 @@ def toggle_device(device_id):
             conn.close()
             return jsonify({'error': 'Device not found'}), 404
         
-        current_state = row['state']
+        readings = hot_readings.read(device_id) or {}
+        current_state = readings.get('state', row['state'])
         new_state = 'on' if current_state == 'off' else 'off'
         
         # Update device state
         cursor.execute('UPDATE devices SET state = ? WHERE id = ?', (new_state, device_id))
+        hot_readings.discard([device_id], ['state'])
+        commands = queue_device_commands(cursor, [(device_id, 'toggle', {'state': new_state})])
         conn.commit()
+        command_dispatcher.submit(commands)
         
         # Get updated device
         cursor.execute('SELECT * FROM devices WHERE id = ?', (device_id,))
         updated_row = cursor.fetchone()
         conn.close()
         
-        return jsonify(device_to_dict(updated_row)), 200
+        return device_command_response(device_to_dict(updated_row), commands)
     except Exception as e:
         return jsonify({'error': 'Failed to toggle device', 'message': str(e)}), 500
 
@@ -429,14 +780,17 @@ def set_device_value(device_id):
         
         # Update device value
         cursor.execute('UPDATE devices SET value = ? WHERE id = ?', (value, device_id))
+        hot_readings.discard([device_id], ['value'])
+        commands = queue_device_commands(cursor, [(device_id, 'set_value', {'value': value})])
         conn.commit()
+        command_dispatcher.submit(commands)
         
         # Get updated device
         cursor.execute('SELECT * FROM devices WHERE id = ?', (device_id,))
         updated_row = cursor.fetchone()
         conn.close()
         
-        return jsonify(device_to_dict(updated_row)), 200
+        return device_command_response(device_to_dict(updated_row), commands)
     except Exception as e:
         return jsonify({'error': 'Failed to update device value', 'message': str(e)}), 500
 
@@ -464,10 +818,8 @@ def set_light_effect(device_id):
             return jsonify({'error': 'Effect is required'}), 400
         
         effect = data['effect']
-        valid_effects = ['vivid', 'natural', 'warm', 'cool', 'dim', 'bright']
-        
-        if effect not in valid_effects:
-            return jsonify({'error': f'Invalid effect. Must be one of: {", ".join(valid_effects)}'}), 400
+        if effect not in VALID_LIGHT_EFFECTS:
+            return jsonify({'error': f'Invalid effect. Must be one of: {", ".join(VALID_LIGHT_EFFECTS)}'}), 400
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -489,14 +841,16 @@ def set_light_effect(device_id):
         
         # Update light effect
         cursor.execute('UPDATE devices SET light_effect = ? WHERE id = ?', (effect, device_id))
+        commands = queue_device_commands(cursor, [(device_id, 'set_effect', {'light_effect': effect})])
         conn.commit()
+        command_dispatcher.submit(commands)
         
         # Get updated device
         cursor.execute('SELECT * FROM devices WHERE id = ?', (device_id,))
         updated_row = cursor.fetchone()
         conn.close()
         
-        return jsonify(device_to_dict(updated_row)), 200
+        return device_command_response(device_to_dict(updated_row), commands)
     except Exception as e:
         return jsonify({'error': 'Failed to update light effect', 'message': str(e)}), 500
 
@@ -524,10 +878,8 @@ def set_ac_mode(device_id):
             return jsonify({'error': 'Mode is required'}), 400
         
         mode = data['mode']
-        valid_modes = ['cool', 'heat', 'fan', 'auto']
-        
-        if mode not in valid_modes:
-            return jsonify({'error': f'Invalid mode. Must be one of: {", ".join(valid_modes)}'}), 400
+        if mode not in VALID_AC_MODES:
+            return jsonify({'error': f'Invalid mode. Must be one of: {", ".join(VALID_AC_MODES)}'}), 400
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -549,14 +901,16 @@ def set_ac_mode(device_id):
         
         # Update AC mode
         cursor.execute('UPDATE devices SET ac_mode = ? WHERE id = ?', (mode, device_id))
+        commands = queue_device_commands(cursor, [(device_id, 'set_ac_mode', {'ac_mode': mode})])
         conn.commit()
+        command_dispatcher.submit(commands)
         
         # Get updated device
         cursor.execute('SELECT * FROM devices WHERE id = ?', (device_id,))
         updated_row = cursor.fetchone()
         conn.close()
         
-        return jsonify(device_to_dict(updated_row)), 200
+        return device_command_response(device_to_dict(updated_row), commands)
     except Exception as e:
         return jsonify({'error': 'Failed to update AC mode', 'message': str(e)}), 500
 
@@ -605,14 +959,16 @@ def set_device_mode(device_id):
         
         # Update device mode
         cursor.execute('UPDATE devices SET device_mode = ? WHERE id = ?', (mode, device_id))
+        commands = queue_device_commands(cursor, [(device_id, 'set_mode', {'device_mode': mode})])
         conn.commit()
+        command_dispatcher.submit(commands)
         
         # Get updated device
         cursor.execute('SELECT * FROM devices WHERE id = ?', (device_id,))
         updated_row = cursor.fetchone()
         conn.close()
         
-        return jsonify(device_to_dict(updated_row)), 200
+        return device_command_response(device_to_dict(updated_row), commands)
     except Exception as e:
         return jsonify({'error': 'Failed to update device mode', 'message': str(e)}), 500
 
@@ -622,16 +978,7 @@ def get_scenes():
     """Get all scenes."""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM scenes ORDER BY id')
-        scenes = []
-        for row in cursor.fetchall():
-            scenes.append({
-                'id': row['id'],
-                'name': row['name'],
-                'device_states': json.loads(row['device_states']),
-                'created_at': row['created_at']
-            })
+        scenes = fetch_scenes(conn.cursor())
         conn.close()
         return jsonify(scenes), 200
     except Exception as e:
@@ -651,6 +998,7 @@ def activate_scene(scene_id):
         
         device_states = json.loads(row['device_states'])
         results = []
+        commands = []
         
         for device_id, states in device_states.items():
             try:
@@ -659,10 +1007,13 @@ def activate_scene(scene_id):
                     current = cursor.execute('SELECT state FROM devices WHERE id = ?', (device_id,)).fetchone()
                     if current and current['state'] != states['state']:
                         cursor.execute('UPDATE devices SET state = ? WHERE id = ?', (states['state'], device_id))
+                    # Drop any hot reading so the scene's state is what devices show
+                    hot_readings.discard([device_id], ['state'])
                 
                 # Update device value
                 if 'value' in states:
                     cursor.execute('UPDATE devices SET value = ? WHERE id = ?', (states['value'], device_id))
+                    hot_readings.discard([device_id], ['value'])
                 
                 # Update light effect
                 if 'light_effect' in states:
@@ -672,16 +1023,272 @@ def activate_scene(scene_id):
                 if 'device_mode' in states:
                     cursor.execute('UPDATE devices SET device_mode = ? WHERE id = ?', (states['device_mode'], device_id))
                 
-                results.append({'device_id': device_id, 'status': 'updated'})
+                result = {'device_id': device_id, 'status': 'updated'}
+                queued = queue_device_commands(cursor, [(device_id, 'scene', states)])
+                if queued:
+                    result['command_id'] = queued[0].id
+                    commands.extend(queued)
+                results.append(result)
             except Exception as e:
                 results.append({'device_id': device_id, 'status': 'error', 'message': str(e)})
         
         conn.commit()
         conn.close()
-        return jsonify({'message': 'Scene activated', 'results': results}), 200
+        command_dispatcher.submit(commands)
+        return jsonify({'message': 'Scene activated', 'results': results}), 202 if commands else 200
     except Exception as e:
         return jsonify({'error': 'Failed to activate scene', 'message': str(e)}), 500
 
+# Rooms/Groups API
+def parse_device_ids(data):
+    """Validate the 'device_ids' list of a group request body."""
+    device_ids = data.get('device_ids', [])
+    if not isinstance(device_ids, list):
+        raise ValueError('device_ids must be a list of integers')
+    try:
+        return sorted({int(device_id) for device_id in device_ids})
+    except (ValueError, TypeError):
+        raise ValueError('device_ids must be a list of integers')
+
+def unknown_devices_response(cursor, device_ids):
+    """A 400 response naming device IDs that are not in the devices table, or None if all exist."""
+    unknown = sorted(set(device_ids) - set(groups.existing_devices(cursor, device_ids)))
+    if unknown:
+        return jsonify({'error': 'Unknown device IDs', 'unknown_device_ids': unknown}), 400
+    return None
+
+@app.route('/api/groups', methods=['GET'])
+def get_groups():
+    """Get all rooms and groups with their member device IDs."""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        members = groups.membership_index.all(conn)
+        cursor.execute('SELECT * FROM device_groups ORDER BY id')
+        result = []
+        for row in cursor.fetchall():
+            result.append({
+                'id': row['id'],
+                'name': row['name'],
+                'kind': row['kind'],
+                'device_ids': list(members.get(row['id'], ())),
+                'created_at': row['created_at']
+            })
+        conn.close()
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch groups', 'message': str(e)}), 500
+
+@app.route('/api/groups', methods=['POST'])
+def create_group():
+    """
+    Create a room or group.
+    
+    Request Body:
+        JSON object with 'name', optional 'kind' ('room' or 'group') and 'device_ids'
+        
+    Returns:
+        JSON object with the new group, or 400 if a device ID does not exist.
+    """
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 400
+    
+    data = request.get_json()
+    if data is None or not data.get('name'):
+        return jsonify({'error': 'Name is required'}), 400
+    
+    kind = data.get('kind', 'group')
+    if kind not in groups.GROUP_KINDS:
+        return jsonify({'error': f'Invalid kind. Must be one of: {", ".join(groups.GROUP_KINDS)}'}), 400
+    
+    try:
+        device_ids = parse_device_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        unknown = unknown_devices_response(cursor, device_ids)
+        if unknown:
+            conn.close()
+            return unknown
+        cursor.execute('INSERT INTO device_groups (name, kind) VALUES (?, ?)', (data['name'], kind))
+        group_id = cursor.lastrowid
+        groups.replace_members(cursor, group_id, device_ids)
+        coherence.bump(cursor, 'groups')
+        conn.commit()
+        conn.close()
+        groups.membership_index.set(group_id, device_ids)
+        
+        return jsonify({'id': group_id, 'name': data['name'], 'kind': kind, 'device_ids': device_ids}), 201
+    except Exception as e:
+        return jsonify({'error': 'Failed to create group', 'message': str(e)}), 500
+
+@app.route('/api/groups/<int:group_id>/members', methods=['PUT'])
+def set_group_members(group_id):
+    """
+    Replace the member devices of a room or group.
+    
+    Request Body:
+        JSON object with 'device_ids' (list of integers)
+        
+    Returns:
+        JSON object with the group ID and its new members, or 400 if a device ID does not exist.
+    """
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 400
+    
+    data = request.get_json()
+    if data is None or 'device_ids' not in data:
+        return jsonify({'error': 'device_ids is required'}), 400
+    
+    try:
+        device_ids = parse_device_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        if groups.membership_index.get(conn, group_id) is None:
+            conn.close()
+            return jsonify({'error': 'Group not found'}), 404
+        unknown = unknown_devices_response(cursor, device_ids)
+        if unknown:
+            conn.close()
+            return unknown
+        
+        groups.replace_members(cursor, group_id, device_ids)
+        coherence.bump(cursor, 'groups')
+        conn.commit()
+        conn.close()
+        groups.membership_index.set(group_id, device_ids)
+        
+        return jsonify({'id': group_id, 'device_ids': device_ids}), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to update group members', 'message': str(e)}), 500
+
+@app.route('/api/groups/<int:group_id>', methods=['DELETE'])
+def delete_group(group_id):
+    """Delete a room or group (member devices are not affected)."""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM device_groups WHERE id = ?', (group_id,))
+        if cursor.rowcount == 0:
+            conn.close()
+            return jsonify({'error': 'Group not found'}), 404
+        cursor.execute('DELETE FROM group_members WHERE group_id = ?', (group_id,))
+        coherence.bump(cursor, 'groups')
+        conn.commit()
+        conn.close()
+        groups.membership_index.discard(group_id)
+        
+        return jsonify({'message': 'Group deleted'}), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to delete group', 'message': str(e)}), 500
+
+@app.route('/api/groups/<int:group_id>/command', methods=['POST'])
+def group_command(group_id):
+    """
+    Apply one change to every member of a room or group in a single transaction.
+    
+    Args:
+        group_id: Integer group ID
+        
+    Request Body:
+        JSON object with any of 'state', 'value', 'device_mode', 'light_effect'
+        (lights only) and 'ac_mode' (air conditioners only), plus an optional
+        'type' to target only members of that device type
+        
+    Returns:
+        JSON object with the number of devices updated and, when commands are
+        queued, one command ID per updated device.
+    """
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 400
+    
+    data = request.get_json()
+    if data is None:
+        return jsonify({'error': 'Request body is required'}), 400
+    
+    changes = {field: data[field] for field in groups.GROUP_COMMAND_FIELDS if field in data}
+    if not changes:
+        return jsonify({'error': f'At least one of {", ".join(groups.GROUP_COMMAND_FIELDS)} is required'}), 400
+    if 'value' in changes:
+        try:
+            changes['value'] = int(changes['value'])
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Value must be an integer'}), 400
+    if 'light_effect' in changes and changes['light_effect'] not in VALID_LIGHT_EFFECTS:
+        return jsonify({'error': f'Invalid effect. Must be one of: {", ".join(VALID_LIGHT_EFFECTS)}'}), 400
+    if 'ac_mode' in changes and changes['ac_mode'] not in VALID_AC_MODES:
+        return jsonify({'error': f'Invalid mode. Must be one of: {", ".join(VALID_AC_MODES)}'}), 400
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        device_ids = groups.membership_index.get(conn, group_id)
+        if device_ids is None:
+            conn.close()
+            return jsonify({'error': 'Group not found'}), 404
+        
+        if data.get('type'):
+            device_ids = groups.filter_members_by_type(cursor, device_ids, data['type'])
+        updated = groups.apply_group_command(cursor, device_ids, changes)
+        hot_readings.discard([device_id for device_id, _ in updated],
+                             [field for field in changes if field in hot_tier.FIELDS])
+        commands = queue_device_commands(cursor, [(device_id, 'group_command', applied)
+                                                  for device_id, applied in updated])
+        conn.commit()
+        conn.close()
+        command_dispatcher.submit(commands)
+        
+        response = {'message': 'Group command applied', 'group_id': group_id, 'updated': len(updated)}
+        if commands:
+            response['command_ids'] = [command.id for command in commands]
+            return jsonify(response), 202
+        return jsonify(response), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to apply group command', 'message': str(e)}), 500
+
+# Command Status API
+@app.route('/api/commands/<int:command_id>', methods=['GET'])
+def get_command(command_id):
+    """
+    Get delivery status of a queued device command.
+    
+    Args:
+        command_id: Integer command ID returned by a mutation route
+        
+    Returns:
+        JSON object with status (queued, retrying, acknowledged, failed), attempts and last error.
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM device_commands WHERE id = ?', (command_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row is None:
+            return jsonify({'error': 'Command not found'}), 404
+        
+        return jsonify({
+            'id': row['id'],
+            'device_id': row['device_id'],
+            'action': row['action'],
+            'payload': json.loads(row['payload']),
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'last_error': row['last_error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch command', 'message': str(e)}), 500
+
 # Schedules API
 @app.route('/api/schedules', methods=['GET'])
 def get_schedules():
@@ -712,43 +1319,438 @@ def get_energy_data():
     """Get energy consumption data."""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        energy = fetch_energy_summary(conn.cursor())
+        conn.close()
+        return jsonify(energy), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch energy data', 'message': str(e)}), 500
+
+# Other homes' databases for multi-home energy reports: ENERGY_HOMES="cabin=/data/cabin.db,..."
+ENERGY_HOMES = {}
+for home_entry in filter(None, os.environ.get('ENERGY_HOMES', '').split(',')):
+    home_name, _, home_path = home_entry.partition('=')
+    if home_name.strip() and home_path.strip():
+        ENERGY_HOMES[home_name.strip()] = os.path.abspath(home_path.strip())
+    else:
+        print(f"Warning: ignoring ENERGY_HOMES entry {home_entry!r}. Use name=path.")
+
+def parse_report_time(name):
+    """
+    Parse an ISO 8601 report bound into energy_logs' UTC 'YYYY-MM-DD HH:MM:SS' format.
+
+    Returns None when the parameter is absent; raises ValueError when it is invalid.
+    """
+    text = request.args.get(name)
+    if not text:
+        return None
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or time, e.g. 2024-01-31 or 2024-01-31 18:00:00")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+@app.route('/api/energy/report', methods=['GET'])
+def get_energy_report():
+    """
+    Get an energy cost report over a range of energy_logs.
+    
+    Query Parameters:
+        start: Optional inclusive start time (ISO 8601, UTC unless an offset is given)
+        end: Optional exclusive end time (ISO 8601, UTC unless an offset is given)
+        device_id: Optional comma-separated list of device IDs
+        tariff: Optional JSON list of time-of-use periods
+                ({'name', 'start_hour', 'end_hour', 'rate'})
+        homes: Optional comma-separated ENERGY_HOMES names, or 'all', to report on
+               those homes instead (built in parallel worker processes)
         
-        # Get current power consumption for all devices
-        cursor.execute('''
-            SELECT d.id, d.name, d.power_consumption, d.state
-            FROM devices d
-            WHERE d.power_consumption IS NOT NULL
-        ''')
+    Returns:
+        JSON object with summary, tariff period and per-device breakdowns, or with
+        per-home reports and totals when homes is given. 400 for invalid parameters.
+    """
+    if not energy_analytics.NUMPY_AVAILABLE:
+        return jsonify({'error': 'Energy reports require numpy'}), 503
+    
+    try:
+        try:
+            start = parse_report_time('start')
+            end = parse_report_time('end')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if start and end and start > end:
+            return jsonify({'error': 'start must not be after end'}), 400
+        
+        device_ids = None
+        if request.args.get('device_id'):
+            try:
+                device_ids = [int(d) for d in request.args['device_id'].split(',') if d.strip()]
+            except ValueError:
+                return jsonify({'error': 'device_id must be a comma-separated list of integers'}), 400
         
-        devices = []
-        total_power = 0.0
-        for row in cursor.fetchall():
-            power = row['power_consumption'] if row['state'] == 'on' else 0.0
-            devices.append({
-                'id': row['id'],
-                'name': row['name'],
-                'power': power,
-                'state': row['state']
-            })
-            total_power += power
+        tariff = None
+        if request.args.get('tariff'):
+            try:
+                tariff = json.loads(request.args['tariff'])
+            except ValueError:
+                return jsonify({'error': 'tariff must be valid JSON'}), 400
+        
+        if request.args.get('homes'):
+            names = request.args['homes'].split(',')
+            if names == ['all']:
+                names = list(ENERGY_HOMES)
+            unknown = [name for name in names if name not in ENERGY_HOMES]
+            if unknown or not names:
+                return jsonify({'error': 'Unknown homes', 'unknown': unknown,
+                                'homes': sorted(ENERGY_HOMES)}), 400
+            report = energy_analytics.build_multi_home_report(
+                {name: ENERGY_HOMES[name] for name in names},
+                start=start, end=end, device_ids=device_ids, tariff=tariff
+            )
+            return jsonify(report), 200
+        
+        report = energy_analytics.build_energy_report(
+            DATABASE,
+            start=start,
+            end=end,
+            device_ids=device_ids,
+            tariff=tariff
+        )
+        return jsonify(report), 200
+    except ValueError as e:
+        return jsonify({'error': 'Invalid report parameters', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to build energy report', 'message': str(e)}), 500
+
+# Bulk Export/Import API
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """
+    Stream a table as NDJSON or CSV.
+    
+    Args:
+        table: devices, scenes, schedules or energy_logs
+        
+    Query Parameters:
+        format: 'ndjson' (default) or 'csv'
+        
+    Returns:
+        Chunked response body; memory use is independent of table size.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if table not in bulk_transfer.TRANSFER_TABLES:
+        return jsonify({'error': 'Unknown table'}), 404
+    if fmt not in bulk_transfer.TRANSFER_FORMATS:
+        return jsonify({'error': f'Invalid format. Must be one of: {", ".join(bulk_transfer.TRANSFER_FORMATS)}'}), 400
+    
+    chunks = bulk_transfer.iter_export(DATABASE, table, fmt)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=bulk_transfer.TRANSFER_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'}
+    )
+
+@app.route('/api/import/<table>', methods=['POST'])
+def import_table(table):
+    """
+    Bulk import NDJSON or CSV rows into a table.
+    
+    Args:
+        table: devices, scenes, schedules or energy_logs
+        
+    Query Parameters:
+        format: 'ndjson' (default) or 'csv'
+        mode: 'replace' (default, overwrite rows with the same id) or 'insert'
         
-        # Get daily energy usage (last 24 hours)
-        cursor.execute('''
-            SELECT SUM(power_consumption) as total_energy
-            FROM energy_logs
-            WHERE timestamp >= datetime('now', '-24 hours')
-        ''')
-        daily_energy = cursor.fetchone()['total_energy'] or 0.0
+    Request Body:
+        NDJSON objects or CSV with a header row, streamed into batched transactions
         
+    Returns:
+        JSON object with imported row and transaction counts.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    mode = request.args.get('mode', 'replace')
+    if table not in bulk_transfer.TRANSFER_TABLES:
+        return jsonify({'error': 'Unknown table'}), 404
+    if fmt not in bulk_transfer.TRANSFER_FORMATS:
+        return jsonify({'error': f'Invalid format. Must be one of: {", ".join(bulk_transfer.TRANSFER_FORMATS)}'}), 400
+    if mode not in ('replace', 'insert'):
+        return jsonify({'error': 'Invalid mode. Must be one of: replace, insert'}), 400
+    
+    try:
+        if fmt == 'csv':
+            rows = bulk_transfer.iter_csv_rows(request.stream)
+        else:
+            rows = bulk_transfer.iter_ndjson_rows(request.stream)
+        result = bulk_transfer.import_rows(DATABASE, table, rows, replace=(mode == 'replace'))
+        if table == 'devices':
+            # Imported rows replace whatever readings the hot tier held
+            hot_readings.discard_all()
+        return jsonify({'message': 'Import complete', 'table': table, **result}), 200
+    except ValueError as e:
+        return jsonify({'error': 'Import failed', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to import data', 'message': str(e)}), 500
+
+# Anomaly Alerts API
+anomaly_detector = anomaly.AnomalyDetector(get_db_connection)
+
+@app.route('/api/anomalies', methods=['GET'])
+def get_anomalies():
+    """
+    Get anomaly alerts, newest first.
+    
+    Query Parameters:
+        device_id: Only alerts for this device
+        field: temperature, power or battery
+        kind: spike, dip, rapid_rise, rapid_drop or stuck
+        since: Only alerts raised after this Unix time
+        acknowledged: 0 for open alerts only, 1 for acknowledged only
+        limit: Maximum alerts to return (default 100, 1-1000)
+    
+    Returns:
+        JSON array of alerts with device_id, field, kind, value, expected, score,
+        message, created_at (Unix time) and acknowledged
+    """
+    try:
+        query = 'SELECT * FROM anomaly_alerts WHERE 1 = 1'
+        params = []
+        try:
+            if request.args.get('device_id'):
+                query += ' AND device_id = ?'
+                params.append(int(request.args['device_id']))
+            if request.args.get('since'):
+                query += ' AND created_at > ?'
+                params.append(float(request.args['since']))
+            if request.args.get('acknowledged') in ('0', '1'):
+                query += ' AND acknowledged = ?'
+                params.append(int(request.args['acknowledged']))
+            limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+        except ValueError:
+            return jsonify({'error': 'device_id, since and limit must be numbers'}), 400
+        for name, allowed in (('field', anomaly.RULES), ('kind', anomaly.KINDS)):
+            if request.args.get(name):
+                if request.args[name] not in allowed:
+                    return jsonify({'error': f"{name} must be one of {', '.join(allowed)}"}), 400
+                query += f' AND {name} = ?'
+                params.append(request.args[name])
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+        
+        conn = get_db_connection()
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        
+        alerts = []
+        for row in rows:
+            alert = dict(row)
+            alert['acknowledged'] = bool(alert['acknowledged'])
+            alert['message'] = anomaly.describe(row['field'], row['kind'], row['value'], row['expected'])
+            alerts.append(alert)
+        return jsonify(alerts), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch anomaly alerts', 'message': str(e)}), 500
+
+@app.route('/api/anomalies/<int:alert_id>/acknowledge', methods=['POST'])
+def acknowledge_anomaly(alert_id):
+    """
+    Mark an anomaly alert as acknowledged.
+    
+    Args:
+        alert_id: Integer alert ID
+    
+    Returns:
+        JSON object with the alert ID and acknowledged flag, or 404 if not found
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.execute('UPDATE anomaly_alerts SET acknowledged = 1 WHERE id = ?', (alert_id,))
+        conn.commit()
+        conn.close()
+        if cursor.rowcount == 0:
+            return jsonify({'error': 'Alert not found'}), 404
+        return jsonify({'id': alert_id, 'acknowledged': True}), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to acknowledge alert', 'message': str(e)}), 500
+
+@app.route('/api/anomalies/status', methods=['GET'])
+def get_anomaly_detector_status():
+    """
+    Get the anomaly detector's rules and counters.
+    
+    Returns:
+        JSON object with tracked devices, state memory, readings and alerts processed
+        and the last startup backfill. Detection runs in the worker that owns background
+        jobs; other workers report running: false.
+    """
+    return jsonify(anomaly_detector.status()), 200
+
+@app.route('/api/hot-tier/status', methods=['GET'])
+def get_hot_tier_status():
+    """
+    Get the sensor reading hot tier's size and checkpoint counters.
+
+    Returns:
+        JSON object with enabled, file path, slot capacity, devices holding readings,
+        and checkpoint count, rows written and the last checkpoint's time and duration.
+        Checkpoints run in the worker that owns background jobs, which also reports
+        pending (slots written since the last checkpoint).
+    """
+    return jsonify(hot_readings.status()), 200
+
+@app.route('/api/replication', methods=['GET'])
+def get_replication_status():
+    """
+    Get replication status.
+    
+    Returns:
+        On a primary: the latest change-log sequence number and the oldest one kept.
+        On a standby: applied and primary sequence numbers and energy_logs ids,
+        pending entries, lag_seconds (age of the oldest unapplied change) and apply delays.
+    """
+    try:
+        if standby is not None and not standby.promoted:
+            return jsonify(standby.status()), 200
+        conn = get_db_connection()
+        oldest = conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+        seq = replication.latest_seq(conn)
         conn.close()
         return jsonify({
-            'devices': devices,
-            'total_power': total_power,
-            'daily_energy': daily_energy
+            'role': 'primary',
+            'seq': seq,
+            'oldest_seq': oldest,
+            'retention': replication.CHANGE_LOG_RETENTION
         }), 200
     except Exception as e:
-        return jsonify({'error': 'Failed to fetch energy data', 'message': str(e)}), 500
+        return jsonify({'error': 'Failed to fetch replication status', 'message': str(e)}), 500
+
+@app.route('/api/replication/promote', methods=['POST'])
+def promote_standby():
+    """
+    Promote this standby to primary after the primary has failed.
+    
+    Replication stops, this copy starts capturing its own changes, writes are
+    accepted, and background jobs start in the worker that owns them.
+    
+    Returns:
+        JSON status of the promoted instance, or 409 if this is not a standby
+    """
+    if standby is None or standby.promoted:
+        return jsonify({'error': 'Not a standby'}), 409
+    try:
+        standby.promote()
+        # Tell the other worker processes of this instance
+        conn = get_db_connection()
+        coherence.bump(conn.cursor(), 'replication')
+        conn.commit()
+        conn.close()
+        handle_promotion()
+        return jsonify(standby.status()), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to promote standby', 'message': str(e)}), 500
+
+backup_scheduler = backup.BackupScheduler(DATABASE, BACKUP_DIR, interval=BACKUP_INTERVAL, keep=BACKUP_KEEP)
+
+@app.route('/api/backups', methods=['GET'])
+def get_backups():
+    """
+    Get backup status and the available backups.
+    
+    Returns:
+        JSON object with the schedule, the last backup's duration, steps, restarts
+        and longest step (max_step_ms, the longest writers could be blocked),
+        and the backups on disk, newest first
+    """
+    try:
+        return jsonify(backup_scheduler.status()), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch backups', 'message': str(e)}), 500
+
+@app.route('/api/backups', methods=['POST'])
+@admin_required
+def create_backup():
+    """
+    Start an online backup now, then rotate old ones, on the backup scheduler.
+    
+    Returns:
+        202 with a status URL; the result appears as last_backup in GET /api/backups
+    """
+    try:
+        queued = backup_scheduler.request_backup()
+        message = 'Backup started' if queued else 'A backup is already pending'
+        return jsonify({'message': message, 'status_url': '/api/backups'}), 202
+    except Exception as e:
+        return jsonify({'error': 'Backup failed', 'message': str(e)}), 500
+
+@app.route('/api/admin/profile', methods=['GET'])
+@admin_required
+def profile_worker():
+    """
+    Sample the stacks of every thread in this worker for a few seconds.
+    
+    Query Parameters:
+        seconds: How long to sample (default 5, max 60)
+        interval: Milliseconds between samples (default 5, min 1)
+        format: speedscope (default), collapsed or summary
+    
+    Returns:
+        Speedscope JSON, collapsed stacks as text, or a JSON summary of samples per
+        thread; 409 if a profile is already running in this worker
+    """
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval = float(request.args.get('interval', profiler.DEFAULT_INTERVAL * 1000)) / 1000
+    except ValueError:
+        return jsonify({'error': 'seconds and interval must be numbers'}), 400
+    fmt = request.args.get('format', 'speedscope')
+    if fmt not in PROFILE_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(PROFILE_FORMATS)}"}), 400
+    if not 0 < seconds <= profiler.MAX_SECONDS:
+        return jsonify({'error': f'seconds must be between 0 and {profiler.MAX_SECONDS}'}), 400
+    if not process_profile_lock.acquire(blocking=False):
+        return jsonify({'error': 'A profile is already running'}), 409
+    try:
+        profile = profiler.profile_process(seconds, interval)
+        return profile_response(profile, fmt, f'pid {os.getpid()}, {seconds:g}s')
+    except Exception as e:
+        return jsonify({'error': 'Profiling failed', 'message': str(e)}), 500
+    finally:
+        process_profile_lock.release()
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def get_request_profiles():
+    """
+    List the most recent per-request profiles (requests sent with X-Profile: 1).
+    
+    Returns:
+        JSON array of profile ids, requests, durations and samples per thread, newest first
+    """
+    return jsonify(request_profiles.list()), 200
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_request_profile(profile_id):
+    """
+    Get one per-request profile.
+    
+    Args:
+        profile_id: Value of the X-Profile-Id response header
+    
+    Query Parameters:
+        format: speedscope (default), collapsed or summary
+    
+    Returns:
+        The profile in the requested format, or 404 if it has been evicted
+    """
+    entry = request_profiles.get(profile_id)
+    if entry is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    fmt = request.args.get('format', 'speedscope')
+    if fmt not in PROFILE_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(PROFILE_FORMATS)}"}), 400
+    label, _, profile = entry
+    return profile_response(profile, fmt, label)
 
 def update_temperature_sensor():
     """Background thread function to simulate real-time temperature updates."""
@@ -761,15 +1763,22 @@ def update_temperature_sensor():
             cursor.execute('SELECT value FROM devices WHERE id = 3 AND type = ?', ('sensor',))
             row = cursor.fetchone()
             
-            if row and row['value'] is not None:
-                current_temp = row['value']
+            readings = hot_readings.read(3) if row else None
+            if readings and 'value' in readings:
+                current_temp = readings['value']
+            else:
+                current_temp = row['value'] if row else None
+            
+            if current_temp is not None:
                 # Randomly vary temperature by ±1°C
                 variation = random.randint(-1, 1)
                 new_temp = current_temp + variation
                 
-                # Update temperature in database
-                cursor.execute('UPDATE devices SET value = ? WHERE id = 3', (new_temp,))
-                conn.commit()
+                # Update the hot tier, which is checkpointed to the database;
+                # write the database directly when the hot tier is off
+                if not hot_readings.write(3, {'value': new_temp}):
+                    cursor.execute('UPDATE devices SET value = ? WHERE id = 3', (new_temp,))
+                    conn.commit()
                 print(f"Temperature updated: {current_temp}°C -> {new_temp}°C")
             
             conn.close()
@@ -785,9 +1794,93 @@ def start_temperature_thread():
     temperature_thread.start()
     print("Temperature sensor background thread started")
 
-# Start the background thread when the app initializes (only if not in Vercel)
-if not os.environ.get('VERCEL'):
+def start_command_dispatcher():
+    """Start the worker pool that delivers commands to physical devices."""
+    try:
+        command_dispatcher.start()
+        print("Command dispatcher started")
+    except Exception as e:
+        print(f"Warning: Command dispatcher failed to start: {e}")
+
+def start_backup_scheduler():
+    """Start periodic online backups of the database."""
+    try:
+        backup_scheduler.start()
+        print(f"Backup scheduler started (every {BACKUP_INTERVAL}s to {BACKUP_DIR})")
+    except Exception as e:
+        print(f"Warning: Backup scheduler failed to start: {e}")
+
+def start_change_log_pruner():
+    """Start trimming change-log entries older than the retention window."""
+    try:
+        replication.start_pruner(get_db_connection)
+        print("Change log pruner started")
+    except Exception as e:
+        print(f"Warning: Change log pruner failed to start: {e}")
+
+def start_anomaly_detector():
+    """Start evaluating new sensor, power and battery readings for anomalies."""
+    try:
+        anomaly_detector.start()
+        print("Anomaly detector started")
+    except Exception as e:
+        print(f"Warning: Anomaly detector failed to start: {e}")
+
+def start_hot_tier_checkpoint():
+    """Start checkpointing hot tier readings to the database."""
+    if not hot_readings.enabled:
+        return
+    try:
+        hot_readings.start()
+        print(f"Hot tier checkpoint started (every {HOT_TIER_INTERVAL}s from {HOT_TIER_PATH})")
+    except Exception as e:
+        print(f"Warning: Hot tier checkpoint failed to start: {e}")
+
+def start_background_jobs():
+    """Start jobs that must run in exactly one worker process."""
+    start_hot_tier_checkpoint()
     start_temperature_thread()
+    start_command_dispatcher()
+    start_backup_scheduler()
+    start_change_log_pruner()
+    start_anomaly_detector()
+
+def start_owned_jobs():
+    """Run in the worker that owns background jobs: tail the primary on a standby, else run the jobs."""
+    if standby is not None and not standby.promoted:
+        standby.start()
+    else:
+        start_background_jobs()
+
+promotion_lock = threading.Lock()
+promotion_handled = False
+
+def handle_promotion():
+    """Switch every worker of a promoted standby to primary duties."""
+    global promotion_handled
+    with promotion_lock:
+        if standby is None or promotion_handled:
+            return
+        promotion_handled = True
+    standby.stop()
+    standby.promoted = True
+    # The worker that was tailing the primary owns background jobs
+    if leader_election.is_leader:
+        start_background_jobs()
+    print("Standby promoted to primary")
+
+if standby is not None:
+    change_bus.subscribe('replication', handle_promotion)
+
+# Start the background workers when the app initializes (only if not in Vercel).
+# BACKGROUND_JOBS=0 skips them, e.g. for benchmarks that import the app.
+if not os.environ.get('VERCEL') and os.environ.get('BACKGROUND_JOBS', '1') != '0':
+    change_bus.start()
+    try:
+        leader_election.start(start_owned_jobs)
+    except Exception as e:
+        print(f"Warning: Leader election failed, starting background jobs here: {e}")
+        start_owned_jobs()
 
 # Catch-all route for SPA - must be after all other routes
 @app.route('/<path:path>')
@@ -796,7 +1889,7 @@ def catch_all(path):
     if path.startswith('api/'):
         return jsonify({'error': 'Not found'}), 404
     # For everything else (non-API), serve the index page
-    return render_template('index.html')
+    return render_index()
 
 # Export app for Vercel
 if __name__ == '__main__':
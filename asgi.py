@@ -0,0 +1,193 @@
+"""
+ASGI Serving Mode
+Serves the dashboard routes from an asyncio event loop for high-concurrency deployments
+
+Connections are held by the event loop instead of worker threads, so idle keep-alive
+connections and clients that are slow to read a response cost only a coroutine each.
+The routes themselves are still blocking WSGI code: a request holds one thread of a
+bounded pool while its route runs (including while it reads the request body), and a
+streamed export takes one thread hop per chunk. The pool size therefore caps how many
+routes run at once; there are no native async handlers. A streamed response stops as
+soon as the client disconnects.
+
+Run with:
+    pip install -r requirements.txt
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+# Threads available for blocking route work; requests beyond this wait on the event loop
+EXECUTOR_WORKERS = int(os.environ.get('ASGI_EXECUTOR_WORKERS', '32'))
+
+# Marks the end of a response body iterator
+_END = object()
+
+
+class ReceiveStream(io.RawIOBase):
+    """
+    File-like wsgi.input that pulls the request body from the ASGI receive channel.
+
+    Reads happen on executor threads and block only that thread while the event
+    loop awaits the next body message, so large uploads are never buffered whole.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                break
+            self._buffer = message.get('body', b'')
+            self._more = message.get('more_body', False)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BufferedReader(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ):
+    """
+    Call the WSGI app and pull the start of its body (runs on an executor thread).
+
+    Up to two chunks are read so a regular single-chunk response is finished and
+    closed in one executor hop; only streaming responses need further hops.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    result = wsgi_app(environ, start_response)
+    iterator = iter(result)
+    chunks = []
+    finished = False
+    for _ in range(2):
+        chunk = next(iterator, _END)
+        if chunk is _END:
+            finished = True
+            break
+        chunks.append(chunk)
+    if finished and hasattr(result, 'close'):
+        result.close()
+    return response, result, iterator, chunks, finished
+
+
+class ASGIApp:
+    """ASGI application serving a Flask app with async handlers and a bounded executor."""
+
+    def __init__(self, wsgi_app, max_workers=EXECUTOR_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, ReceiveStream(receive, loop))
+
+        response, result, iterator, chunks, finished = await loop.run_in_executor(
+            self.executor, run_wsgi, self.wsgi_app, environ
+        )
+        disconnected = asyncio.Event()
+        watcher = None if finished else asyncio.ensure_future(self.watch_disconnect(receive, disconnected))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response['status'],
+                'headers': response['headers']
+            })
+            if finished:
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': False})
+                return
+            for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            # Streaming responses (exports) produce further chunks with blocking reads
+            while not disconnected.is_set():
+                chunk = await loop.run_in_executor(self.executor, next, iterator, _END)
+                if chunk is _END:
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    break
+                if chunk and not disconnected.is_set():
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if not finished:
+                watcher.cancel()
+                # Closing the iterator ends the export's query on a disconnect
+                if hasattr(result, 'close'):
+                    await loop.run_in_executor(self.executor, result.close)
+
+    async def watch_disconnect(self, receive, disconnected):
+        """Set `disconnected` when the client goes away while a response is streaming."""
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+
+app = ASGIApp(flask_app)
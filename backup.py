@@ -0,0 +1,244 @@
+"""
+Online Backups
+Consistent copies of the live database with SQLite's online backup API
+
+A backup copies the database a few pages at a time and pauses between steps. In WAL
+mode (the app's default) the copy runs inside one read transaction: it sees a single
+consistent snapshot and never blocks writers. In rollback-journal mode a writer is
+only blocked for one small step, but every commit by another connection restarts the
+copy from the first page; after MAX_RESTARTS the copy is redone in a single step.
+Each backup is written to a temporary file and renamed into place, so a backup file
+is never torn.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+# Pages copied per step (4 KB pages: 64 pages = 256 KB) and seconds paused between steps
+BACKUP_STEP_PAGES = 64
+BACKUP_STEP_SLEEP = 0.005
+# Restarts caused by concurrent commits before the rest is copied in one step
+MAX_RESTARTS = 5
+
+# Default schedule: hourly, keeping the newest day of backups
+BACKUP_INTERVAL = 3600
+BACKUP_KEEP = 24
+
+BACKUP_PREFIX = 'devices-'
+BACKUP_SUFFIX = '.db'
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abort a stepped copy."""
+
+
+def list_backups(backup_dir):
+    """Return backup file paths, newest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [name for name in os.listdir(backup_dir)
+             if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)]
+    # Names embed a UTC timestamp, so they sort chronologically
+    return [os.path.join(backup_dir, name) for name in sorted(names, reverse=True)]
+
+
+def run_backup(database, backup_dir, step_pages=BACKUP_STEP_PAGES, step_sleep=BACKUP_STEP_SLEEP):
+    """
+    Copy the live database into a new timestamped file in backup_dir.
+
+    Returns a dict with the backup path, size, duration, number of steps and
+    restarts, and the longest step (the longest time writers could be blocked).
+    single_step is true when concurrent commits forced a one-step copy.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    path = os.path.join(backup_dir, f'{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}')
+    partial = path + '.partial'
+
+    stats = {'steps': 0, 'restarts': 0, 'max_step_ms': 0.0, 'single_step': False}
+    state = {'remaining': None, 'step_started': None}
+
+    def progress(status, remaining, total):
+        now = time.perf_counter()
+        stats['max_step_ms'] = max(stats['max_step_ms'], (now - state['step_started']) * 1000)
+        stats['steps'] += 1
+        # A step that copied pages without reducing what remains started over
+        if status == sqlite3.SQLITE_OK and state['remaining'] is not None and remaining >= state['remaining']:
+            stats['restarts'] += 1
+            if stats['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        if remaining and step_sleep:
+            # Let writers (and other threads) in between steps
+            time.sleep(step_sleep)
+        state['step_started'] = time.perf_counter()
+
+    started = time.perf_counter()
+    source = sqlite3.connect(database, isolation_level=None)
+    target = sqlite3.connect(partial)
+    try:
+        stats['journal_mode'] = source.execute('PRAGMA journal_mode').fetchone()[0]
+        if stats['journal_mode'] == 'wal':
+            # Pin one snapshot for the whole copy; WAL readers do not block writers
+            source.execute('BEGIN')
+            source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        state['step_started'] = time.perf_counter()
+        try:
+            source.backup(target, pages=step_pages, progress=progress)
+        except _TooManyRestarts:
+            # Writers kept restarting the copy; finish it in one step
+            stats['single_step'] = True
+            step_started = time.perf_counter()
+            source.backup(target, pages=-1)
+            stats['max_step_ms'] = max(stats['max_step_ms'], (time.perf_counter() - step_started) * 1000)
+        if source.in_transaction:
+            source.execute('COMMIT')
+    except Exception:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        target.close()
+        source.close()
+
+    os.replace(partial, path)
+    stats.update(
+        path=path,
+        size=os.path.getsize(path),
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+        max_step_ms=round(stats['max_step_ms'], 2),
+        finished_at=datetime.now(timezone.utc).isoformat()
+    )
+    return stats
+
+
+def rotate_backups(backup_dir, keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` backups; returns the deleted paths."""
+    stale = list_backups(backup_dir)[keep:]
+    for path in stale:
+        os.remove(path)
+    return stale
+
+
+def is_valid_backup(path):
+    """Check that a backup file is a readable, uncorrupted SQLite database with devices."""
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            if conn.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+                return False
+            conn.execute('SELECT COUNT(*) FROM devices').fetchone()
+            return True
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return False
+
+
+def restore_latest(database, backup_dir):
+    """
+    Restore the newest valid backup to database, which must not exist yet.
+
+    Returns the backup path used, or None when there is no usable backup.
+    """
+    for path in list_backups(backup_dir):
+        if not is_valid_backup(path):
+            print(f"Warning: skipping unreadable backup {path}")
+            continue
+        partial = database + '.restoring'
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(partial)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        os.replace(partial, database)
+        return path
+    return None
+
+
+class BackupScheduler:
+    """Runs backups on an interval in a background thread and keeps the latest results."""
+
+    def __init__(self, database, backup_dir, interval=BACKUP_INTERVAL, keep=BACKUP_KEEP):
+        self.database = database
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self.running = False
+        self.last_backup = None
+        self.last_error = None
+        self.backups_taken = 0
+        self._lock = threading.Lock()
+        # Set to run a requested backup ahead of the schedule
+        self._wake = threading.Event()
+        self.pending = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._take_backup()
+
+    def _take_backup(self):
+        self.pending = False
+        try:
+            self.backup_now()
+        except Exception as e:
+            print(f"Error running scheduled backup: {e}")
+
+    def request_backup(self):
+        """
+        Run a backup in the background as soon as possible; returns False if one is already pending.
+
+        The scheduler thread takes it when this process runs the schedule; otherwise a
+        one-off thread does.
+        """
+        if self.pending:
+            return False
+        self.pending = True
+        if self.running:
+            self._wake.set()
+        else:
+            threading.Thread(target=self._take_backup, daemon=True).start()
+        return True
+
+    def backup_now(self):
+        """Take one backup and rotate old ones; only one backup runs at a time."""
+        with self._lock:
+            try:
+                stats = run_backup(self.database, self.backup_dir)
+                stats['rotated'] = len(rotate_backups(self.backup_dir, self.keep))
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.last_backup = stats
+            self.last_error = None
+            self.backups_taken += 1
+            return stats
+
+    def status(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'keep': self.keep,
+            'backup_dir': self.backup_dir,
+            'backups_taken': self.backups_taken,
+            'pending': self.pending,
+            'last_backup': self.last_backup,
+            'last_error': self.last_error,
+            'backups': [
+                {'name': os.path.basename(path), 'size': os.path.getsize(path)}
+                for path in list_backups(self.backup_dir)
+            ]
+        }
@@ -0,0 +1,172 @@
+"""
+ASGI vs Threaded Flask Benchmark
+Runs both servers side by side and measures throughput, latency and idle-connection cost
+
+Each server is started in a subprocess. The client first opens --idle connections and
+keeps them open (as idle dashboards on keep-alive connections would), then drives --concurrency
+keep-alive clients against /api/devices while reporting request rate, latency
+percentiles, and the server's thread count and resident memory.
+
+Usage:
+    pip install -r requirements.txt
+    python benchmarks/bench_asgi_vs_flask.py --idle 10000 --concurrency 200 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'flask-threaded': [sys.executable, '-c',
+                       'import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--log-level', 'warning', '--port']
+}
+
+
+def process_stats(pid):
+    """Return (threads, resident MB) of a process from /proc."""
+    threads = rss = 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return threads, rss
+
+
+async def request(reader, writer, path):
+    """Send one GET and read the full response; returns (status, whether the connection stays open)."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    length = 0
+    keep_alive = True
+    for line in lines[1:]:
+        lower = line.lower()
+        if lower.startswith('content-length:'):
+            length = int(line.split(':', 1)[1])
+        elif lower.startswith('connection:') and 'close' in lower:
+            keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def wait_for_server(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await request(reader, writer, '/health')
+            writer.close()
+            return
+        except (OSError, asyncio.IncompleteReadError):
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+async def open_idle(port, count):
+    """Open idle connections with a partial request pending; returns those that connected."""
+    connections = []
+    for _ in range(count):
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 2)
+        except (OSError, asyncio.TimeoutError):
+            break
+        writer.write(b'GET /api/devices HTTP/1.1\r\nHost: localhost\r\n')
+        connections.append(writer)
+    return connections
+
+
+async def drive(port, path, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client():
+        nonlocal errors
+        reader = writer = None
+        while time.monotonic() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                started = time.perf_counter()
+                status, keep_alive = await asyncio.wait_for(request(reader, writer, path), 30)
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+                if not keep_alive:
+                    # Threaded Flask closes after every response
+                    writer.close()
+                    reader = writer = None
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def bench_server(name, port, args):
+    # Load comes from one address, so admission control is turned off
+    process = subprocess.Popen(SERVERS[name] + [str(port)], cwd=ROOT,
+                               env=dict(os.environ, RATE_LIMIT_ENABLED='0'),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_server(port)
+        idle = await open_idle(port, args.idle)
+        await asyncio.sleep(1)
+        threads, rss = process_stats(process.pid)
+
+        latencies, errors = await drive(port, args.path, args.concurrency, args.duration)
+        latencies.sort()
+        count = len(latencies)
+        print(f"\n{name}")
+        print(f"  idle connections held: {len(idle):,} (threads {threads}, RSS {rss:.0f} MB)")
+        if count:
+            print(f"  requests/s: {count / args.duration:,.0f}  errors: {errors}")
+            print(f"  latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+                  f"p99 {latencies[int(count * 0.99) - 1] * 1000:.1f} ms")
+        else:
+            print(f"  no successful requests ({errors} errors)")
+        for writer in idle:
+            writer.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare the ASGI serving mode with threaded Flask')
+    parser.add_argument('--idle', type=int, default=10000, help='Idle connections held open')
+    parser.add_argument('--concurrency', type=int, default=200, help='Active keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server')
+    parser.add_argument('--path', default='/api/devices', help='Path requested by active clients')
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    for offset, name in enumerate(args.servers):
+        await bench_server(name, 8600 + offset, args)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
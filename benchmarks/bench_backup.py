@@ -0,0 +1,112 @@
+"""
+Online Backup Benchmark
+Measures backup duration and how much a running backup stalls concurrent writers
+
+Builds a scratch database with --rows energy_logs rows, then runs a writer thread
+that commits one small device update at a time. Writer commit latency is recorded
+without a backup and while backups run back to back, for the stepped online copy
+and for a single-step copy (what a plain file copy under a lock would cost).
+
+Usage:
+    python benchmarks/bench_backup.py --rows 2000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+
+
+def create_database(path, rows, journal_mode):
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    conn.execute('CREATE TABLE devices (id INTEGER PRIMARY KEY, value INTEGER)')
+    conn.execute('CREATE TABLE energy_logs (id INTEGER PRIMARY KEY, device_id INTEGER, '
+                 'power_consumption REAL, timestamp TIMESTAMP)')
+    conn.executemany('INSERT INTO devices (id, value) VALUES (?, 0)', ((i,) for i in range(1, 101)))
+    conn.executemany(
+        "INSERT INTO energy_logs (device_id, power_consumption, timestamp) VALUES (?, ?, '2024-01-01 00:00:00')",
+        ((i % 100 + 1, float(i % 500)) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+def measure_writes(database, duration, during=None):
+    """Commit small updates for `duration` seconds while `during` runs; returns commit latencies."""
+    latencies = []
+    stop = threading.Event()
+
+    def writer():
+        conn = sqlite3.connect(database, timeout=30)
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            conn.execute('UPDATE devices SET value = ? WHERE id = ?', (i, i % 100 + 1))
+            conn.commit()
+            latencies.append(time.perf_counter() - started)
+            i += 1
+            time.sleep(0.001)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    results = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if during:
+            results.append(during())
+        else:
+            time.sleep(0.05)
+    stop.set()
+    thread.join()
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark online backups')
+    parser.add_argument('--rows', type=int, default=2_000_000, help='energy_logs rows in the scratch database')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per measurement')
+    parser.add_argument('--journal-mode', default='wal', choices=['wal', 'delete'],
+                        help='SQLite journal mode (the app uses WAL)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'devices.db')
+        backup_dir = os.path.join(tmp, 'backups')
+        create_database(database, args.rows, args.journal_mode)
+        print(f"Database: {os.path.getsize(database) / 1e6:.1f} MB ({args.rows:,} energy_logs rows, "
+              f"journal mode {args.journal_mode})")
+
+        modes = [
+            ('no backup', None),
+            ('online, stepped', lambda: backup.run_backup(database, backup_dir)),
+            ('single step', lambda: backup.run_backup(database, backup_dir, step_pages=-1, step_sleep=0))
+        ]
+        for name, during in modes:
+            latencies, results = measure_writes(database, args.duration, during)
+            backup.rotate_backups(backup_dir, keep=1)
+            print(f"\n{name}")
+            print(f"  writer commits: {len(latencies):,}  p50 {percentile(latencies, 0.5):.2f} ms  "
+                  f"p99 {percentile(latencies, 0.99):.2f} ms  max {percentile(latencies, 1):.2f} ms")
+            if results:
+                last = results[-1]
+                print(f"  backups: {len(results)}  last took {last['duration_ms']:.0f} ms in {last['steps']} steps, "
+                      f"{last['restarts']} restarts, longest step {last['max_step_ms']:.2f} ms"
+                      f"{' (fell back to one step)' if last['single_step'] else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Device Listing Benchmark
+Compares response size and latency of /api/devices variants at 10k and 100k devices
+
+Usage:
+    python benchmarks/bench_devices_listing.py --sizes 10000 100000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure the endpoint itself, not admission control
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+# The hot tier belongs to the default database, not the generated ones
+os.environ['HOT_TIER'] = '0'
+# No temperature thread or dispatcher writing to the database while timing
+os.environ['BACKGROUND_JOBS'] = '0'
+# Keep the app's import-time setup away from the repo's devices.db
+SCRATCH = tempfile.TemporaryDirectory()
+os.environ['DATABASE_PATH'] = os.path.join(SCRATCH.name, 'devices.db')
+
+import app as dashboard
+import schema
+
+DEVICE_TYPES = ('light', 'fan', 'sensor', 'ac', 'lock', 'blinds', 'plug', 'camera')
+
+VARIANTS = [
+    ('full listing', '/api/devices'),
+    ('projected', '/api/devices?fields=id,state,value'),
+    ('filtered', '/api/devices?type=light&state=on'),
+    ('page of 100', '/api/devices?limit=100&after={middle}'),
+    ('projected page', '/api/devices?fields=state&limit=100&after={middle}')
+]
+
+
+def create_database(path, count):
+    """Create a devices database holding count synthetic devices."""
+    conn = sqlite3.connect(path)
+    dashboard.DATABASE = path
+    schema.init_db(path)
+    conn.execute('DELETE FROM devices')
+    conn.executemany(
+        'INSERT INTO devices (name, type, state, value) VALUES (?, ?, ?, ?)',
+        ((f'Device {i}', DEVICE_TYPES[i % len(DEVICE_TYPES)], 'on' if i % 3 else 'off', i % 100)
+         for i in range(count))
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/devices filtering, projection and pagination')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='Device counts to test')
+    parser.add_argument('--repeat', type=int, default=5, help='Requests per variant')
+    args = parser.parse_args()
+
+    client = dashboard.app.test_client()
+    with SCRATCH as tmp:
+        for count in args.sizes:
+            create_database(os.path.join(tmp, f'devices_{count}.db'), count)
+            print(f"\n{count:,} devices")
+            print(f"{'variant':<16}{'bytes':>14}{'best ms':>12}")
+            for label, url in VARIANTS:
+                url = url.format(middle=count // 2)
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                print(f"{label:<16}{len(response.data):>14,}{min(timings) * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
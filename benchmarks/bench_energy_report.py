@@ -0,0 +1,108 @@
+"""
+Energy Report Benchmark
+Times the vectorized energy report over synthetic energy_logs columns
+
+With --homes, also writes that many home databases of --home-samples readings each
+and compares building their reports one after another with build_multi_home_report,
+which fans the homes out over a process pool.
+
+Usage:
+    python benchmarks/bench_energy_report.py --samples 100000000 --devices 5000
+    python benchmarks/bench_energy_report.py --samples 0 --homes 8 --home-samples 2000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from energy_analytics import build_energy_report, build_multi_home_report, compute_energy_report
+
+
+def generate_samples(samples, devices, seed=0):
+    """Generate one year of readings spread evenly over the given devices."""
+    rng = np.random.default_rng(seed)
+    device_ids = rng.integers(1, devices + 1, size=samples, dtype=np.int64)
+    start = 1704067200  # 2024-01-01 00:00:00 UTC
+    timestamps = start + rng.integers(0, 365 * 86400, size=samples, dtype=np.int64)
+    power = rng.gamma(2.0, 150.0, size=samples)
+    return device_ids, timestamps, power
+
+
+def bench_single(args):
+    print(f"Generating {args.samples:,} samples across {args.devices:,} devices...")
+    columns = generate_samples(args.samples, args.devices)
+
+    timings = []
+    for run in range(args.repeat):
+        started = time.perf_counter()
+        report = compute_energy_report(*columns)
+        timings.append(time.perf_counter() - started)
+        print(f"Run {run + 1}: {timings[-1]:.2f}s")
+
+    best = min(timings)
+    print(f"Best: {best:.2f}s ({args.samples / best / 1e6:.1f}M samples/s)")
+    print(f"Total energy: {report['summary']['energy_kwh']:.1f} kWh, "
+          f"cost: {report['summary']['cost']:.2f}, "
+          f"peak demand: {report['summary']['peak_demand_kw']:.1f} kW, "
+          f"load factor: {report['summary']['load_factor']:.3f}")
+
+
+
+def create_home(path, samples, devices, seed):
+    """Write a home database whose energy_logs holds the given synthetic readings."""
+    device_ids, timestamps, power = generate_samples(samples, devices, seed)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE energy_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, device_id INTEGER, '
+                 'power_consumption REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+    conn.executemany(
+        "INSERT INTO energy_logs (device_id, power_consumption, timestamp) VALUES (?, ?, datetime(?, 'unixepoch'))",
+        zip(device_ids.tolist(), power.tolist(), timestamps.tolist())
+    )
+    conn.commit()
+    conn.close()
+
+
+def bench_homes(homes, samples, devices):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\nWriting {homes} home databases of {samples:,} samples...")
+        databases = {}
+        for home in range(homes):
+            databases[f'home{home}'] = os.path.join(tmp, f'home{home}.db')
+            create_home(databases[f'home{home}'], samples, devices, seed=home)
+
+        started = time.perf_counter()
+        for database in databases.values():
+            build_energy_report(database)
+        sequential = time.perf_counter() - started
+        print(f"One after another: {sequential:.2f}s")
+
+        started = time.perf_counter()
+        report = build_multi_home_report(databases)
+        parallel = time.perf_counter() - started
+        print(f"Process pool:      {parallel:.2f}s ({sequential / parallel:.1f}x, {os.cpu_count()} CPUs)")
+        print(f"Total energy: {report['totals']['energy_kwh']:.1f} kWh across {report['totals']['homes']} homes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vectorized energy report')
+    parser.add_argument('--samples', type=int, default=100_000_000, help='Number of energy_logs rows')
+    parser.add_argument('--devices', type=int, default=5000, help='Number of distinct devices')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs')
+    parser.add_argument('--homes', type=int, default=0, help='Home databases for the multi-home comparison')
+    parser.add_argument('--home-samples', type=int, default=1_000_000, help='Readings per home database')
+    args = parser.parse_args()
+
+    if args.samples:
+        bench_single(args)
+    if args.homes:
+        bench_homes(args.homes, args.home_samples, args.devices)
+
+if __name__ == '__main__':
+    main()
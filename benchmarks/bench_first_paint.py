@@ -0,0 +1,97 @@
+"""
+Time-to-Interactive Benchmark
+Compares the dashboard's critical path with and without the embedded initial snapshot
+
+Starts the app in a subprocess and replays what a browser does on a cold first visit,
+adding a simulated network round-trip time to every request:
+
+    api-fetch:  GET /  ->  CSS + JS (parallel)  ->  /api/devices, /api/scenes, /api/energy (parallel)
+    snapshot:   GET /  ->  CSS + JS (parallel)  (device, scene and energy data are already in the page)
+
+The time until the last response of the path arrives is reported as time-to-interactive.
+Script parsing and layout are not modeled; in a real browser, compare the
+'dashboard-time-to-interactive' performance measure recorded by dashboard.js.
+
+Usage:
+    python benchmarks/bench_first_paint.py --rtt 80 --runs 20
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+API_PATHS = ['/api/devices', '/api/scenes', '/api/energy']
+
+
+def fetch(base, path, rtt):
+    """GET a path after one simulated round trip; returns the decoded body."""
+    time.sleep(rtt)
+    request = urllib.request.Request(base + path, headers={'Accept-Encoding': 'identity'})
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode('utf-8')
+
+
+def wait_for_server(base, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            fetch(base, '/health', 0)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+
+def load_dashboard(base, rtt, pool, use_snapshot):
+    """Replay one cold page load; returns seconds until the dashboard has its data."""
+    started = time.perf_counter()
+    html = fetch(base, '/', rtt)
+    assets = re.findall(r'(?:href|src)="(/assets/[^"]+)"', html)
+    list(pool.map(lambda path: fetch(base, path, rtt), assets))
+    if not use_snapshot or 'id="initial-snapshot"' not in html:
+        list(pool.map(lambda path: fetch(base, path, rtt), API_PATHS))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure dashboard time-to-interactive')
+    parser.add_argument('--rtt', type=float, default=80, help='Simulated round-trip time in ms')
+    parser.add_argument('--runs', type=int, default=20, help='Page loads per mode')
+    parser.add_argument('--port', type=int, default=8650, help='Port for the app under test')
+    args = parser.parse_args()
+
+    base = f'http://127.0.0.1:{args.port}'
+    server = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)',
+         str(args.port)],
+        cwd=ROOT, env=dict(os.environ, RATE_LIMIT_ENABLED='0'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(base)
+        rtt = args.rtt / 1000
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            print(f"Simulated RTT {args.rtt:.0f} ms, {args.runs} cold page loads per mode")
+            results = {}
+            for mode, use_snapshot in (('api-fetch', False), ('snapshot', True)):
+                times = [load_dashboard(base, rtt, pool, use_snapshot) for _ in range(args.runs)]
+                results[mode] = statistics.median(times)
+                print(f"  {mode:10} median {results[mode] * 1000:7.1f} ms   "
+                      f"p90 {sorted(times)[int(len(times) * 0.9) - 1] * 1000:7.1f} ms")
+            saved = results['api-fetch'] - results['snapshot']
+            print(f"  snapshot saves {saved * 1000:.1f} ms ({saved / results['api-fetch']:.0%})")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Hot Tier Benchmark
+Compares per-reading cost of the shared-memory hot tier with a SQLite transaction
+
+Times --readings sensor updates written to the devices table one transaction each
+(how readings were stored before the hot tier) against the same updates written to
+the hot tier, then times single-device reads from both. Finally runs --writers writer
+processes and --readers reader processes against the same few slots for --seconds:
+every write stores the same number in all three fields, so a reader that ever sees
+them differ has read a torn slot.
+
+Usage:
+    python benchmarks/bench_hot_tier.py --devices 10000 --readings 20000
+    python benchmarks/bench_hot_tier.py --writers 4 --readers 4 --seconds 5
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hot_tier
+
+# Slots shared by the concurrent writers and readers, so they collide constantly
+CONTENDED_SLOTS = 4
+
+
+def create_database(path, devices):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE devices (id INTEGER PRIMARY KEY, value INTEGER, '
+                 'power_consumption REAL, battery_level INTEGER)')
+    conn.executemany('INSERT INTO devices (id, value) VALUES (?, 20)', ((i,) for i in range(1, devices + 1)))
+    conn.commit()
+    conn.close()
+
+
+def per_op(label, seconds, count):
+    print(f"  {label:28} {seconds / count * 1e6:9.2f} us/op  ({count:,} ops in {seconds:.2f} s)")
+
+
+def bench_writes_and_reads(path, devices, readings):
+    create_database(path, devices)
+    updates = [(random.randint(15, 30), random.randint(1, devices)) for _ in range(readings)]
+
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    for value, device_id in updates:
+        conn.execute('UPDATE devices SET value = ? WHERE id = ?', (value, device_id))
+        conn.commit()
+    per_op('SQLite update + commit', time.perf_counter() - started, readings)
+
+    tier = hot_tier.HotTier(hot_tier.path_for(path), lambda: sqlite3.connect(path)).open()
+    started = time.perf_counter()
+    for value, device_id in updates:
+        tier.write(device_id, {'value': value})
+    per_op('hot tier write', time.perf_counter() - started, readings)
+
+    ids = [device_id for _, device_id in updates]
+    started = time.perf_counter()
+    for device_id in ids:
+        conn.execute('SELECT value FROM devices WHERE id = ?', (device_id,)).fetchone()
+    per_op('SQLite read', time.perf_counter() - started, readings)
+    conn.close()
+
+    started = time.perf_counter()
+    for device_id in ids:
+        tier.read(device_id)
+    per_op('hot tier read', time.perf_counter() - started, readings)
+
+    started = time.perf_counter()
+    rows = tier.checkpoint()
+    print(f"  checkpoint of {rows:,} devices   {time.perf_counter() - started:9.4f} s")
+    tier.close()
+
+
+def writer(path, seconds, counter):
+    tier = hot_tier.HotTier(path).open()
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        tier.write(n % CONTENDED_SLOTS + 1, {'value': n, 'power_consumption': n, 'battery_level': n})
+    with counter.get_lock():
+        counter.value += n
+
+
+def reader(path, seconds, reads, torn, misses):
+    tier = hot_tier.HotTier(path).open()
+    deadline = time.monotonic() + seconds
+    n = bad = missed = 0
+    while time.monotonic() < deadline:
+        n += 1
+        readings = tier.read(n % CONTENDED_SLOTS + 1)
+        if readings is None:
+            missed += 1
+        elif not readings['value'] == readings['power_consumption'] == readings['battery_level']:
+            bad += 1
+    for total, count in ((reads, n), (torn, bad), (misses, missed)):
+        with total.get_lock():
+            total.value += count
+
+
+def bench_contention(path, writers, readers, seconds):
+    hot_tier.HotTier(path).open().close()
+    writes = multiprocessing.Value('q', 0)
+    reads, torn, misses = (multiprocessing.Value('q', 0) for _ in range(3))
+    processes = [multiprocessing.Process(target=writer, args=(path, seconds, writes)) for _ in range(writers)]
+    processes += [multiprocessing.Process(target=reader, args=(path, seconds, reads, torn, misses))
+                  for _ in range(readers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    print(f"  {writers} writers: {writes.value / seconds:,.0f} writes/s; "
+          f"{readers} readers: {reads.value / seconds:,.0f} reads/s")
+    print(f"  torn reads: {torn.value}, reads that fell back to SQLite: {misses.value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sensor reading hot tier')
+    parser.add_argument('--devices', type=int, default=10000, help='Devices in the table')
+    parser.add_argument('--readings', type=int, default=20000, help='Readings to write and read')
+    parser.add_argument('--writers', type=int, default=2, help='Concurrent writer processes')
+    parser.add_argument('--readers', type=int, default=2, help='Concurrent reader processes')
+    parser.add_argument('--seconds', type=float, default=3, help='Duration of the concurrency test')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Single process, {args.devices:,} devices")
+        bench_writes_and_reads(os.path.join(directory, 'bench.db'), args.devices, args.readings)
+        print(f"\nConcurrent processes on {CONTENDED_SLOTS} slots for {args.seconds:g} s")
+        bench_contention(os.path.join(directory, 'contended.hot'), args.writers, args.readers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
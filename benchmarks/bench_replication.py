@@ -0,0 +1,107 @@
+"""
+Replication Lag Benchmark
+Measures how far a standby trails the primary under a sustained write rate
+
+Builds a scratch primary with the change log enabled, bootstraps a standby from it and
+starts tailing. A writer then commits device updates and energy readings at --rate
+transactions per second. After every applied batch the standby records the delay
+between the newest entry's commit on the primary and its apply; the distribution of
+those delays is reported, along with how long the standby takes to catch up at the end.
+
+Usage:
+    python benchmarks/bench_replication.py --rate 500 --duration 10
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import replication
+
+
+def create_primary(path, devices):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE devices (id INTEGER PRIMARY KEY, name TEXT, state TEXT, value INTEGER)')
+    conn.execute('CREATE TABLE energy_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, device_id INTEGER, '
+                 'power_consumption REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+    conn.executemany("INSERT INTO devices (id, name, state, value) VALUES (?, ?, 'off', 0)",
+                     ((i, f'Device {i}') for i in range(1, devices + 1)))
+    conn.commit()
+    replication.init_change_log(conn)
+    conn.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark change-log replication lag')
+    parser.add_argument('--rate', type=float, default=500, help='Write transactions per second on the primary')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of writes')
+    parser.add_argument('--devices', type=int, default=1000, help='Devices in the scratch database')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        primary_path = os.path.join(tmp, 'devices.db')
+        create_primary(primary_path, args.devices)
+        standby = replication.Standby(primary_path, os.path.join(tmp, 'devices-standby.db'))
+        standby.bootstrap()
+
+        delays = []
+        apply_batch = standby.apply_batch
+
+        def recording_apply_batch(primary, target):
+            applied = apply_batch(primary, target)
+            if applied:
+                delays.append(standby.last_apply_delay)
+            return applied
+
+        standby.apply_batch = recording_apply_batch
+        standby.start()
+
+        conn = sqlite3.connect(primary_path)
+        interval = 1 / args.rate
+        writes = 0
+        started = time.perf_counter()
+        next_write = started
+        while time.perf_counter() - started < args.duration:
+            device_id = writes % args.devices + 1
+            conn.execute('UPDATE devices SET value = ?, state = ? WHERE id = ?',
+                         (writes, 'on' if writes % 2 else 'off', device_id))
+            conn.execute('INSERT INTO energy_logs (device_id, power_consumption) VALUES (?, ?)',
+                         (device_id, float(writes % 500)))
+            conn.commit()
+            writes += 1
+            next_write += interval
+            pause = next_write - time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
+        elapsed = time.perf_counter() - started
+        target_seq = replication.latest_seq(conn)
+        target_id = replication.latest_id(conn)
+        conn.close()
+
+        drained = time.perf_counter()
+        while standby.applied_seq < target_seq or standby.applied_id < target_id:
+            time.sleep(0.001)
+        catch_up = time.perf_counter() - drained
+        standby.stop()
+
+        print(f"Primary: {writes:,} transactions in {elapsed:.1f} s ({writes / elapsed:,.0f}/s), "
+              f"{target_seq:,} change-log entries, {target_id:,} energy readings")
+        print(f"Standby: {len(delays):,} batches, {standby.applied_total / len(delays):.1f} entries and readings per batch")
+        print(f"  apply delay  p50 {percentile(delays, 0.5):.1f} ms  p99 {percentile(delays, 0.99):.1f} ms  "
+              f"max {percentile(delays, 1):.1f} ms")
+        print(f"  caught up {catch_up * 1000:.1f} ms after the last write")
+
+
+if __name__ == '__main__':
+    main()
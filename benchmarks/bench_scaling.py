@@ -0,0 +1,192 @@
+"""
+Scaling Benchmark
+Plots get_devices, activate_scene and get_energy_data latency against fleet size
+
+Generates a synthetic fleet database for each size with fleet_generator (reusing
+databases already in --data-dir), then times each endpoint through the Flask test client
+in a child process that imports the app with DATABASE_PATH pointing at that fleet and
+background jobs off, so nothing else touches the database while it is timed. Reports
+median and p95 latency and response size per endpoint and size, and plots the scaling
+curves when matplotlib is installed.
+
+Usage:
+    python benchmarks/bench_scaling.py --sizes 10 100 1000 10000 100000 --plot scaling.png
+    python benchmarks/bench_scaling.py --sizes 1000000 --data-dir /var/tmp/fleets --repeat 5
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure the endpoints themselves, not admission control
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+# The hot tier belongs to the default database, not the generated ones
+os.environ['HOT_TIER'] = '0'
+# No temperature thread, dispatcher, backups or anomaly detector while timing
+os.environ['BACKGROUND_JOBS'] = '0'
+
+import fleet_generator
+
+# Try to import matplotlib, make it optional
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    MATPLOTLIB_AVAILABLE = True
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+ENDPOINTS = [
+    ('get_devices', 'GET', '/api/devices'),
+    ('activate_scene', 'POST', '/api/scenes/{scene_id}/activate'),
+    ('get_energy_data', 'GET', '/api/energy')
+]
+
+
+def fleet_database(data_dir, size, args):
+    """Return the path of a generated fleet of `size` devices, generating it if needed."""
+    path = os.path.join(data_dir, f'fleet_{size}_{args.years:g}y_{args.readings_per_day:g}rpd.db')
+    if not os.path.exists(path):
+        stats = fleet_generator.generate_fleet(path, size, years=args.years,
+                                               readings_per_day=args.readings_per_day, metered=args.metered)
+        print(f"  generated {stats['energy_logs']:,} energy_logs rows, {stats['size_mb']} MB in {stats['seconds']}s")
+    return path
+
+
+def time_endpoint(client, method, url, scenes, repeat, max_seconds):
+    """Time up to `repeat` requests (at least 3, at most max_seconds); returns (timings, bytes)."""
+    timings = []
+    size = 0
+    deadline = time.perf_counter() + max_seconds
+    for i in range(repeat):
+        started = time.perf_counter()
+        response = client.open(url.format(scene_id=i % scenes + 1), method=method)
+        timings.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}: {response.data[:200]}')
+        size = len(response.data)
+        if len(timings) >= 3 and time.perf_counter() > deadline:
+            break
+    return timings, size
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure_size(size, args):
+    """Child process: time every endpoint against the database in DATABASE_PATH."""
+    import app as dashboard
+
+    client = dashboard.app.test_client()
+    conn = dashboard.get_db_connection()
+    scenes = conn.execute('SELECT COUNT(*) FROM scenes').fetchone()[0]
+    conn.close()
+    results = []
+    print(f"{'endpoint':<18}{'median ms':>12}{'p95 ms':>12}{'bytes':>14}{'requests':>10}")
+    for name, method, url in ENDPOINTS:
+        # One untimed request warms SQLite's page cache
+        client.open(url.format(scene_id=1), method=method)
+        timings, size_bytes = time_endpoint(client, method, url, scenes, args.repeat, args.max_seconds)
+        row = {
+            'devices': size,
+            'endpoint': name,
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'bytes': size_bytes,
+            'requests': len(timings)
+        }
+        results.append(row)
+        print(f"{name:<18}{row['median_ms']:>12.2f}{row['p95_ms']:>12.2f}{size_bytes:>14,}{len(timings):>10}",
+              flush=True)
+    with open(args.results, 'w') as f:
+        json.dump(results, f)
+
+
+def run_size(path, size, args):
+    """Time one fleet size in a fresh process whose app is configured for that database."""
+    with tempfile.TemporaryDirectory() as scratch:
+        results_path = os.path.join(scratch, 'results.json')
+        command = [sys.executable, os.path.abspath(__file__), '--measure', str(size), '--results', results_path,
+                   '--repeat', str(args.repeat), '--max-seconds', str(args.max_seconds)]
+        subprocess.run(command, env=dict(os.environ, DATABASE_PATH=path), check=True)
+        with open(results_path) as f:
+            return json.load(f)
+
+
+def plot(results, path):
+    figure, axes = plt.subplots(figsize=(8, 5))
+    for name, _, _ in ENDPOINTS:
+        rows = [row for row in results if row['endpoint'] == name]
+        sizes = [row['devices'] for row in rows]
+        axes.plot(sizes, [row['median_ms'] for row in rows], marker='o', label=f'{name} (median)')
+        axes.fill_between(sizes, [row['median_ms'] for row in rows], [row['p95_ms'] for row in rows], alpha=0.2)
+    axes.set_xscale('log')
+    axes.set_yscale('log')
+    axes.set_xlabel('devices')
+    axes.set_ylabel('latency (ms), shaded to p95')
+    axes.set_title('Endpoint latency vs fleet size')
+    axes.grid(True, which='both', alpha=0.3)
+    axes.legend()
+    figure.tight_layout()
+    figure.savefig(path, dpi=120)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark endpoint latency against fleet size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000],
+                        help='Device counts to test')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint and size')
+    parser.add_argument('--max-seconds', type=float, default=30, help='Time budget per endpoint and size')
+    parser.add_argument('--years', type=float, default=1.0, help='Years of energy_logs history')
+    parser.add_argument('--readings-per-day', type=float, default=4, help='Power readings per metered device per day')
+    parser.add_argument('--metered', type=float, default=0.1, help='Fraction of powered devices that log readings')
+    parser.add_argument('--data-dir', help='Directory to keep generated databases in (default: a temporary one)')
+    parser.add_argument('--csv', help='Write results to this CSV file')
+    parser.add_argument('--plot', help='Write a latency plot to this PNG file (requires matplotlib)')
+    # Internal: run in the child process for one size
+    parser.add_argument('--measure', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--results', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure_size(args.measure, args)
+        return
+
+    if args.plot and not MATPLOTLIB_AVAILABLE:
+        print("Warning: matplotlib not installed. Skipping the plot. Install with: pip install matplotlib")
+
+    temporary = None if args.data_dir else tempfile.TemporaryDirectory()
+    data_dir = args.data_dir or temporary.name
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    try:
+        for size in args.sizes:
+            print(f"\n{size:,} devices", flush=True)
+            path = fleet_database(data_dir, size, args)
+            results.extend(run_size(path, size, args))
+    finally:
+        if temporary:
+            temporary.cleanup()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"\nWrote {args.csv}")
+    if args.plot and MATPLOTLIB_AVAILABLE:
+        plot(results, args.plot)
+        print(f"Wrote {args.plot}")
+
+
+if __name__ == '__main__':
+    main()
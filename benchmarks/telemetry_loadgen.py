@@ -0,0 +1,119 @@
+"""
+Telemetry Load Generator
+Measures end-to-end readings/sec through the telemetry gateway pinned to one core
+
+Starts telemetry_gateway.py against a scratch database built with the app's schema,
+change-log triggers included, with the gateway's CPU affinity set to a single core.
+Streams power readings over TCP (or UDP) as fast as it can, and reports the rate at
+which readings land in energy_logs.
+
+Usage:
+    python benchmarks/telemetry_loadgen.py --readings 2000000 --devices 10000
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import schema
+from telemetry_gateway import FRAME, FIELD_POWER
+
+FRAMES_PER_SEND = 4096
+
+
+def create_database(path, devices):
+    """Create the app's schema, change-log triggers included, with the given number of plugs."""
+    schema.init_db(path)
+    schema.init_tables(path)
+    conn = sqlite3.connect(path)
+    conn.execute('DELETE FROM devices')
+    conn.executemany("INSERT INTO devices (id, name, type, state) VALUES (?, ?, 'plug', 'on')",
+                     ((i, f'Plug {i}') for i in range(1, devices + 1)))
+    conn.commit()
+    conn.close()
+
+
+def build_payload(devices, count):
+    """Pack count power frames cycling over the device IDs."""
+    payload = bytearray(FRAME.size * count)
+    now = int(time.time())
+    for i in range(count):
+        FRAME.pack_into(payload, i * FRAME.size, i % devices + 1, FIELD_POWER, 100.0 + i % 50, now)
+    return bytes(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the telemetry gateway')
+    parser.add_argument('--readings', type=int, default=2_000_000, help='Total readings to send')
+    parser.add_argument('--devices', type=int, default=10000, help='Distinct device IDs')
+    parser.add_argument('--port', type=int, default=9751, help='Gateway port')
+    parser.add_argument('--udp', action='store_true', help='Send over UDP instead of TCP')
+    parser.add_argument('--gateway-cpu', type=int, default=0, help='CPU the gateway is pinned to')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'telemetry.db')
+        create_database(database, args.devices)
+
+        def pin():
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, {args.gateway_cpu})
+
+        gateway = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'telemetry_gateway.py'),
+             '--database', database, '--port', str(args.port)],
+            stdout=subprocess.PIPE, text=True, preexec_fn=pin
+        )
+        try:
+            gateway.stdout.readline()  # Wait for the listening banner
+            payload = build_payload(args.devices, FRAMES_PER_SEND)
+            sends = args.readings // FRAMES_PER_SEND
+            total = sends * FRAMES_PER_SEND
+
+            started = time.perf_counter()
+            if args.udp:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                chunk = 4096 // FRAME.size * FRAME.size  # Keep datagrams under typical buffer sizes
+                for _ in range(sends):
+                    for offset in range(0, len(payload), chunk):
+                        sock.sendto(payload[offset:offset + chunk], ('127.0.0.1', args.port))
+            else:
+                sock = socket.create_connection(('127.0.0.1', args.port))
+                for _ in range(sends):
+                    sock.sendall(payload)
+            sent = time.perf_counter()
+            sock.close()
+
+            conn = sqlite3.connect(database)
+            applied = 0
+            finished = time.perf_counter()
+            # Stop once everything landed, or nothing new arrived for 2s (UDP drops)
+            while applied < total and time.perf_counter() - finished < 2:
+                time.sleep(0.05)
+                count = conn.execute('SELECT COUNT(*) FROM energy_logs').fetchone()[0]
+                if count > applied:
+                    applied = count
+                    finished = time.perf_counter()
+            conn.close()
+
+            print(f"Sent {total:,} readings in {sent - started:.2f}s "
+                  f"({total / (sent - started):,.0f}/s)")
+            print(f"Applied {applied:,} readings in {finished - started:.2f}s "
+                  f"({applied / (finished - started):,.0f} readings/s end to end, gateway on one core)")
+            if applied < total:
+                print(f"Warning: {total - applied:,} readings were not applied (UDP drops or stalled gateway)")
+        finally:
+            gateway.terminate()
+            gateway.wait()
+
+
+if __name__ == '__main__':
+    main()
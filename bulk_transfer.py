@@ -0,0 +1,173 @@
+"""
+Bulk Transfer
+Streaming NDJSON/CSV export and batched import for devices, scenes, schedules and energy logs
+"""
+
+import csv
+import io
+import json
+import sqlite3
+
+# Tables that can be exported and imported
+TRANSFER_TABLES = ('devices', 'scenes', 'schedules', 'energy_logs')
+TRANSFER_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Rows fetched per cursor.fetchmany() call and emitted per response chunk
+EXPORT_CHUNK_SIZE = 5000
+# Rows per executemany() call
+IMPORT_BATCH_SIZE = 5000
+# Rows per transaction; bounds both lock hold time and rollback size
+IMPORT_TRANSACTION_ROWS = 50000
+
+
+def table_columns(conn, table):
+    """Return the column names of a transferable table, in schema order."""
+    if table not in TRANSFER_TABLES:
+        raise ValueError(f'Unknown table: {table}')
+    cursor = conn.execute(f'PRAGMA table_info({table})')
+    return [column[1] for column in cursor.fetchall()]
+
+
+def iter_export(database, table, fmt='ndjson', chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream a table as NDJSON or CSV text chunks with constant memory.
+
+    Args:
+        database: Path to the SQLite database
+        table: One of TRANSFER_TABLES
+        fmt: 'ndjson' or 'csv'
+        chunk_size: Rows fetched and emitted per chunk
+
+    Yields:
+        Encoded chunks of at most chunk_size rows each.
+    """
+    if fmt not in TRANSFER_FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+
+    conn = sqlite3.connect(database)
+    try:
+        columns = table_columns(conn, table)
+        cursor = conn.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY rowid')
+
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(columns)
+            yield buffer.getvalue().encode('utf-8')
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                csv.writer(buffer, lineterminator='\n').writerows(
+                    ['' if value is None else value for value in row] for row in rows
+                )
+                yield buffer.getvalue().encode('utf-8')
+            else:
+                yield ''.join(
+                    json.dumps(dict(zip(columns, row)), separators=(',', ':')) + '\n' for row in rows
+                ).encode('utf-8')
+    finally:
+        conn.close()
+
+
+def iter_ndjson_rows(stream):
+    """Parse an NDJSON byte stream into dictionaries, one line at a time."""
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ValueError(f'Invalid JSON on line {line_number}')
+        if not isinstance(row, dict):
+            raise ValueError(f'Line {line_number} is not a JSON object')
+        yield row
+
+
+def iter_csv_rows(stream):
+    """Parse a CSV byte stream with a header row into dictionaries; empty cells become NULL."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    for row in reader:
+        yield {key: (None if value == '' else value) for key, value in row.items()}
+
+
+def import_rows(database, table, rows, replace=True,
+                batch_size=IMPORT_BATCH_SIZE, transaction_rows=IMPORT_TRANSACTION_ROWS):
+    """
+    Stream rows into a table with executemany batches inside bounded transactions.
+
+    Rows sharing a column set are batched together; a row with a different set of
+    keys flushes the current batch. Transactions committed before an error are kept
+    and the raised ValueError reports how many rows they held.
+
+    Args:
+        database: Path to the SQLite database
+        table: One of TRANSFER_TABLES
+        rows: Iterable of dictionaries keyed by column name
+        replace: Use INSERT OR REPLACE so rows with an existing id overwrite it
+        batch_size: Rows per executemany() call
+        transaction_rows: Rows per committed transaction
+
+    Returns:
+        Dictionary with 'imported' and 'transactions' counts.
+    """
+    conn = sqlite3.connect(database)
+    imported = 0
+    transactions = 0
+    pending = 0
+    try:
+        valid_columns = set(table_columns(conn, table))
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        cursor = conn.cursor()
+        batch_columns = None
+        batch = []
+
+        def flush():
+            nonlocal imported, pending, transactions
+            if not batch:
+                return
+            placeholders = ', '.join('?' * len(batch_columns))
+            cursor.executemany(
+                f'{verb} INTO {table} ({", ".join(batch_columns)}) VALUES ({placeholders})', batch
+            )
+            imported += len(batch)
+            pending += len(batch)
+            batch.clear()
+            if pending >= transaction_rows:
+                conn.commit()
+                transactions += 1
+                pending = 0
+
+        for number, row in enumerate(rows, 1):
+            if None in row:
+                # csv.DictReader files cells beyond the header under the key None
+                raise ValueError(f'Row {number} has more fields than the header')
+            columns = tuple(row.keys())
+            if columns != batch_columns:
+                unknown = set(columns) - valid_columns
+                if unknown:
+                    raise ValueError(f'Unknown columns for {table}: {", ".join(sorted(unknown))}')
+                flush()
+                batch_columns = columns
+            batch.append(tuple(row[column] for column in columns))
+            if len(batch) >= batch_size:
+                flush()
+
+        flush()
+        if pending:
+            conn.commit()
+            transactions += 1
+    except (ValueError, sqlite3.Error) as e:
+        conn.rollback()
+        raise ValueError(f'{e} ({imported - pending} rows committed before the error)')
+    finally:
+        conn.close()
+
+    return {'imported': imported, 'transactions': transactions}
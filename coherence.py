@@ -0,0 +1,149 @@
+"""
+Cross-Process Coherence
+Change notifications and single-owner background jobs for multi-worker deployments
+
+Every worker process polls SQLite's PRAGMA data_version on a dedicated connection.
+The value changes whenever any other connection commits, so a poll is a cheap
+in-memory check. When it changes, the tiny cache_versions table shows which named
+caches were touched, and their subscribers are called to invalidate or reload.
+
+Background jobs (temperature simulation, command delivery) are owned by whichever
+worker holds an exclusive lock on a file next to the database. When that worker
+exits, the OS releases the lock and another worker takes over.
+"""
+
+import threading
+import time
+
+# Try to import fcntl for leader election, make it optional (not available on Windows)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Seconds between data_version polls
+POLL_INTERVAL = 0.005
+# Seconds between attempts to take over background jobs
+LEADER_RETRY_INTERVAL = 1.0
+
+
+def bump(cursor, name):
+    """Mark a named cache as changed, inside the caller's transaction."""
+    cursor.execute(
+        'INSERT INTO cache_versions (name, version) VALUES (?, 1) '
+        'ON CONFLICT(name) DO UPDATE SET version = version + 1',
+        (name,)
+    )
+
+
+class ChangeBus:
+    """Notifies subscribers in this process when data is committed by any process."""
+
+    def __init__(self, connect, poll_interval=POLL_INTERVAL):
+        self.connect = connect
+        self.poll_interval = poll_interval
+        self.running = False
+        self._subscribers = {}
+        self._any_subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, callback):
+        """Call callback() whenever the named cache is bumped."""
+        with self._lock:
+            self._subscribers.setdefault(name, []).append(callback)
+
+    def subscribe_any(self, callback):
+        """Call callback() after every commit to the database."""
+        with self._lock:
+            self._any_subscribers.append(callback)
+
+    def start(self):
+        """Start the polling thread."""
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _read_versions(self, conn):
+        return dict(conn.execute('SELECT name, version FROM cache_versions').fetchall())
+
+    def _notify(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in change subscriber: {e}")
+
+    def _run(self):
+        conn = self.connect()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        versions = self._read_versions(conn)
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current == data_version:
+                    continue
+                data_version = current
+                latest = self._read_versions(conn)
+                changed = [name for name, version in latest.items() if versions.get(name) != version]
+                versions = latest
+                with self._lock:
+                    callbacks = list(self._any_subscribers)
+                    for name in changed:
+                        callbacks.extend(self._subscribers.get(name, ()))
+                self._notify(callbacks)
+            except Exception as e:
+                print(f"Error polling for changes: {e}")
+
+
+class LeaderElection:
+    """Elects one process, via an exclusive file lock, to own background jobs."""
+
+    def __init__(self, lock_path, retry_interval=LEADER_RETRY_INTERVAL):
+        self.lock_path = lock_path
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._lock_file = None
+
+    def _try_acquire(self):
+        if not FCNTL_AVAILABLE:
+            # Without file locks there is no way to coordinate; assume a single process
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held for the life of the process; the OS releases it on exit
+        self._lock_file = lock_file
+        return True
+
+    def start(self, on_elected):
+        """
+        Run on_elected() once this process becomes leader.
+
+        The first attempt is made synchronously so a single-process deployment
+        starts its jobs immediately; followers keep retrying in the background.
+        """
+        if self._try_acquire():
+            self._become_leader(on_elected)
+            return
+        threading.Thread(target=self._wait_for_leadership, args=(on_elected,), daemon=True).start()
+
+    def _wait_for_leadership(self, on_elected):
+        while True:
+            time.sleep(self.retry_interval)
+            try:
+                if self._try_acquire():
+                    self._become_leader(on_elected)
+                    return
+            except Exception as e:
+                print(f"Error during leader election: {e}")
+
+    def _become_leader(self, on_elected):
+        self.is_leader = True
+        print("This worker owns background jobs")
+        on_elected()
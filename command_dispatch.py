@@ -0,0 +1,254 @@
+"""
+Command Dispatch
+Asynchronous delivery of device commands to physical device adapters
+"""
+
+import asyncio
+import heapq
+import json
+import random
+import threading
+import time
+from collections import deque, namedtuple
+
+# Command lifecycle: queued -> (retrying ->)* acknowledged | failed
+COMMAND_STATUSES = ('queued', 'retrying', 'acknowledged', 'failed')
+
+# Defaults for the dispatcher: delivery attempts in flight at once across devices,
+# attempts per command, backoff and per-attempt timeout
+DEFAULT_CONCURRENCY = 64
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 0.25   # seconds, doubled after every failed attempt
+DEFAULT_TIMEOUT = 5.0        # seconds allowed for one delivery attempt
+# Seconds a finished command's id is remembered, so a poll() that read it as pending
+# just before it finished does not submit it again
+FINISHED_TTL = 60.0
+
+Command = namedtuple('Command', ['id', 'device_id', 'action', 'payload'])
+
+# Registered adapter classes by name
+ADAPTERS = {}
+
+
+def register_adapter(name):
+    """Class decorator that makes an adapter selectable by name."""
+    def decorator(cls):
+        ADAPTERS[name] = cls
+        return cls
+    return decorator
+
+
+class DeviceAdapter:
+    """Base class for adapters that deliver commands to physical devices."""
+
+    async def deliver(self, command):
+        """
+        Deliver one command to its device.
+
+        Must return once the device has acknowledged it, and raise on failure
+        so the dispatcher can retry.
+        """
+        raise NotImplementedError
+
+
+@register_adapter('simulated')
+class SimulatedAdapter(DeviceAdapter):
+    """Local adapter that simulates network latency and unreliable devices."""
+
+    def __init__(self, min_latency=0.05, max_latency=0.3, failure_rate=0.05, history=1000):
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.failure_rate = failure_rate
+        # Most recent acknowledged commands, for inspection in tests
+        self.delivered = deque(maxlen=history)
+
+    async def deliver(self, command):
+        await asyncio.sleep(random.uniform(self.min_latency, self.max_latency))
+        if random.random() < self.failure_rate:
+            raise ConnectionError('Simulated delivery failure')
+        self.delivered.append(command)
+
+
+class CommandDispatcher:
+    """
+    Delivers commands through an adapter on an asyncio event loop.
+
+    Commands are recorded in device_commands inside the caller's transaction and
+    submitted after commit. Each device with pending commands gets its own task that
+    delivers them one at a time in command id order, even across retries, so an
+    unreachable device only holds up its own commands. At most `concurrency`
+    delivery attempts run at once across all devices.
+
+    Concurrent requests can commit commands N and N+1 for a device and submit them
+    in the opposite order, so before each delivery the device's task also picks up
+    earlier commands still pending in the database.
+
+    Only one process runs the dispatcher. Other processes just record commands,
+    and the running dispatcher picks them up through poll().
+    """
+
+    def __init__(self, connect, adapter, concurrency=DEFAULT_CONCURRENCY, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 retry_delay=DEFAULT_RETRY_DELAY, timeout=DEFAULT_TIMEOUT):
+        self.connect = connect
+        self.adapter = adapter
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.running = False
+        self._loop = None
+        self._slots = None
+        # Event loop thread only: device id -> heap of (command id, command) awaiting
+        # delivery, and the ids in those heaps or being delivered
+        self._pending = {}
+        self._known = set()
+        self._ready = threading.Event()
+        # IDs submitted and not yet acknowledged or failed
+        self._inflight = set()
+        # IDs acknowledged or failed in the last FINISHED_TTL seconds, oldest first
+        self._finished = set()
+        self._finished_order = deque()
+        self._inflight_lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread and pick up commands left undelivered."""
+        if self.running:
+            return
+        thread = threading.Thread(target=self._run_loop, daemon=True)
+        thread.start()
+        self._ready.wait()
+        self.running = True
+        self.poll()
+
+    def poll(self):
+        """Submit recorded commands that are pending and not already in flight."""
+        if not self.running:
+            return
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, device_id, action, payload FROM device_commands "
+                "WHERE status IN ('queued', 'retrying') ORDER BY id"
+            ).fetchall()
+        finally:
+            conn.close()
+        self.submit([Command(row[0], row[1], row[2], json.loads(row[3])) for row in rows])
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    def record(self, cursor, device_id, action, payload):
+        """Insert a queued command in the caller's transaction and return it."""
+        cursor.execute(
+            'INSERT INTO device_commands (device_id, action, payload) VALUES (?, ?, ?)',
+            (device_id, action, json.dumps(payload))
+        )
+        return Command(cursor.lastrowid, int(device_id), action, payload)
+
+    def submit(self, commands):
+        """Hand committed commands to their device's worker queue (thread-safe)."""
+        if not commands or not self.running:
+            return
+        with self._inflight_lock:
+            # Commands finished since the caller read them as pending are not resubmitted
+            commands = [command for command in commands
+                        if command.id not in self._inflight and command.id not in self._finished]
+            self._inflight.update(command.id for command in commands)
+        if commands:
+            self._loop.call_soon_threadsafe(self._enqueue, commands)
+
+    def _enqueue(self, commands):
+        for command in commands:
+            self._push(command)
+
+    def _push(self, command):
+        """Add a command to its device's heap, starting a task for the device if it has none."""
+        if command.id in self._known:
+            return
+        self._known.add(command.id)
+        heap = self._pending.get(command.device_id)
+        if heap is None:
+            heap = self._pending[command.device_id] = []
+            self._loop.create_task(self._drain(command.device_id, heap))
+        heapq.heappush(heap, (command.id, command))
+
+    async def _drain(self, device_id, heap):
+        """Deliver a device's commands one at a time, lowest id first, until none are left."""
+        while heap:
+            try:
+                earlier = await asyncio.to_thread(self._earlier_pending, device_id, heap[0][0])
+            except Exception as e:
+                print(f"Error looking up earlier commands for device {device_id}: {e}")
+                earlier = []
+            if earlier:
+                with self._inflight_lock:
+                    self._inflight.update(command.id for command in earlier)
+                for command in earlier:
+                    self._push(command)
+            _, command = heapq.heappop(heap)
+            try:
+                await self._deliver(command)
+            except Exception as e:
+                print(f"Error dispatching command {command.id}: {e}")
+            finally:
+                self._known.discard(command.id)
+                self._finish(command.id)
+        del self._pending[device_id]
+
+    def _earlier_pending(self, device_id, before_id):
+        """Pending commands for a device committed before command before_id."""
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, device_id, action, payload FROM device_commands "
+                "WHERE status IN ('queued', 'retrying') AND device_id = ? AND id < ? ORDER BY id",
+                (device_id, before_id)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [Command(row[0], row[1], row[2], json.loads(row[3])) for row in rows]
+
+    def _finish(self, command_id):
+        now = time.monotonic()
+        with self._inflight_lock:
+            self._inflight.discard(command_id)
+            self._finished.add(command_id)
+            self._finished_order.append((now, command_id))
+            while self._finished_order and now - self._finished_order[0][0] > FINISHED_TTL:
+                self._finished.discard(self._finished_order.popleft()[1])
+
+    async def _deliver(self, command):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with self._slots:
+                    await asyncio.wait_for(self.adapter.deliver(command), self.timeout)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if attempt == self.max_attempts:
+                    await self._set_status(command.id, 'failed', attempt, error)
+                    return
+                await self._set_status(command.id, 'retrying', attempt, error)
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            else:
+                await self._set_status(command.id, 'acknowledged', attempt, None)
+                return
+
+    async def _set_status(self, command_id, status, attempts, error):
+        # SQLite writes block, so keep them off the event loop
+        await asyncio.to_thread(self._write_status, command_id, status, attempts, error)
+
+    def _write_status(self, command_id, status, attempts, error):
+        conn = self.connect()
+        try:
+            conn.execute(
+                'UPDATE device_commands SET status = ?, attempts = ?, last_error = ?, '
+                'updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (status, attempts, error, command_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,360 @@
+"""
+Energy Analytics
+Vectorized cost, peak demand, load-factor and time-of-use reports over energy_logs
+"""
+
+import math
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+# Try to import NumPy, make it optional
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: numpy not installed. Energy reports disabled. Install with: pip install numpy")
+
+# Rows pulled from SQLite per fetchmany() call while building column arrays
+FETCH_CHUNK_SIZE = 250000
+
+# Seconds a reading is assumed to cover when no later reading exists for the device
+DEFAULT_SAMPLE_INTERVAL = 60
+# Upper bound on the time credited to one reading (covers gaps where a device was offline)
+MAX_SAMPLE_GAP = 3600
+# Demand is measured over 15-minute windows, as on most utility bills
+DEMAND_INTERVAL = 900
+
+# Multi-home reports with fewer homes than this are built in-process
+PARALLEL_MIN_HOMES = 2
+
+# Time-of-use tariff: hour ranges (UTC, end exclusive, may wrap midnight) and price per kWh
+DEFAULT_TARIFF = [
+    {'name': 'off_peak', 'start_hour': 21, 'end_hour': 7, 'rate': 0.10},
+    {'name': 'shoulder', 'start_hour': 7, 'end_hour': 17, 'rate': 0.15},
+    {'name': 'peak', 'start_hour': 17, 'end_hour': 21, 'rate': 0.25}
+]
+
+
+def parse_tariff(tariff=None):
+    """
+    Build hour-of-day lookup tables for a time-of-use tariff.
+
+    Args:
+        tariff: List of {'name', 'start_hour', 'end_hour', 'rate'} periods covering
+                all 24 hours exactly once. Defaults to DEFAULT_TARIFF.
+
+    Returns:
+        Tuple of (period names, hour -> period index array, period rate array).
+    """
+    tariff = tariff or DEFAULT_TARIFF
+    names = []
+    rates = []
+    hour_period = np.full(24, -1, dtype=np.int64)
+
+    for index, period in enumerate(tariff):
+        try:
+            name = str(period['name'])
+            start = int(period['start_hour'])
+            end = int(period['end_hour'])
+            rate = float(period['rate'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Each tariff period needs name, start_hour, end_hour and rate')
+        if not (0 <= start < 24 and 0 < end <= 24) or rate < 0:
+            raise ValueError(f'Invalid tariff period: {name}')
+
+        hours = list(range(start, end)) if start < end else list(range(start, 24)) + list(range(0, end))
+        for hour in hours:
+            if hour_period[hour] != -1:
+                raise ValueError(f'Tariff periods overlap at hour {hour}')
+            hour_period[hour] = index
+        names.append(name)
+        rates.append(rate)
+
+    if (hour_period == -1).any():
+        raise ValueError('Tariff periods must cover all 24 hours')
+
+    return names, hour_period, np.asarray(rates, dtype=np.float64)
+
+
+def load_energy_arrays(conn, start=None, end=None, device_ids=None):
+    """
+    Pull energy_logs columns into NumPy arrays in bulk.
+
+    Args:
+        conn: SQLite connection
+        start: Optional inclusive lower bound ('YYYY-MM-DD[ HH:MM:SS]')
+        end: Optional exclusive upper bound ('YYYY-MM-DD[ HH:MM:SS]')
+        device_ids: Optional iterable of device IDs to restrict the report to
+
+    Returns:
+        Tuple of (device_ids int64, unix timestamps int64, power float64) arrays.
+    """
+    query = '''
+        SELECT device_id, CAST(strftime('%s', timestamp) AS INTEGER), power_consumption
+        FROM energy_logs
+        WHERE device_id IS NOT NULL AND power_consumption IS NOT NULL
+    '''
+    params = []
+    if start:
+        query += ' AND timestamp >= ?'
+        params.append(start)
+    if end:
+        query += ' AND timestamp < ?'
+        params.append(end)
+    if device_ids:
+        device_ids = [int(device_id) for device_id in device_ids]
+        query += f' AND device_id IN ({",".join("?" * len(device_ids))})'
+        params.extend(device_ids)
+
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+
+    if not chunks:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), np.empty(0, dtype=np.float64)
+
+    data = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
+
+
+def compute_energy_report(device_ids, timestamps, power, tariff=None,
+                          sample_interval=DEFAULT_SAMPLE_INTERVAL,
+                          max_gap=MAX_SAMPLE_GAP,
+                          demand_interval=DEMAND_INTERVAL):
+    """
+    Compute an energy and cost report from column arrays.
+
+    Each reading is treated as the device's power draw (W) until its next reading,
+    capped at max_gap seconds, and its energy is spread over the demand windows and
+    tariff hours that interval covers. Every aggregate is computed with array operations.
+
+    Args:
+        device_ids: Array of device IDs, one per reading
+        timestamps: Array of unix timestamps (seconds), one per reading
+        power: Array of power readings in watts
+        tariff: Optional time-of-use tariff (see parse_tariff)
+        sample_interval: Seconds credited to a device's last reading
+        max_gap: Maximum seconds credited to any single reading
+        demand_interval: Width in seconds of the demand windows
+
+    Returns:
+        Dictionary with 'summary', 'periods' and 'devices' sections.
+    """
+    names, hour_period, period_rates = parse_tariff(tariff)
+    n_periods = len(names)
+
+    device_ids = np.asarray(device_ids, dtype=np.int64)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    power = np.asarray(power, dtype=np.float64)
+
+    if device_ids.size == 0:
+        return {
+            'summary': {
+                'samples': 0,
+                'start': None,
+                'end': None,
+                'energy_kwh': 0.0,
+                'cost': 0.0,
+                'peak_demand_kw': 0.0,
+                'peak_demand_at': None,
+                'average_demand_kw': 0.0,
+                'load_factor': 0.0
+            },
+            'periods': [{'name': name, 'rate': float(rate), 'energy_kwh': 0.0, 'cost': 0.0}
+                        for name, rate in zip(names, period_rates)],
+            'devices': []
+        }
+
+    # Group readings per device in time order; a single packed int64 key sorts
+    # several times faster than lexsort when both columns fit in 32 bits
+    ts_offset = timestamps - timestamps.min()
+    if ts_offset.max() < 2 ** 32 and 0 <= device_ids.min() and device_ids.max() < 2 ** 31:
+        order = np.argsort((device_ids << 32) | ts_offset)
+    else:
+        order = np.lexsort((timestamps, device_ids))
+    dev = device_ids[order]
+    ts = timestamps[order]
+    pw = power[order]
+
+    is_first = np.empty(dev.size, dtype=bool)
+    is_first[0] = True
+    np.not_equal(dev[1:], dev[:-1], out=is_first[1:])
+    starts = np.flatnonzero(is_first)
+    dev_index = np.cumsum(is_first) - 1
+    n_devices = starts.size
+
+    # Seconds each reading is held for: gap to the device's next reading
+    held = np.empty(dev.size, dtype=np.float64)
+    held[:-1] = ts[1:] - ts[:-1]
+    held[np.append(starts[1:] - 1, dev.size - 1)] = sample_interval
+    np.clip(held, 0, max_gap, out=held)
+
+    kwh = pw * held / 3.6e6
+
+    # Split each held interval at demand-window and tariff-hour boundaries so that
+    # a long reading is credited to every window and hour it covers. Every reading
+    # has a first piece; only readings that cross a boundary get extra pieces.
+    grid = math.gcd(int(demand_interval), 3600)
+    held_end = ts + held
+    first_cell = ts // grid
+    first_seconds = np.minimum(held_end, (first_cell + 1) * grid) - ts
+    first_kwh = pw * first_seconds / 3.6e6
+    first_period = hour_period[(first_cell * grid // 3600) % 24]
+    first_cost = first_kwh * period_rates[first_period]
+
+    extra = np.ceil(held_end / grid).astype(np.int64) - 1 - first_cell
+    spans = np.flatnonzero(extra > 0)
+    counts = extra[spans]
+    piece = np.repeat(spans, counts)
+    piece_cell = first_cell[piece] + np.arange(1, piece.size + 1) - np.repeat(np.cumsum(counts) - counts, counts)
+    piece_seconds = np.minimum(held_end[piece], (piece_cell + 1) * grid) - piece_cell * grid
+    piece_kwh = pw[piece] * piece_seconds / 3.6e6
+    piece_period = hour_period[(piece_cell * grid // 3600) % 24]
+    piece_cost = piece_kwh * period_rates[piece_period]
+    piece_dev = dev_index[piece]
+
+    # Per-device aggregates
+    device_kwh = np.add.reduceat(kwh, starts)
+    device_cost = np.add.reduceat(first_cost, starts) + np.bincount(piece_dev, weights=piece_cost, minlength=n_devices)
+    device_peak_w = np.maximum.reduceat(pw, starts)
+    device_hours = np.add.reduceat(held, starts) / 3600.0
+    device_avg_w = np.divide(device_kwh * 1000.0, device_hours,
+                             out=np.zeros(n_devices), where=device_hours > 0)
+    device_load_factor = np.divide(device_avg_w, device_peak_w,
+                                   out=np.zeros(n_devices), where=device_peak_w > 0)
+
+    size = n_devices * n_periods
+    cell = dev_index * n_periods + first_period
+    piece_cell_index = piece_dev * n_periods + piece_period
+    device_period_kwh = (np.bincount(cell, weights=first_kwh, minlength=size) +
+                         np.bincount(piece_cell_index, weights=piece_kwh, minlength=size)).reshape(n_devices, n_periods)
+    device_period_cost = (np.bincount(cell, weights=first_cost, minlength=size) +
+                          np.bincount(piece_cell_index, weights=piece_cost, minlength=size)).reshape(n_devices, n_periods)
+
+    # Whole-home demand over fixed windows
+    bucket = first_cell * grid // demand_interval
+    piece_bucket = piece_cell * grid // demand_interval
+    first_bucket = int(bucket.min())
+    n_buckets = int(max(bucket.max(), piece_bucket.max() if piece_bucket.size else 0)) - first_bucket + 1
+    bucket_kwh = (np.bincount(bucket - first_bucket, weights=first_kwh, minlength=n_buckets) +
+                  np.bincount(piece_bucket - first_bucket, weights=piece_kwh, minlength=n_buckets))
+    bucket_kw = bucket_kwh / (demand_interval / 3600.0)
+    peak_index = int(bucket_kw.argmax())
+    peak_kw = float(bucket_kw[peak_index])
+    total_kwh = float(kwh.sum())
+    average_kw = total_kwh / (bucket_kw.size * demand_interval / 3600.0)
+
+    period_kwh = device_period_kwh.sum(axis=0)
+    period_cost = device_period_cost.sum(axis=0)
+
+    devices = []
+    for i in range(n_devices):
+        devices.append({
+            'device_id': int(dev[starts[i]]),
+            'samples': int((starts[i + 1] if i + 1 < n_devices else dev.size) - starts[i]),
+            'energy_kwh': float(device_kwh[i]),
+            'cost': float(device_cost[i]),
+            'peak_power_w': float(device_peak_w[i]),
+            'average_power_w': float(device_avg_w[i]),
+            'load_factor': float(device_load_factor[i]),
+            'periods': {names[p]: {'energy_kwh': float(device_period_kwh[i, p]),
+                                   'cost': float(device_period_cost[i, p])}
+                        for p in range(n_periods)}
+        })
+
+    return {
+        'summary': {
+            'samples': int(dev.size),
+            'start': int(ts.min()),
+            'end': int(ts.max()),
+            'energy_kwh': total_kwh,
+            'cost': float(device_cost.sum()),
+            'peak_demand_kw': peak_kw,
+            'peak_demand_at': (first_bucket + peak_index) * demand_interval,
+            'average_demand_kw': average_kw,
+            'load_factor': average_kw / peak_kw if peak_kw > 0 else 0.0
+        },
+        'periods': [{'name': names[p], 'rate': float(period_rates[p]),
+                     'energy_kwh': float(period_kwh[p]), 'cost': float(period_cost[p])}
+                    for p in range(n_periods)],
+        'devices': devices
+    }
+
+
+def build_energy_report(database, start=None, end=None, device_ids=None, tariff=None):
+    """
+    Build an energy report for one home database.
+
+    Args:
+        database: Path to the home's SQLite database
+        start: Optional inclusive lower bound on energy_logs.timestamp
+        end: Optional exclusive upper bound on energy_logs.timestamp
+        device_ids: Optional iterable of device IDs
+        tariff: Optional time-of-use tariff
+
+    Returns:
+        Report dictionary (see compute_energy_report).
+    """
+    conn = sqlite3.connect(database)
+    try:
+        arrays = load_energy_arrays(conn, start, end, device_ids)
+    finally:
+        conn.close()
+    return compute_energy_report(*arrays, tariff=tariff)
+
+
+def _build_home_report(args):
+    """Process pool entry point: (home, database, start, end, device_ids, tariff)."""
+    home, database, start, end, device_ids, tariff = args
+    return home, build_energy_report(database, start, end, device_ids, tariff)
+
+
+def build_multi_home_report(databases, start=None, end=None, device_ids=None, tariff=None, max_workers=None):
+    """
+    Build energy reports for several homes, fanning out over a process pool.
+
+    Each home's report loads and reduces its own energy_logs, which is CPU-bound
+    NumPy work, so homes are built in separate processes.
+
+    Args:
+        databases: Mapping of home name -> SQLite database path
+        start: Optional inclusive lower bound on energy_logs.timestamp
+        end: Optional exclusive upper bound on energy_logs.timestamp
+        device_ids: Optional iterable of device IDs applied to every home
+        tariff: Optional time-of-use tariff
+        max_workers: Process pool size (defaults to the CPU count)
+
+    Returns:
+        Dictionary with per-home reports and fleet totals.
+    """
+    parse_tariff(tariff)  # Fail fast before spawning workers
+    jobs = [(home, database, start, end, device_ids, tariff) for home, database in databases.items()]
+
+    if len(jobs) < PARALLEL_MIN_HOMES:
+        results = [_build_home_report(job) for job in jobs]
+    else:
+        workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_build_home_report, jobs))
+
+    reports = dict(results)
+    return {
+        'homes': reports,
+        'totals': {
+            'homes': len(reports),
+            'samples': sum(r['summary']['samples'] for r in reports.values()),
+            'energy_kwh': sum(r['summary']['energy_kwh'] for r in reports.values()),
+            'cost': sum(r['summary']['cost'] for r in reports.values()),
+            # Homes peak at different times, so this is an upper bound on fleet demand
+            'non_coincident_peak_kw': sum(r['summary']['peak_demand_kw'] for r in reports.values())
+        }
+    }
@@ -0,0 +1,301 @@
+"""
+Fleet Generator
+Builds synthetic device databases of any size for development and scaling benchmarks
+
+The schema is created by the app's own init functions (schema.py), so a generated database can be
+served directly:
+
+    python fleet_generator.py --devices 100000 --years 2 --output fleet.db
+    DATABASE_PATH=fleet.db python app.py
+
+Devices are drawn from a type mix (by default weighted like a typical home: mostly
+lights, plugs and sensors). Scenes set a handful of devices each, schedules switch
+single devices on or off, and metered devices log power readings up to now, following
+a daily load curve. Rows are written with executemany() in large batches inside one
+transaction with journaling off, then the database is switched to WAL mode and the
+change-log triggers are created, so the generated history is not replayed to standbys.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import time
+
+# Try to import NumPy, make it optional
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: numpy not installed. Energy logs will be generated slowly. Install with: pip install numpy")
+
+import replication
+import schema
+
+# Relative weight of each device type in the default mix
+DEFAULT_MIX = {
+    'light': 30, 'plug': 12, 'sensor': 10, 'motion': 6, 'blinds': 6, 'fan': 5, 'lock': 4, 'camera': 4,
+    'speaker': 4, 'thermostat': 3, 'tv': 3, 'ac': 3, 'doorbell': 2, 'garage': 2, 'vacuum': 3, 'sprinkler': 3
+}
+
+# Rated power draw in watts while on; None for devices without metering
+RATED_POWER = {
+    'light': 9.0, 'plug': 120.0, 'fan': 45.0, 'ac': 1500.0, 'tv': 110.0, 'speaker': 12.0,
+    'thermostat': 4.0, 'vacuum': 35.0, 'camera': 6.0, 'sprinkler': 25.0, 'garage': 350.0,
+    'doorbell': 3.0, 'sensor': None, 'motion': None, 'lock': None, 'blinds': None
+}
+
+# Fraction of rated power drawn on average at each hour of the day (UTC)
+LOAD_PROFILE = (0.25, 0.2, 0.18, 0.18, 0.2, 0.3, 0.55, 0.75, 0.6, 0.45, 0.4, 0.4,
+                0.45, 0.45, 0.45, 0.5, 0.6, 0.8, 1.0, 1.0, 0.95, 0.8, 0.55, 0.35)
+
+DEVICE_BATCH_SIZE = 50000
+ENERGY_BATCH_SIZE = 200000
+# Page cache used while loading, in KB
+LOAD_CACHE_KB = 256 * 1024
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def parse_mix(text):
+    """Parse 'light=40,sensor=30,...' into a type -> weight dict."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in RATED_POWER:
+            raise ValueError(f"Unknown device type '{name}'. Must be from: {', '.join(RATED_POWER)}")
+        mix[name] = float(weight)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('Device mix needs at least one type with a positive weight')
+    return mix
+
+
+def device_row(device_id, device_type, rnd):
+    """A plausible devices row: (id, name, type, state, value, light_effect, ac_mode, device_mode, battery, power)."""
+    on = rnd.random() < 0.3
+    state = 'on' if on else 'off'
+    value = light_effect = ac_mode = device_mode = battery = None
+    if device_type == 'light':
+        light_effect = rnd.choice(schema.VALID_LIGHT_EFFECTS)
+    elif device_type == 'fan':
+        value = rnd.randint(1, 3) if on else 0
+    elif device_type == 'sensor':
+        state, value, battery = 'on', rnd.randint(16, 30), rnd.randint(20, 100)
+    elif device_type == 'ac':
+        value, ac_mode = rnd.randint(18, 26), rnd.choice(schema.VALID_AC_MODES)
+    elif device_type == 'lock':
+        state = device_mode = rnd.choice(('locked', 'unlocked'))
+        battery = rnd.randint(20, 100)
+    elif device_type == 'blinds':
+        state = rnd.choice(('open', 'closed'))
+        value = 100 if state == 'open' else 0
+    elif device_type == 'camera':
+        device_mode = rnd.choice(('idle', 'recording'))
+    elif device_type in ('speaker', 'tv'):
+        value = rnd.randint(10, 60)
+        device_mode = rnd.choice(('bluetooth', 'wifi')) if device_type == 'speaker' else rnd.choice(('hdmi1', 'hdmi2'))
+    elif device_type == 'garage':
+        state = device_mode = rnd.choice(('open', 'closed'))
+    elif device_type == 'thermostat':
+        value, device_mode = rnd.randint(18, 24), rnd.choice(('auto', 'heat', 'cool'))
+    elif device_type == 'vacuum':
+        device_mode, battery = 'auto', rnd.randint(20, 100)
+    elif device_type == 'doorbell':
+        state, device_mode, battery = 'on', 'idle', rnd.randint(20, 100)
+    elif device_type == 'sprinkler':
+        device_mode = f'zone{rnd.randint(1, 4)}'
+    elif device_type == 'motion':
+        state = 'on'
+    return (device_id, f'{device_type.capitalize()} {device_id}', device_type, state, value,
+            light_effect, ac_mode, device_mode, battery, RATED_POWER[device_type])
+
+
+def scene_state(device_type, rnd):
+    """The state a scene puts one device of this type in."""
+    if device_type == 'light':
+        return {'state': rnd.choice(('on', 'off')), 'light_effect': rnd.choice(('natural', 'warm', 'dim'))}
+    if device_type == 'blinds':
+        opened = rnd.random() < 0.5
+        return {'state': 'open' if opened else 'closed', 'value': 100 if opened else 0}
+    if device_type == 'camera':
+        return {'state': 'on', 'device_mode': 'recording'}
+    if device_type == 'lock':
+        return {'state': 'locked'}
+    return {'state': rnd.choice(('on', 'off'))}
+
+
+def energy_batches(metered, start, steps, step_seconds, seed):
+    """
+    Yield lists of (device_id, power, timestamp) rows in time order.
+
+    metered is a list of (device_id, rated power) pairs; each step logs one reading
+    per metered device around its rated power scaled by the hour's load.
+    """
+    if not metered:
+        return
+    ids = [device_id for device_id, _ in metered]
+    batch = []
+    if NUMPY_AVAILABLE:
+        rng = np.random.default_rng(seed)
+        rated = np.array([power for _, power in metered])
+    else:
+        rnd = random.Random(seed)
+    for step in range(steps):
+        unix_time = start + step * step_seconds
+        load = LOAD_PROFILE[unix_time // 3600 % 24]
+        if NUMPY_AVAILABLE:
+            power = np.round(rated * rng.gamma(4.0, load / 4.0, len(ids)), 2).tolist()
+        else:
+            power = [round(rated_power * rnd.gammavariate(4.0, load / 4.0), 2) for _, rated_power in metered]
+        # Every reading of a step shares one timestamp, formatted once
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(unix_time))
+        batch.extend(zip(ids, power, itertools.repeat(timestamp)))
+        if len(batch) >= ENERGY_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def create_schema(path):
+    """Create every app table in a new database; the change log is added after the bulk load."""
+    schema.init_db(path)
+    schema.init_tables(path, change_log=False)
+
+
+def generate_fleet(path, devices, mix=None, scenes=None, devices_per_scene=20, schedules=None,
+                   years=1.0, readings_per_day=24, metered=0.1, seed=0):
+    """
+    Write a synthetic fleet database to path, which must not exist.
+
+    Args:
+        devices: Number of devices (ids 1..devices)
+        mix: Device type -> relative weight (default DEFAULT_MIX)
+        scenes: Number of scenes (default devices // 50, at least 4)
+        devices_per_scene: Devices set by each scene
+        schedules: Number of schedules (default devices // 10, at least 4)
+        years: Years of energy_logs history, ending now
+        readings_per_day: Power readings per metered device per day
+        metered: Fraction of devices with a rated power that log readings
+
+    Returns:
+        Dict of row counts per table, file size and seconds taken.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+    started = time.perf_counter()
+    rnd = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    scenes = max(4, devices // 50) if scenes is None else scenes
+    schedules = max(4, devices // 10) if schedules is None else schedules
+
+    create_schema(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        # Bulk load without a journal; the file is discarded if generation fails
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(f'PRAGMA cache_size=-{LOAD_CACHE_KB}')
+        # Building energy_logs indexes once after the load is faster than maintaining them per row
+        energy_indexes = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'energy_logs' AND sql IS NOT NULL"
+        )]
+        conn.execute('BEGIN')
+        for name, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'energy_logs' AND sql IS NOT NULL"
+        ).fetchall():
+            conn.execute(f'DROP INDEX {name}')
+        # Drop the sample devices and scenes so ids start at 1
+        for table in ('devices', 'scenes', 'schedules', 'energy_logs'):
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute("DELETE FROM sqlite_sequence WHERE name IN ('devices', 'scenes', 'schedules', 'energy_logs')")
+
+        types, weights = list(mix), list(mix.values())
+        device_types = rnd.choices(types, weights, k=devices)
+        insert_device = ('INSERT INTO devices (id, name, type, state, value, light_effect, ac_mode, device_mode, '
+                         'battery_level, power_consumption) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+        for offset in range(0, devices, DEVICE_BATCH_SIZE):
+            conn.executemany(insert_device, (
+                device_row(device_id, device_types[device_id - 1], rnd)
+                for device_id in range(offset + 1, min(offset + DEVICE_BATCH_SIZE, devices) + 1)
+            ))
+
+        scene_rows = []
+        for scene_id in range(1, scenes + 1):
+            members = rnd.sample(range(1, devices + 1), min(devices_per_scene, devices))
+            states = {str(device_id): scene_state(device_types[device_id - 1], rnd) for device_id in sorted(members)}
+            scene_rows.append((scene_id, f'Scene {scene_id}', json.dumps(states)))
+        conn.executemany('INSERT INTO scenes (id, name, device_states) VALUES (?, ?, ?)', scene_rows)
+
+        conn.executemany(
+            'INSERT INTO schedules (id, name, device_id, action, time, days, enabled) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((schedule_id, f'Schedule {schedule_id}', rnd.randint(1, devices), rnd.choice(('on', 'off')),
+              f'{rnd.randint(0, 23):02d}:{rnd.choice((0, 15, 30, 45)):02d}',
+              ','.join(day for day in DAYS if rnd.random() < 0.6) or 'Mon', int(rnd.random() < 0.9))
+             for schedule_id in range(1, schedules + 1))
+        )
+
+        metered_devices = [(device_id, RATED_POWER[device_type])
+                           for device_id, device_type in enumerate(device_types, start=1)
+                           if RATED_POWER[device_type] is not None and rnd.random() < metered]
+        step_seconds = max(1, int(86400 / readings_per_day))
+        steps = int(years * 365 * 86400 / step_seconds)
+        end = int(time.time()) // step_seconds * step_seconds
+        energy_rows = 0
+        for batch in energy_batches(metered_devices, end - (steps - 1) * step_seconds, steps, step_seconds, seed):
+            conn.executemany('INSERT INTO energy_logs (device_id, power_consumption, timestamp) VALUES (?, ?, ?)', batch)
+            energy_rows += len(batch)
+        for sql in energy_indexes:
+            conn.execute(sql)
+        conn.execute('COMMIT')
+
+        conn.execute('PRAGMA journal_mode=WAL')
+        replication.init_change_log(conn)
+        conn.execute('ANALYZE')
+    except BaseException:
+        conn.close()
+        os.remove(path)
+        raise
+    conn.close()
+
+    return {
+        'path': path,
+        'devices': devices,
+        'scenes': scenes,
+        'schedules': schedules,
+        'metered_devices': len(metered_devices),
+        'energy_logs': energy_rows,
+        'size_mb': round(os.path.getsize(path) / 1e6, 1),
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic fleet database')
+    parser.add_argument('--devices', type=int, default=1000, help='Number of devices (10 to 1,000,000)')
+    parser.add_argument('--mix', type=parse_mix, help="Device type weights, e.g. 'light=40,sensor=30,plug=30'")
+    parser.add_argument('--scenes', type=int, help='Number of scenes (default devices / 50)')
+    parser.add_argument('--devices-per-scene', type=int, default=20, help='Devices set by each scene')
+    parser.add_argument('--schedules', type=int, help='Number of schedules (default devices / 10)')
+    parser.add_argument('--years', type=float, default=1.0, help='Years of energy_logs history')
+    parser.add_argument('--readings-per-day', type=float, default=24, help='Power readings per metered device per day')
+    parser.add_argument('--metered', type=float, default=0.1, help='Fraction of powered devices that log readings')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output', default='fleet.db', help='Database file to create')
+    args = parser.parse_args()
+
+    stats = generate_fleet(args.output, args.devices, mix=args.mix, scenes=args.scenes,
+                           devices_per_scene=args.devices_per_scene, schedules=args.schedules,
+                           years=args.years, readings_per_day=args.readings_per_day,
+                           metered=args.metered, seed=args.seed)
+    print(f"Wrote {stats['path']} ({stats['size_mb']} MB) in {stats['seconds']}s: "
+          f"{stats['devices']:,} devices, {stats['scenes']:,} scenes, {stats['schedules']:,} schedules, "
+          f"{stats['energy_logs']:,} energy_logs rows from {stats['metered_devices']:,} metered devices")
+    print(f"Serve it with: DATABASE_PATH={stats['path']} python app.py")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Device Groups
+Rooms and groups with a precomputed membership index and batched group commands
+"""
+
+import threading
+
+GROUP_KINDS = ('room', 'group')
+
+# Device columns a group command may change, and the device type each is limited to
+GROUP_COMMAND_FIELDS = {
+    'state': None,
+    'value': None,
+    'device_mode': None,
+    'light_effect': 'light',
+    'ac_mode': 'ac'
+}
+
+# Device IDs bound per UPDATE statement (stays well under SQLite's variable limit)
+UPDATE_CHUNK_SIZE = 500
+
+
+class GroupMembershipIndex:
+    """
+    In-memory group ID -> sorted tuple of device IDs.
+
+    Loaded from group_members on first use and patched by every membership edit,
+    so group commands never have to join against the membership table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = None
+
+    def _ensure_loaded(self, conn):
+        if self._members is not None:
+            return
+        members = {}
+        cursor = conn.execute('SELECT id FROM device_groups')
+        for (group_id,) in cursor.fetchall():
+            members[group_id] = []
+        cursor = conn.execute('SELECT group_id, device_id FROM group_members ORDER BY group_id, device_id')
+        for group_id, device_id in cursor.fetchall():
+            members.setdefault(group_id, []).append(device_id)
+        self._members = {group_id: tuple(ids) for group_id, ids in members.items()}
+
+    def get(self, conn, group_id):
+        """Return the device IDs of a group, or None if the group does not exist."""
+        with self._lock:
+            self._ensure_loaded(conn)
+            return self._members.get(group_id)
+
+    def all(self, conn):
+        """Return a snapshot of the whole index."""
+        with self._lock:
+            self._ensure_loaded(conn)
+            return dict(self._members)
+
+    def set(self, group_id, device_ids):
+        """Record the members of a group after they have been committed."""
+        with self._lock:
+            if self._members is not None:
+                self._members[group_id] = tuple(sorted(set(device_ids)))
+
+    def discard(self, group_id):
+        """Forget a deleted group."""
+        with self._lock:
+            if self._members is not None:
+                self._members.pop(group_id, None)
+
+    def invalidate(self):
+        """Drop the index so it is rebuilt from the database on next use."""
+        with self._lock:
+            self._members = None
+
+
+membership_index = GroupMembershipIndex()
+
+
+def replace_members(cursor, group_id, device_ids):
+    """Replace a group's membership rows; the caller commits."""
+    cursor.execute('DELETE FROM group_members WHERE group_id = ?', (group_id,))
+    cursor.executemany(
+        'INSERT OR IGNORE INTO group_members (group_id, device_id) VALUES (?, ?)',
+        [(group_id, device_id) for device_id in device_ids]
+    )
+
+
+def existing_devices(cursor, device_ids):
+    """Return the given device IDs that exist in the devices table."""
+    found = []
+    for start in range(0, len(device_ids), UPDATE_CHUNK_SIZE):
+        chunk = device_ids[start:start + UPDATE_CHUNK_SIZE]
+        cursor.execute(f'SELECT id FROM devices WHERE id IN ({",".join("?" * len(chunk))}) ORDER BY id', list(chunk))
+        found.extend(row[0] for row in cursor.fetchall())
+    return tuple(found)
+
+
+def filter_members_by_type(cursor, device_ids, device_type):
+    """Return the member device IDs whose type matches."""
+    matched = []
+    for start in range(0, len(device_ids), UPDATE_CHUNK_SIZE):
+        chunk = device_ids[start:start + UPDATE_CHUNK_SIZE]
+        cursor.execute(
+            f'SELECT id FROM devices WHERE id IN ({",".join("?" * len(chunk))}) AND type = ? ORDER BY id',
+            list(chunk) + [device_type]
+        )
+        matched.extend(row[0] for row in cursor.fetchall())
+    return tuple(matched)
+
+
+def apply_group_command(cursor, device_ids, changes):
+    """
+    Apply one set of column changes to many devices; the caller commits.
+
+    Type-restricted fields (light_effect, ac_mode) are guarded with CASE so every
+    chunk of members is updated by a single statement. Members that no change
+    applies to (missing devices, or e.g. a fan when only light_effect is set) are
+    left alone.
+
+    Args:
+        cursor: SQLite cursor inside the caller's transaction
+        device_ids: Member device IDs from the membership index
+        changes: Mapping of GROUP_COMMAND_FIELDS column -> new value
+
+    Returns:
+        List of (device ID, changes that applied to it) for every updated device.
+    """
+    assignments = []
+    values = []
+    for field, value in changes.items():
+        restrict = GROUP_COMMAND_FIELDS[field]
+        if restrict:
+            assignments.append(f'{field} = CASE WHEN type = ? THEN ? ELSE {field} END')
+            values.extend((restrict, value))
+        else:
+            assignments.append(f'{field} = ?')
+            values.append(value)
+    # Only devices at least one change applies to
+    types = {GROUP_COMMAND_FIELDS[field] for field in changes}
+    applies = '' if None in types else f' AND type IN ({",".join("?" * len(types))})'
+    type_params = [] if None in types else sorted(types)
+
+    updated = []
+    for start in range(0, len(device_ids), UPDATE_CHUNK_SIZE):
+        chunk = list(device_ids[start:start + UPDATE_CHUNK_SIZE])
+        where = f'WHERE id IN ({",".join("?" * len(chunk))}){applies}'
+        cursor.execute(f'UPDATE devices SET {", ".join(assignments)} {where}', values + chunk + type_params)
+        # Read back inside the same write transaction, so these are exactly the updated rows
+        cursor.execute(f'SELECT id, type FROM devices {where} ORDER BY id', chunk + type_params)
+        for device_id, device_type in cursor.fetchall():
+            updated.append((device_id, {field: value for field, value in changes.items()
+                                        if GROUP_COMMAND_FIELDS[field] in (None, device_type)}))
+    return updated
@@ -0,0 +1,371 @@
+"""
+Hot Tier
+Shared-memory store for the latest sensor readings, checkpointed to SQLite
+
+Fast-changing readings (sensor values such as temperature, motion detected or not,
+power draw and battery level) are written to a fixed-layout file mapped into every process with
+mmap, instead of costing a SQLite transaction each. The file sits next to the
+database and holds one slot per device, indexed by device id:
+
+    offset  size  type     field
+    0       4     uint32   sequence number (odd while a write is in progress)
+    4       4     uint32   bitmask of the fields holding a reading (see FIELDS)
+    8       8     float64  value
+    16      8     float64  power_consumption
+    24      8     float64  battery_level
+    32      8     float64  state, for on/off readings such as motion (1.0 = 'on')
+    40      8     float64  unix time of the last write
+
+Slots are seqlocks. A writer takes a byte-range lock on the slot (POSIX record locks
+exclude other processes, a threading.Lock other threads), makes the sequence number
+odd, writes the fields and makes it even again. Readers take no locks: they read the
+sequence number, the fields and the sequence number again, and retry if a write was
+in progress or finished in between. Stores reach the mapping in program order on
+x86-64, the platform the dashboard is deployed on.
+
+The process that owns background jobs checkpoints slots written since the previous
+checkpoint to the devices table, in one transaction every CHECKPOINT_INTERVAL
+seconds. Code that writes a hot column with SQL must call discard() for the device
+before committing, so neither the read overlay nor the next checkpoint can bring back
+an older reading.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Try to import fcntl for cross-process slot locks, make it optional (not available on Windows)
+try:
+    import fcntl
+    HOT_TIER_AVAILABLE = True
+except ImportError:
+    HOT_TIER_AVAILABLE = False
+
+# Devices column -> bit in a slot's field mask
+FIELDS = {
+    'value': 1,
+    'power_consumption': 2,
+    'battery_level': 4,
+    'state': 8
+}
+# Columns SQLite stores as INTEGER; readings are rounded like the telemetry gateway does
+INTEGER_FIELDS = ('value', 'battery_level')
+# The states a hot state reading can hold, by slot value; other states are only written with SQL
+STATES = ('off', 'on')
+# Inclusive range of valid readings per column; keeps rounded integers well inside SQLite's INTEGER
+RANGES = {
+    'value': (-1e9, 1e9),
+    'power_consumption': (0.0, 1e9),
+    'battery_level': (0.0, 100.0)
+}
+
+MAGIC = b'HOTTIER2'
+HEADER = struct.Struct('<8sIII')
+HIGH_WATER_OFFSET = 20
+HEADER_SIZE = 64
+SLOT = struct.Struct('<IIddddd')
+SLOT_SIZE = SLOT.size
+UINT32 = struct.Struct('<I')
+WORDS_PER_SLOT = SLOT_SIZE // 4
+
+# Device ids below this get a slot; the file is sparse, so unused slots take no disk
+DEFAULT_CAPACITY = 1 << 20
+# Seconds between checkpoints to SQLite
+CHECKPOINT_INTERVAL = 1.0
+# Attempts at a consistent read before falling back to SQLite, the first READ_SPINS
+# back to back and the rest after yielding the CPU
+READ_RETRIES = 100
+READ_SPINS = 10
+
+
+def path_for(database):
+    """The hot tier file that belongs to a database."""
+    return database + '.hot'
+
+
+def check_range(column, value):
+    """Raise ValueError unless a numeric reading lies in its column's RANGES (NaN never does)."""
+    low, high = RANGES[column]
+    if not low <= value <= high:
+        raise ValueError(f'{column} reading {value!r} is outside {low:g} to {high:g}')
+
+
+def encode(column, value):
+    """Slot value of a reading; raises ValueError for a state other than STATES or an out-of-range number."""
+    if column == 'state':
+        if value not in STATES:
+            raise ValueError(f"hot tier state must be one of {', '.join(STATES)}, not {value!r}")
+        return float(STATES.index(value))
+    value = float(value)
+    check_range(column, value)
+    return value
+
+
+def decode(column, value):
+    """Reading as the devices column stores it; raises ValueError for an out-of-range number."""
+    if column == 'state':
+        return STATES[value != 0]
+    check_range(column, value)
+    if column in INTEGER_FIELDS:
+        return int(round(value))
+    return value
+
+
+class HotTier:
+    """The hot tier file mapped into this process; every method is a no-op until open()."""
+
+    def __init__(self, path, connect=None, capacity=DEFAULT_CAPACITY, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.connect = connect
+        self.capacity = capacity
+        self.interval = interval
+        self._fd = None
+        self._mm = None
+        self._write_lock = threading.Lock()
+        # Sequence number of each slot as of the last checkpoint (checkpointing process only)
+        self._checkpointed = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'checkpoints': 0, 'rows': 0, 'last_checkpoint_at': None, 'last_checkpoint_seconds': None}
+
+    @property
+    def enabled(self):
+        return self._mm is not None
+
+    def open(self):
+        """Map the file, creating or re-initializing it if its layout does not match."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+            try:
+                header = os.pread(fd, HEADER.size, 0)
+                if len(header) == HEADER.size and HEADER.unpack(header)[:2] == (MAGIC, SLOT_SIZE):
+                    self.capacity = HEADER.unpack(header)[2]
+                else:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, HEADER_SIZE + self.capacity * SLOT_SIZE)
+                    os.pwrite(fd, HEADER.pack(MAGIC, SLOT_SIZE, self.capacity, 0), 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+            self._mm = mmap.mmap(fd, HEADER_SIZE + self.capacity * SLOT_SIZE)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return self
+
+    def close(self):
+        self.stop()
+        if self._mm is not None:
+            self._mm.close()
+            os.close(self._fd)
+            self._mm = self._fd = None
+
+    def high_water(self):
+        """One past the highest device id ever written."""
+        return UINT32.unpack_from(self._mm, HIGH_WATER_OFFSET)[0]
+
+    def _raise_high_water(self, device_id):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            if device_id >= self.high_water():
+                UINT32.pack_into(self._mm, HIGH_WATER_OFFSET, device_id + 1)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+
+    def _read_slot(self, device_id):
+        """Consistent (seq, mask, value, power, battery, state, updated_at) of a slot, or None."""
+        mm = self._mm
+        offset = HEADER_SIZE + device_id * SLOT_SIZE
+        for attempt in range(READ_RETRIES):
+            if attempt >= READ_SPINS:
+                # The writer may be descheduled mid-write; give up the CPU
+                time.sleep(0)
+            seq = UINT32.unpack_from(mm, offset)[0]
+            if seq & 1:
+                continue
+            slot = SLOT.unpack_from(mm, offset)
+            if UINT32.unpack_from(mm, offset)[0] == seq == slot[0]:
+                return slot
+        return None
+
+    def read(self, device_id):
+        """Readings held for a device as {column: value}, or None to read SQLite instead."""
+        if self._mm is None or not 0 < device_id < self.high_water():
+            return None
+        slot = self._read_slot(device_id)
+        if slot is None or not slot[1]:
+            return None
+        mask = slot[1]
+        readings = {}
+        for index, (column, bit) in enumerate(FIELDS.items()):
+            if mask & bit:
+                try:
+                    readings[column] = decode(column, slot[2 + index])
+                except ValueError:
+                    # A bad slot value is dropped by the next checkpoint; SQLite has the column
+                    continue
+        return readings or None
+
+    def _update(self, device_id, change):
+        """Apply change(mask, values) -> (mask, values) to a slot under its write locks."""
+        offset = HEADER_SIZE + device_id * SLOT_SIZE
+        mm = self._mm
+        with self._write_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT_SIZE, offset)
+            try:
+                seq, mask, *values = SLOT.unpack_from(mm, offset)
+                # A writer that died mid-write leaves the sequence odd; skip past it either way
+                seq = (seq + 2 if seq & 1 else seq + 1) & 0xFFFFFFFF
+                UINT32.pack_into(mm, offset, seq)
+                mask, values = change(mask, values)
+                SLOT.pack_into(mm, offset, seq, mask, *values)
+                UINT32.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT_SIZE, offset)
+
+    def write(self, device_id, readings, timestamp=None):
+        """
+        Store readings ({column: value} for columns in FIELDS) for a device.
+
+        Returns False when the hot tier is disabled or the device id has no slot, in
+        which case the caller writes SQLite directly. Raises ValueError for a state
+        reading other than 'on' or 'off', or a number outside its column's RANGES.
+        """
+        if self._mm is None or not 0 < device_id < self.capacity:
+            return False
+        timestamp = time.time() if timestamp is None else timestamp
+        encoded = [(index, bit, encode(column, readings[column]))
+                   for index, (column, bit) in enumerate(FIELDS.items()) if column in readings]
+
+        def change(mask, values):
+            for index, bit, value in encoded:
+                values[index] = value
+                mask |= bit
+            values[-1] = timestamp
+            return mask, values
+
+        if device_id >= self.high_water():
+            self._raise_high_water(device_id)
+        self._update(device_id, change)
+        return True
+
+    def discard(self, device_ids, columns=tuple(FIELDS)):
+        """Drop readings of the given columns for devices whose columns were just written with SQL."""
+        if self._mm is None:
+            return
+        bits = sum(FIELDS[column] for column in columns)
+        high_water = self.high_water()
+        for device_id in device_ids:
+            device_id = int(device_id)
+            if 0 < device_id < high_water and UINT32.unpack_from(self._mm, HEADER_SIZE + device_id * SLOT_SIZE + 4)[0] & bits:
+                self._update(device_id, lambda mask, values: (mask & ~bits, values))
+
+    def discard_all(self):
+        if self._mm is not None:
+            self.discard(range(1, self.high_water()))
+
+    def _column(self, high_water, word=0):
+        """One uint32 (0 = sequence number, 1 = field mask) of every slot below high_water."""
+        with memoryview(self._mm) as view, view.cast('I') as words:
+            first = HEADER_SIZE // 4 + word
+            return words[first:first + high_water * WORDS_PER_SLOT:WORDS_PER_SLOT].tolist()
+
+    def checkpoint(self):
+        """Write readings changed since the last checkpoint to the devices table; returns rows written."""
+        if self._mm is None:
+            return 0
+        started = time.perf_counter()
+        conn = self.connect()
+        try:
+            # Take SQLite's write lock first: a SQL writer discards a slot before it
+            # commits, so no slot read below can be older than a committed SQL write
+            conn.execute('BEGIN IMMEDIATE')
+            high_water = self.high_water()
+            checkpointed = self._checkpointed
+            checkpointed.extend([0] * (high_water - len(checkpointed)))
+            updates = {column: [] for column in FIELDS}
+            written = {}
+            bad = []
+            for device_id, seq in enumerate(self._column(high_water)):
+                if seq == checkpointed[device_id]:
+                    continue
+                slot = self._read_slot(device_id)
+                if slot is None:
+                    # Mid-write; the next checkpoint picks it up
+                    continue
+                mask = slot[1]
+                for index, (column, bit) in enumerate(FIELDS.items()):
+                    if mask & bit:
+                        try:
+                            updates[column].append((decode(column, slot[2 + index]), device_id))
+                        except ValueError as e:
+                            # One bad reading must not hold back every other device's
+                            print(f"Warning: dropping hot tier reading of device {device_id}: {e}")
+                            bad.append((device_id, column))
+                written[device_id] = slot[0]
+            for column, rows in updates.items():
+                if rows:
+                    conn.executemany(f'UPDATE devices SET {column} = ? WHERE id = ?', rows)
+            conn.commit()
+        finally:
+            conn.close()
+        for device_id, seq in written.items():
+            checkpointed[device_id] = seq
+        for device_id, column in bad:
+            self.discard([device_id], [column])
+        rows = sum(len(rows) for rows in updates.values())
+        self.stats['checkpoints'] += 1
+        self.stats['rows'] += rows
+        self.stats['last_checkpoint_at'] = time.time()
+        self.stats['last_checkpoint_seconds'] = round(time.perf_counter() - started, 6)
+        return rows
+
+    def start(self):
+        """Checkpoint every interval seconds on a background thread."""
+        if self._mm is None or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='hot-tier-checkpoint', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print(f"Error checkpointing hot tier: {e}")
+            if self._stop.wait(self.interval):
+                break
+        # Final checkpoint so a clean shutdown loses nothing
+        try:
+            self.checkpoint()
+        except Exception as e:
+            print(f"Error checkpointing hot tier: {e}")
+
+    def status(self):
+        if self._mm is None:
+            return {'enabled': False}
+        high_water = self.high_water()
+        checkpointed = self._checkpointed + [0] * (high_water - len(self._checkpointed))
+        pending = sum(seq != done for seq, done in zip(self._column(high_water), checkpointed))
+        status = {
+            'enabled': True,
+            'path': self.path,
+            'capacity': self.capacity,
+            'devices': sum(1 for mask in self._column(high_water, 1) if mask),
+            'checkpointing': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            **self.stats
+        }
+        if status['checkpointing']:
+            status['pending'] = pending
+        return status
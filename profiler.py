@@ -0,0 +1,228 @@
+"""
+Sampling Profiler
+Low-overhead wall-clock profiling of a running process, across all of its threads
+
+A sampler thread wakes every `interval` seconds, reads the current Python stack of
+every thread with sys._current_frames(), and counts identical stacks. Nothing is
+instrumented, so code runs at full speed between samples; the cost is one stack walk
+per thread per sample. Stacks are sampled whether the thread is running or waiting
+(on a lock, a socket or SQLite), which is what matters when diagnosing latency.
+
+Results are exported as collapsed stacks (one 'thread;frame;frame count' line per
+distinct stack, for flamegraph.pl and similar tools) or as speedscope JSON
+(https://www.speedscope.app).
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+# Default and minimum seconds between samples
+DEFAULT_INTERVAL = 0.005
+MIN_INTERVAL = 0.001
+# Longest whole-process profile one request may ask for
+MAX_SECONDS = 60
+# Per-request profiles sample only the request thread, so they can sample faster
+REQUEST_INTERVAL = 0.001
+# Per-request profiles kept for retrieval
+REQUEST_PROFILES_KEPT = 50
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+_ROOTS = sorted({os.path.abspath(path or os.curdir) for path in sys.path}, key=len, reverse=True)
+
+
+def short_path(filename):
+    """Shorten a source path relative to the longest sys.path entry that contains it."""
+    for root in _ROOTS:
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+class Profile:
+    """Stack counts collected by one profiler run."""
+
+    def __init__(self, samples, frames, thread_names, rounds, duration, interval, overhead):
+        # (thread ident, stack of frame indexes from the root) -> samples
+        self.samples = samples
+        # frame index -> (function name, file, first line)
+        self.frames = frames
+        self.thread_names = thread_names
+        self.rounds = rounds
+        self.duration = duration
+        self.interval = interval
+        # Seconds the sampler spent walking stacks
+        self.overhead = overhead
+
+    def thread_name(self, ident):
+        return self.thread_names.get(ident, f'Thread-{ident}')
+
+    def frame_label(self, index):
+        name, filename, line = self.frames[index]
+        return f'{name} ({filename}:{line})'
+
+    def summary(self):
+        threads = Counter()
+        for (ident, _), count in self.samples.items():
+            threads[self.thread_name(ident)] += count
+        return {
+            'duration': round(self.duration, 4),
+            'interval': self.interval,
+            'samples': self.rounds,
+            'overhead': round(self.overhead / self.duration, 4) if self.duration else 0.0,
+            'threads': dict(threads.most_common())
+        }
+
+    def collapsed(self):
+        """Collapsed stacks, heaviest first: 'thread;outer;...;inner count' per line."""
+        lines = []
+        for (ident, stack), count in self.samples.most_common():
+            labels = [self.thread_name(ident).replace(';', ':')]
+            labels.extend(self.frame_label(index).replace(';', ':') for index in stack)
+            lines.append(f"{';'.join(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name='profile'):
+        """Speedscope file with one sampled profile per thread, weighted in seconds."""
+        weight = self.duration / self.rounds if self.rounds else self.interval
+        by_thread = OrderedDict()
+        for (ident, stack), count in self.samples.most_common():
+            profile = by_thread.setdefault(ident, {'samples': [], 'weights': []})
+            profile['samples'].append(list(stack))
+            profile['weights'].append(count * weight)
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'smart-home-dashboard profiler',
+            'activeProfileIndex': 0,
+            'shared': {
+                'frames': [
+                    {'name': function, 'file': filename, 'line': line}
+                    for function, filename, line in self.frames
+                ]
+            },
+            'profiles': [
+                {
+                    'type': 'sampled',
+                    'name': self.thread_name(ident),
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': sum(profile['weights']),
+                    'samples': profile['samples'],
+                    'weights': profile['weights']
+                }
+                for ident, profile in by_thread.items()
+            ]
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples thread stacks from a background thread between start() and stop().
+
+    thread_ids limits sampling to the given threads; by default every thread except
+    the sampler itself is sampled.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, thread_ids=None):
+        self.interval = max(MIN_INTERVAL, interval)
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self._samples = Counter()
+        # code object -> frame index, so each function is labelled once
+        self._frame_index = {}
+        self._frames = []
+        self._thread_names = {}
+        self._rounds = 0
+        self._overhead = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the Profile."""
+        self._stop.set()
+        self._thread.join()
+        self._refresh_thread_names()
+        return Profile(self._samples, self._frames, self._thread_names, self._rounds,
+                       time.perf_counter() - self._started, self.interval, self._overhead)
+
+    def _refresh_thread_names(self):
+        for thread in threading.enumerate():
+            self._thread_names[thread.ident] = thread.name
+
+    def _frame(self, code):
+        index = self._frame_index.get(code)
+        if index is None:
+            index = self._frame_index[code] = len(self._frames)
+            self._frames.append((code.co_name, short_path(code.co_filename), code.co_firstlineno))
+        return index
+
+    def _sample(self, own_ident):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or (self.thread_ids is not None and ident not in self.thread_ids):
+                continue
+            if ident not in self._thread_names:
+                self._refresh_thread_names()
+            stack = []
+            while frame is not None:
+                stack.append(self._frame(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self._samples[(ident, tuple(stack))] += 1
+        self._rounds += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        # Sample right away so even a short request gets a sample
+        while True:
+            started = time.perf_counter()
+            self._sample(own_ident)
+            self._overhead += time.perf_counter() - started
+            if self._stop.wait(self.interval):
+                break
+
+
+def profile_process(seconds, interval=DEFAULT_INTERVAL):
+    """Sample every thread for `seconds` (at most MAX_SECONDS) and return the Profile."""
+    profiler = SamplingProfiler(interval).start()
+    time.sleep(min(max(seconds, 0), MAX_SECONDS))
+    return profiler.stop()
+
+
+class RequestProfiles:
+    """The most recent per-request profiles, by id."""
+
+    def __init__(self, keep=REQUEST_PROFILES_KEPT):
+        self.keep = keep
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, label, profile):
+        profile_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._profiles[profile_id] = (label, time.time(), profile)
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self):
+        with self._lock:
+            entries = list(self._profiles.items())
+        return [
+            {'id': profile_id, 'request': label, 'recorded_at': recorded_at, **profile.summary()}
+            for profile_id, (label, recorded_at, profile) in reversed(entries)
+        ]
@@ -0,0 +1,469 @@
+"""
+Change-Log Replication
+Ships every committed mutation to a warm standby that can serve reads and be promoted
+
+On the primary, triggers on each replicated table append the new row (or the deleted
+row's key) to the change_log table. The log is written in the same transaction as the
+change itself, so it holds exactly the committed mutations, in commit order, sequenced
+by change_log.seq.
+
+A standby is a second local process with its own copy of the database. It starts from
+a consistent snapshot of the primary (taken with the online backup API) and then tails
+change_log, applying each batch of entries together with its position in one transaction.
+The primary's PRAGMA data_version tells the standby when there is something new to read.
+
+energy_logs is append-only and far busier than the other tables, so appended rows are
+not copied into change_log one by one: AUTOINCREMENT ids are assigned in commit order,
+and the standby copies new rows straight from energy_logs by id range in each batch.
+Only rows inserted below the current highest id (e.g. by an import), updates and
+deletes go through the triggers.
+
+The standby records a fingerprint of the primary's table definitions. When it changes
+(a migration added a column, say), the standby copies the database again instead of
+applying entries its tables cannot hold.
+"""
+
+import hashlib
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Tables whose changes are shipped to standbys
+REPLICATED_TABLES = ('devices', 'scenes', 'schedules', 'energy_logs', 'device_groups',
+                     'group_members', 'device_commands', 'cache_versions', 'anomaly_alerts')
+
+# Append-only table shipped by id range instead of per-row change-log entries
+APPEND_ONLY_TABLE = 'energy_logs'
+
+# Seconds between checks of the primary for new entries
+POLL_INTERVAL = 0.01
+# Change-log entries applied per standby transaction
+APPLY_BATCH_SIZE = 5000
+# Seconds of change log kept on the primary; a standby further behind re-copies the database
+CHANGE_LOG_RETENTION = 3600
+PRUNE_INTERVAL = 60
+
+# Current time as fractional Unix seconds, evaluated inside SQLite
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+def table_columns(conn, table):
+    """Return (columns, key columns) of a table; tables without a primary key use rowid."""
+    info = conn.execute(f'PRAGMA table_info({table})').fetchall()
+    columns = [row[1] for row in info]
+    keys = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+    return columns, keys or ['rowid']
+
+
+def json_object_sql(prefix, columns):
+    return 'json_object(' + ', '.join(f"'{column}', {prefix}.{column}" for column in columns) + ')'
+
+
+def drop_change_log_triggers(conn):
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_log_%'"
+    )]
+    for name in names:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def init_change_log(conn):
+    """
+    Create the change_log table and (re)create capture triggers on the replicated tables.
+
+    Triggers are rebuilt on every call so they cover columns added by migrations.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_created_at ON change_log(created_at)')
+    drop_change_log_triggers(conn)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table in REPLICATED_TABLES:
+        if table not in existing:
+            continue
+        columns, keys = table_columns(conn, table)
+        log = f"INSERT INTO change_log (table_name, op, data, created_at) SELECT '{table}'"
+        # Appends are shipped by id range; sqlite_sequence still holds the highest id
+        # from before this statement, so only out-of-order inserts are logged
+        append_only = (f"WHEN NEW.id <= (SELECT seq FROM sqlite_sequence WHERE name = '{table}')"
+                       if table == APPEND_ONLY_TABLE else '')
+        conn.execute(f'''
+            CREATE TRIGGER change_log_{table}_insert AFTER INSERT ON {table} {append_only} BEGIN
+                {log}, 'upsert', {json_object_sql('NEW', columns)}, {NOW_SQL};
+            END
+        ''')
+        # A changed key removes the old row before the new row is written
+        key_changed = ' OR '.join(f'OLD.{key} IS NOT NEW.{key}' for key in keys)
+        conn.execute(f'''
+            CREATE TRIGGER change_log_{table}_update AFTER UPDATE ON {table} BEGIN
+                {log}, 'delete', {json_object_sql('OLD', keys)}, {NOW_SQL} WHERE {key_changed};
+                {log}, 'upsert', {json_object_sql('NEW', columns)}, {NOW_SQL};
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER change_log_{table}_delete AFTER DELETE ON {table} BEGIN
+                {log}, 'delete', {json_object_sql('OLD', keys)}, {NOW_SQL};
+            END
+        ''')
+    conn.commit()
+
+
+def schema_fingerprint(conn):
+    """Hash of the table definitions that change-log entries are applied to."""
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL "
+        "AND name NOT LIKE 'sqlite_%' AND name NOT IN ('change_log', 'replication_state') ORDER BY name"
+    ).fetchall()
+    return hashlib.sha256('\n'.join(f'{name}\t{sql}' for name, sql in rows).encode()).hexdigest()
+
+
+def latest_id(conn, table=APPEND_ONLY_TABLE):
+    row = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def latest_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def prune_change_log(conn, retention=CHANGE_LOG_RETENTION):
+    """Delete entries older than retention seconds; returns the number deleted."""
+    cursor = conn.execute(f'DELETE FROM change_log WHERE created_at < {NOW_SQL} - ?', (retention,))
+    conn.commit()
+    return cursor.rowcount
+
+
+def start_pruner(connect, retention=CHANGE_LOG_RETENTION, interval=PRUNE_INTERVAL):
+    """Prune the primary's change log periodically in a background thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                conn = connect()
+                try:
+                    prune_change_log(conn, retention)
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Error pruning change log: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+class _ResyncNeeded(Exception):
+    """The standby is behind the oldest change the primary still keeps, or its schema changed."""
+
+
+class Standby:
+    """Keeps a local copy of the primary database current by tailing its change log."""
+
+    def __init__(self, primary, database, poll_interval=POLL_INTERVAL, batch_size=APPLY_BATCH_SIZE):
+        self.primary = primary
+        self.database = database
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.running = False
+        self.promoted = False
+        self.applied_seq = 0
+        # Highest APPEND_ONLY_TABLE id copied so far
+        self.applied_id = 0
+        # Fingerprint of the primary's tables when this copy was taken
+        self.schema = None
+        self.applied_total = 0
+        self.resyncs = 0
+        # Seconds between an entry's commit on the primary and its apply here
+        self.last_apply_delay = 0.0
+        self.max_apply_delay = 0.0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect_primary(self):
+        conn = sqlite3.connect(f'file:{self.primary}?mode=ro', uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _connect_standby(self):
+        return sqlite3.connect(self.database, timeout=30)
+
+    def is_initialized(self):
+        if not os.path.exists(self.database):
+            return False
+        conn = self._connect_standby()
+        try:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'replication_state'"
+            ).fetchone() is not None
+        finally:
+            conn.close()
+
+    def bootstrap(self):
+        """
+        Copy a consistent snapshot of the primary into the standby database.
+
+        The snapshot includes the primary's change log, so the last sequence number
+        in it is exactly the position to resume tailing from.
+        """
+        source = sqlite3.connect(self.primary, timeout=30)
+        target = self._connect_standby()
+        try:
+            source.backup(target)
+            if not target.execute("SELECT 1 FROM sqlite_master WHERE name = 'change_log'").fetchone():
+                raise RuntimeError(f'{self.primary} has no change log; start the primary with this version first')
+            seq = latest_seq(target)
+            applied_id = latest_id(target)
+            schema = schema_fingerprint(target)
+            # Entries are only captured on the primary
+            drop_change_log_triggers(target)
+            target.execute('DELETE FROM change_log')
+            target.execute('DROP TABLE IF EXISTS replication_state')
+            target.execute('CREATE TABLE replication_state (id INTEGER PRIMARY KEY CHECK (id = 1), '
+                           'seq INTEGER NOT NULL, applied_id INTEGER NOT NULL, schema TEXT NOT NULL)')
+            target.execute('INSERT INTO replication_state (id, seq, applied_id, schema) VALUES (1, ?, ?, ?)',
+                           (seq, applied_id, schema))
+            target.commit()
+        finally:
+            target.close()
+            source.close()
+        self.applied_seq, self.applied_id, self.schema = seq, applied_id, schema
+        print(f"Standby copied from {self.primary} at change {seq}")
+
+    def stored_position(self):
+        """
+        (seq, applied_id, schema) recorded in the standby database (shared by all
+        worker processes), or None for a copy taken by an older version.
+        """
+        conn = self._connect_standby()
+        try:
+            return conn.execute('SELECT seq, applied_id, schema FROM replication_state WHERE id = 1').fetchone()
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+
+    def primary_schema(self):
+        conn = self._connect_primary()
+        try:
+            return schema_fingerprint(conn)
+        finally:
+            conn.close()
+
+    def is_promoted_copy(self):
+        """A promoted standby keeps its data and change log but no replication position."""
+        if not os.path.exists(self.database):
+            return False
+        conn = self._connect_standby()
+        try:
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'change_log'").fetchone() is not None
+        finally:
+            conn.close()
+
+    def bootstrap_if_needed(self):
+        if self.is_initialized():
+            position = self.stored_position()
+            if position is not None and position[2] == self.primary_schema():
+                self.applied_seq, self.applied_id, self.schema = position
+            else:
+                # The primary's tables changed while this standby was down
+                print(f"Standby schema differs from {self.primary}; re-copying")
+                self.bootstrap()
+        elif self.is_promoted_copy():
+            # Never overwrite writes accepted after a promotion with a fresh copy
+            raise RuntimeError(f'{self.database} was promoted to primary; unset STANDBY_OF to run it as one')
+        else:
+            self.bootstrap()
+
+    def start(self):
+        """Start tailing the primary; only one process per standby database may do this."""
+        if self.running or self.promoted:
+            return
+        if not self.is_initialized():
+            print(f"Warning: {self.database} is not a bootstrapped standby. Not replicating.")
+            return
+        position = self.stored_position()
+        if position is None:
+            print(f"Warning: {self.database} was copied by an older version. Not replicating.")
+            return
+        self.applied_seq, self.applied_id, self.schema = position
+        self.running = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print(f"Standby replicating from {self.primary}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.running = False
+
+    def _run(self):
+        primary = standby = None
+        data_version = schema_version = None
+        while not self._stop.is_set():
+            try:
+                if primary is None:
+                    primary = self._connect_primary()
+                    standby = self._connect_standby()
+                    data_version = schema_version = None
+                current_schema = primary.execute('PRAGMA schema_version').fetchone()[0]
+                if current_schema != schema_version:
+                    # schema_version also moves when triggers are rebuilt; only a change
+                    # to the tables themselves needs a fresh copy
+                    if schema_fingerprint(primary) != self.schema:
+                        raise _ResyncNeeded('primary schema changed')
+                    schema_version = current_schema
+                current = primary.execute('PRAGMA data_version').fetchone()[0]
+                if current != data_version:
+                    # Drain everything committed so far before waiting again
+                    while self.apply_batch(primary, standby) == self.batch_size:
+                        pass
+                    data_version = current
+                self.last_error = None
+            except _ResyncNeeded as e:
+                # Entries we still needed were pruned, or the tables changed; start over
+                print(f"Standby needs a fresh copy ({e}); re-copying")
+                for conn in (primary, standby):
+                    conn.close()
+                primary = standby = None
+                self.bootstrap()
+                self.resyncs += 1
+                continue
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error applying change log: {e}")
+                for conn in (primary, standby):
+                    if conn is not None:
+                        conn.close()
+                primary = standby = None
+                self._stop.wait(1)
+                continue
+            self._stop.wait(self.poll_interval)
+        for conn in (primary, standby):
+            if conn is not None:
+                conn.close()
+
+    def apply_batch(self, primary, standby):
+        """
+        Apply the next batch of change-log entries and appended APPEND_ONLY_TABLE rows.
+
+        Returns the larger of the two counts, so callers drain until both are short.
+        """
+        # Both are read from one snapshot of the primary
+        primary.execute('BEGIN')
+        try:
+            rows = primary.execute(
+                'SELECT seq, table_name, op, data, created_at FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+                (self.applied_seq, self.batch_size)
+            ).fetchall()
+            appended = primary.execute(
+                f'SELECT * FROM {APPEND_ONLY_TABLE} WHERE id > ? ORDER BY id LIMIT ?',
+                (self.applied_id, self.batch_size)
+            ).fetchall()
+        finally:
+            primary.execute('COMMIT')
+        if not rows and not appended:
+            return 0
+        if rows and rows[0]['seq'] != self.applied_seq + 1:
+            raise _ResyncNeeded(f"standby at change {self.applied_seq}, oldest kept is {rows[0]['seq']}")
+
+        statements = {}
+        standby.execute('BEGIN IMMEDIATE')
+        try:
+            for row in rows:
+                table = row['table_name']
+                data = json.loads(row['data'])
+                names = list(data)
+                if row['op'] == 'upsert':
+                    key = (table, tuple(names))
+                    sql = statements.get(key)
+                    if sql is None:
+                        sql = statements[key] = (f'INSERT OR REPLACE INTO {table} ({", ".join(names)}) '
+                                              f'VALUES ({", ".join("?" * len(names))})')
+                    standby.execute(sql, [data[name] for name in names])
+                else:
+                    where = ' AND '.join(f'{name} = ?' for name in names)
+                    standby.execute(f'DELETE FROM {table} WHERE {where}', [data[name] for name in names])
+            if appended:
+                names = appended[0].keys()
+                standby.executemany(
+                    f'INSERT OR REPLACE INTO {APPEND_ONLY_TABLE} ({", ".join(names)}) '
+                    f'VALUES ({", ".join("?" * len(names))})',
+                    [tuple(row) for row in appended]
+                )
+            seq = rows[-1]['seq'] if rows else self.applied_seq
+            applied_id = appended[-1]['id'] if appended else self.applied_id
+            standby.execute('UPDATE replication_state SET seq = ?, applied_id = ? WHERE id = 1', (seq, applied_id))
+            standby.commit()
+        except Exception:
+            standby.rollback()
+            raise
+
+        self.applied_seq, self.applied_id = seq, applied_id
+        self.applied_total += len(rows) + len(appended)
+        if rows:
+            self.last_apply_delay = max(0.0, time.time() - rows[-1]['created_at'])
+            self.max_apply_delay = max(self.max_apply_delay, self.last_apply_delay)
+        return max(len(rows), len(appended))
+
+    def status(self):
+        """Replication position and lag relative to the primary."""
+        status = {
+            'role': 'primary' if self.promoted else 'standby',
+            'primary': self.primary,
+            'running': self.running,
+            'applied_seq': self.applied_seq,
+            'applied_id': self.applied_id,
+            'applied_total': self.applied_total,
+            'resyncs': self.resyncs,
+            'last_apply_delay': round(self.last_apply_delay, 4),
+            'max_apply_delay': round(self.max_apply_delay, 4),
+            'last_error': self.last_error
+        }
+        if self.promoted:
+            return status
+        try:
+            if not self.running:
+                # Another worker process is tailing; read its position
+                position = self.stored_position()
+                if position is not None:
+                    status['applied_seq'], status['applied_id'] = position[0], position[1]
+            conn = self._connect_primary()
+            try:
+                status['primary_seq'] = latest_seq(conn)
+                status['primary_id'] = latest_id(conn)
+                pending = conn.execute(
+                    'SELECT created_at FROM change_log WHERE seq > ? ORDER BY seq LIMIT 1', (status['applied_seq'],)
+                ).fetchone()
+            finally:
+                conn.close()
+            status['pending'] = status['primary_seq'] - status['applied_seq']
+            status['pending_appended'] = status['primary_id'] - status['applied_id']
+            # Age of the oldest change not yet applied (0 when caught up)
+            status['lag_seconds'] = round(max(0.0, time.time() - pending['created_at']), 4) if pending else 0.0
+        except sqlite3.Error as e:
+            status['error'] = str(e)
+        return status
+
+    def promote(self):
+        """Stop tailing and turn this copy into a primary that captures its own changes."""
+        self.stop()
+        conn = self._connect_standby()
+        try:
+            init_change_log(conn)
+            conn.execute('DROP TABLE IF EXISTS replication_state')
+            conn.commit()
+        finally:
+            conn.close()
+        self.promoted = True
@@ -0,0 +1,257 @@
+"""
+Database Schema
+Table definitions and sample data, shared by the app and offline tools
+
+Every function takes the database path and opens its own connection, so the schema
+can be created without importing app.py (which starts background jobs on import).
+"""
+
+import json
+import sqlite3
+
+import anomaly
+import replication
+
+# Accepted light effects and AC modes
+VALID_LIGHT_EFFECTS = ['vivid', 'natural', 'warm', 'cool', 'dim', 'bright']
+VALID_AC_MODES = ['cool', 'heat', 'fan', 'auto']
+
+
+def init_journal_mode(conn):
+    """Use write-ahead logging so readers (API requests, backups) do not block writers."""
+    conn.execute('PRAGMA journal_mode=WAL')
+
+
+def init_device_indexes(cursor):
+    """Create indexes used by filtered device listings."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_type ON devices(type, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_state ON devices(state, id)')
+
+
+def init_db(database):
+    """Initialize the database with the devices table and sample data."""
+    conn = sqlite3.connect(database)
+    init_journal_mode(conn)
+    cursor = conn.cursor()
+    
+    # Create devices table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            state TEXT NOT NULL,
+            value INTEGER,
+            light_effect TEXT DEFAULT 'natural',
+            ac_mode TEXT DEFAULT 'cool',
+            device_mode TEXT,
+            battery_level INTEGER,
+            power_consumption REAL
+        )
+    ''')
+    
+    # Check and add columns if they don't exist
+    cursor.execute("PRAGMA table_info(devices)")
+    columns = [column[1] for column in cursor.fetchall()]
+    column_additions = {
+        'light_effect': 'TEXT DEFAULT "natural"',
+        'ac_mode': 'TEXT DEFAULT "cool"',
+        'device_mode': 'TEXT',
+        'battery_level': 'INTEGER',
+        'power_consumption': 'REAL'
+    }
+    for col_name, col_def in column_additions.items():
+        if col_name not in columns:
+            cursor.execute(f'ALTER TABLE devices ADD COLUMN {col_name} {col_def}')
+    
+    init_device_indexes(cursor)
+    
+    # Insert sample data - all 15 devices
+    sample_devices = [
+        ('Light', 'light', 'off', None, 'natural', None, None, None, None),
+        ('Fan', 'fan', 'off', 0, None, None, None, None, None),
+        ('Temperature', 'sensor', 'on', 26, None, None, None, None, None),
+        ('Air Conditioner', 'ac', 'off', 24, None, 'cool', None, None, None),
+        ('Smart Lock', 'lock', 'locked', None, None, None, 'locked', None, None),
+        ('Smart Blinds', 'blinds', 'closed', 0, None, None, None, None, None),
+        ('Smart Plug', 'plug', 'off', None, None, None, None, None, 0.0),
+        ('Security Camera', 'camera', 'off', None, None, None, 'idle', None, None),
+        ('Smart Speaker', 'speaker', 'off', 50, None, None, 'bluetooth', None, None),
+        ('Garage Door', 'garage', 'closed', None, None, None, 'closed', None, None),
+        ('Smart Thermostat', 'thermostat', 'off', 22, None, None, 'auto', None, None),
+        ('Smart Vacuum', 'vacuum', 'off', None, None, None, 'auto', 85, None),
+        ('Smart Doorbell', 'doorbell', 'on', None, None, None, 'idle', 90, None),
+        ('Smart Sprinkler', 'sprinkler', 'off', None, None, None, 'zone1', None, None),
+        ('Motion Sensor', 'motion', 'on', None, None, None, None, None, None),
+        ('Smart TV', 'tv', 'off', 30, None, None, 'hdmi1', None, None)
+    ]
+    
+    # Check if devices already exist
+    cursor.execute('SELECT COUNT(*) FROM devices')
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany('''
+            INSERT INTO devices (name, type, state, value, light_effect, ac_mode, device_mode, battery_level, power_consumption)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', sample_devices)
+    
+    conn.commit()
+    conn.close()
+
+
+def init_scenes_table(database):
+    """Initialize scenes table for scene control."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scenes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            device_states TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Insert default scenes if they don't exist
+    cursor.execute('SELECT COUNT(*) FROM scenes')
+    if cursor.fetchone()[0] == 0:
+        default_scenes = [
+            ('Good Morning', json.dumps({'1': {'state': 'on'}, '6': {'state': 'open', 'value': 100}, '4': {'state': 'off'}})),
+            ('Movie Night', json.dumps({'1': {'state': 'on', 'light_effect': 'dim'}, '16': {'state': 'on'}, '4': {'state': 'off'}})),
+            ('Away', json.dumps({'1': {'state': 'off'}, '2': {'state': 'off'}, '4': {'state': 'off'}, '5': {'state': 'locked'}, '8': {'state': 'on', 'device_mode': 'recording'}})),
+            ('Sleep', json.dumps({'1': {'state': 'off'}, '2': {'state': 'off'}, '4': {'state': 'off'}, '6': {'state': 'closed', 'value': 0}}))
+        ]
+        cursor.executemany('INSERT INTO scenes (name, device_states) VALUES (?, ?)', default_scenes)
+    
+    conn.commit()
+    conn.close()
+
+
+def init_schedules_table(database):
+    """Initialize schedules table for automation."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            device_id INTEGER,
+            action TEXT NOT NULL,
+            time TEXT NOT NULL,
+            days TEXT NOT NULL,
+            enabled INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def init_energy_table(database):
+    """Initialize energy monitoring table."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS energy_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER,
+            power_consumption REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Range scans for energy reports filter on timestamp
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_energy_logs_timestamp ON energy_logs(timestamp)')
+    conn.commit()
+    conn.close()
+
+
+def init_groups_table(database):
+    """Initialize room/group tables for group commands."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'group',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS group_members (
+            group_id INTEGER NOT NULL,
+            device_id INTEGER NOT NULL,
+            PRIMARY KEY (group_id, device_id)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def init_commands_table(database):
+    """Initialize the table tracking command delivery to physical devices."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Undelivered commands are requeued on startup
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_device_commands_status ON device_commands(status, id)')
+    conn.commit()
+    conn.close()
+
+
+def init_cache_versions_table(database):
+    """Initialize the named cache versions watched by every worker process."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def init_anomaly_table(database):
+    """Initialize the table of anomaly alerts raised by the streaming detector."""
+    conn = sqlite3.connect(database)
+    anomaly.init_alerts_table(conn)
+    conn.close()
+
+
+def init_change_log_table(database):
+    """Initialize the replication change log and its capture triggers."""
+    conn = sqlite3.connect(database)
+    replication.init_change_log(conn)
+    conn.close()
+
+
+def init_tables(database, change_log=True):
+    """
+    Create every table other than devices, with default rows where the app has them.
+
+    Args:
+        database: Path to the SQLite database
+        change_log: Also create the replication change log and its capture triggers
+    """
+    init_scenes_table(database)
+    init_schedules_table(database)
+    init_energy_table(database)
+    init_groups_table(database)
+    init_commands_table(database)
+    init_cache_versions_table(database)
+    init_anomaly_table(database)
+    if change_log:
+        init_change_log_table(database)
@@ -38,27 +38,72 @@ async function loadDevices() {
     }
 }
 
-// Render devices in the UI
+// Rendered device cards by device ID: { col, card, renderedState }
+const deviceCards = new Map();
+
+// Render devices in the UI, reconciling by device ID so unchanged cards are left alone
 function renderDevices(devices) {
     const container = document.getElementById('devices-container');
     if (!container) return;
-    
-    container.innerHTML = '';
+
+    markRender('render-devices-start');
+    const seen = new Set();
+    let previous = null;
 
     devices.forEach(device => {
         const config = deviceConfig[device.id];
         if (!config) return;
+        seen.add(device.id);
+
+        const renderedState = JSON.stringify(device);
+        let entry = deviceCards.get(device.id);
+        if (!entry) {
+            // New device: build the card and its listeners once
+            const col = createDeviceCard(device, config);
+            entry = { col, card: col.querySelector('.device-card'), renderedState };
+            deviceCards.set(device.id, entry);
+        } else if (entry.renderedState !== renderedState && !entry.card.classList.contains('loading')) {
+            // Changed device: patch the existing card (skipped while a user action is in flight)
+            updateDeviceCard(entry.card, device);
+            entry.renderedState = renderedState;
+        }
+
+        // Keep cards in list order, moving only those that are out of place
+        const expected = previous ? previous.nextSibling : container.firstChild;
+        if (entry.col !== expected) {
+            container.insertBefore(entry.col, expected);
+        }
+        previous = entry.col;
+    });
 
-        const card = createDeviceCard(device, config);
-        container.appendChild(card);
+    // Removed devices
+    deviceCards.forEach((entry, deviceId) => {
+        if (!seen.has(deviceId)) {
+            entry.col.remove();
+            deviceCards.delete(deviceId);
+        }
     });
+
+    markRender('render-devices-end');
+    measureRender('render-devices', 'render-devices-start', 'render-devices-end');
 }
 
-// Create device card element
-function createDeviceCard(device, config) {
-    const col = document.createElement('div');
-    col.className = 'col-6 col-md-4';
+// Performance marks around renders (visible in DevTools > Performance)
+function markRender(name) {
+    if (window.performance && performance.mark) performance.mark(name);
+}
 
+function measureRender(name, startMark, endMark) {
+    if (!window.performance || !performance.measure) return;
+    // Keep only the latest entries so a dashboard left open does not grow the timeline buffer
+    performance.clearMeasures(name);
+    performance.measure(name, startMark, endMark);
+    performance.clearMarks(startMark);
+    performance.clearMarks(endMark);
+}
+
+// Compute the text and style class shown in a device card's state display
+function getDeviceStateDisplay(device) {
     const isOn = device.state === 'on';
     let stateDisplay = 'OFF';
     let stateClass = 'off';
@@ -113,6 +158,31 @@ function createDeviceCard(device, config) {
         stateClass = isOn ? 'on' : 'off';
     }
 
+    return { stateDisplay, stateClass };
+}
+
+// Label for a device's toggle button, matching createControls
+function getToggleLabel(device, type) {
+    if (type === 'lock') {
+        return (device.state === 'locked' || device.device_mode === 'locked') ? 'Unlock' : 'Lock';
+    } else if (type === 'garage') {
+        return (device.state === 'open' || device.device_mode === 'open') ? 'Close' : 'Open';
+    } else if (type === 'blinds') {
+        return device.state === 'open' ? 'Close' : 'Open';
+    } else if (type === 'vacuum' || type === 'sprinkler') {
+        return device.state === 'on' ? 'Stop' : 'Start';
+    }
+    return device.state === 'on' ? 'Turn Off' : 'Turn On';
+}
+
+// Create device card element
+function createDeviceCard(device, config) {
+    const col = document.createElement('div');
+    col.className = 'col-6 col-md-4';
+
+    const isOn = device.state === 'on';
+    const { stateDisplay, stateClass } = getDeviceStateDisplay(device);
+
     // Add active class for devices when on/active
     const activeTypes = ['light', 'fan', 'sensor', 'ac', 'lock', 'blinds', 'plug', 'camera', 'speaker', 'garage', 'thermostat', 'vacuum', 'doorbell', 'sprinkler', 'motion', 'tv'];
     const isActive = (config.type === 'lock' && (device.state === 'locked' || device.device_mode === 'locked')) ||
@@ -237,7 +307,7 @@ function createControls(device, config) {
                 ${isLocked ? 'Unlock' : 'Lock'}
             </button>
             <div class="device-info mt-2">
-                <small class="text-muted">Status: ${isLocked ? 'Locked' : 'Unlocked'}</small>
+                <small class="text-muted">Status: <span class="status-value">${isLocked ? 'Locked' : 'Unlocked'}</span></small>
             </div>
         `;
     } else if (config.type === 'blinds') {
@@ -265,7 +335,7 @@ function createControls(device, config) {
                 ${device.state === 'on' ? 'Turn Off' : 'Turn On'}
             </button>
             <div class="power-info mt-2">
-                <small class="text-muted">Power: ${power.toFixed(1)}W</small>
+                <small class="text-muted">Power: <span class="power-value">${power.toFixed(1)}W</span></small>
             </div>
         `;
     } else if (config.type === 'camera') {
@@ -325,7 +395,7 @@ function createControls(device, config) {
                 ${isOpen ? 'Close' : 'Open'}
             </button>
             <div class="device-info mt-2">
-                <small class="text-muted">Status: ${isOpen ? 'Open' : 'Closed'}</small>
+                <small class="text-muted">Status: <span class="status-value">${isOpen ? 'Open' : 'Closed'}</span></small>
             </div>
         `;
     } else if (config.type === 'thermostat') {
@@ -372,7 +442,7 @@ function createControls(device, config) {
             </button>
             <div class="vacuum-controls mt-2">
                 <div class="battery-info mb-2">
-                    <small class="text-muted">Battery: ${battery}%</small>
+                    <small class="text-muted">Battery: <span class="battery-value">${battery}%</span></small>
                 </div>
                 <div class="mode-section">
                     <div class="mode-label mb-1">Mode:</div>
@@ -394,7 +464,7 @@ function createControls(device, config) {
         return `
             <div class="doorbell-controls">
                 <div class="battery-info mb-2">
-                    <small class="text-muted">Battery: ${battery}%</small>
+                    <small class="text-muted">Battery: <span class="battery-value">${battery}%</span></small>
                 </div>
                 <button class="btn btn-control btn-doorbell" data-action="toggle-motion">
                     Motion: ${motionDetected ? 'On' : 'Off'}
@@ -430,7 +500,7 @@ function createControls(device, config) {
         const motionDetected = device.state === 'on';
         return `
             <div class="text-center text-muted">
-                <small>Motion: ${motionDetected ? 'Detected' : 'No Motion'}</small>
+                <small>Motion: <span class="motion-value">${motionDetected ? 'Detected' : 'No Motion'}</span></small>
             </div>
         `;
     } else if (config.type === 'tv') {
@@ -1270,15 +1340,7 @@ function updateDeviceCard(card, device) {
     if (!config) return;
 
     const isOn = device.state === 'on';
-    const stateDisplay = device.type === 'sensor' 
-        ? `${device.value}°C` 
-        : (device.type === 'fan' && device.value !== null 
-            ? `${device.value}%` 
-            : (isOn ? 'ON' : 'OFF'));
-
-    const stateClass = device.type === 'sensor' || (device.type === 'fan' && device.value !== null)
-        ? 'number'
-        : (isOn ? 'on' : 'off');
+    const { stateDisplay, stateClass } = getDeviceStateDisplay(device);
 
     // Update active class for icon animations
     const activeTypes = ['light', 'fan', 'sensor', 'ac', 'lock', 'blinds', 'plug', 'camera', 'speaker', 'garage', 'thermostat', 'vacuum', 'doorbell', 'sprinkler', 'motion', 'tv'];
@@ -1312,7 +1374,7 @@ function updateDeviceCard(card, device) {
     // Update toggle button text
     const toggleBtn = card.querySelector('[data-action="toggle"]');
     if (toggleBtn) {
-        toggleBtn.textContent = isOn ? 'Turn Off' : 'Turn On';
+        toggleBtn.textContent = getToggleLabel(device, config.type);
     }
 
     // Update light effect buttons
@@ -1410,20 +1472,41 @@ function updateDeviceCard(card, device) {
         }
     }
 
-    // Update lock/garage toggle button
-    if (config.type === 'lock') {
-        const toggleBtn = card.querySelector('[data-action="toggle"]');
-        if (toggleBtn) {
-            const isLocked = device.state === 'locked' || device.device_mode === 'locked';
-            toggleBtn.textContent = isLocked ? 'Unlock' : 'Lock';
+    // Update lock/garage status text
+    if (config.type === 'lock' || config.type === 'garage') {
+        const statusValue = card.querySelector('.status-value');
+        if (statusValue) {
+            if (config.type === 'lock') {
+                const isLocked = device.state === 'locked' || device.device_mode === 'locked';
+                statusValue.textContent = isLocked ? 'Locked' : 'Unlocked';
+            } else {
+                const isOpen = device.state === 'open' || device.device_mode === 'open';
+                statusValue.textContent = isOpen ? 'Open' : 'Closed';
+            }
+        }
+    }
+
+    // Update plug power
+    if (config.type === 'plug') {
+        const powerValue = card.querySelector('.power-value');
+        if (powerValue) {
+            powerValue.textContent = `${(device.power_consumption || 0).toFixed(1)}W`;
         }
     }
 
-    if (config.type === 'garage') {
-        const toggleBtn = card.querySelector('[data-action="toggle"]');
-        if (toggleBtn) {
-            const isOpen = device.state === 'open' || device.device_mode === 'open';
-            toggleBtn.textContent = isOpen ? 'Close' : 'Open';
+    // Update vacuum/doorbell battery
+    if (config.type === 'vacuum' || config.type === 'doorbell') {
+        const batteryValue = card.querySelector('.battery-value');
+        if (batteryValue) {
+            batteryValue.textContent = `${device.battery_level || 0}%`;
+        }
+    }
+
+    // Update motion sensor line
+    if (config.type === 'motion') {
+        const motionValue = card.querySelector('.motion-value');
+        if (motionValue) {
+            motionValue.textContent = isOn ? 'Detected' : 'No Motion';
         }
     }
 }
@@ -1532,12 +1615,39 @@ function renderEnergyData(data) {
     `;
 }
 
+// Record when devices, scenes and energy data are first on screen (see DevTools > Performance)
+function markDashboardInteractive() {
+    if (!window.performance || !performance.mark) return;
+    performance.mark('dashboard-interactive');
+    // Time from navigation start to the mark
+    if (performance.measure) performance.measure('dashboard-time-to-interactive', undefined, 'dashboard-interactive');
+}
+
+// Read the snapshot the server embedded in the page, if any
+function readInitialSnapshot() {
+    const element = document.getElementById('initial-snapshot');
+    if (!element) return null;
+    try {
+        return JSON.parse(element.textContent);
+    } catch (error) {
+        console.error('Error reading initial snapshot:', error);
+        return null;
+    }
+}
+
 // Initialize dashboard when DOM is loaded
 document.addEventListener('DOMContentLoaded', () => {
-    // Load devices immediately
-    loadDevices();
-    loadScenes();
-    loadEnergyData();
+    const snapshot = readInitialSnapshot();
+    if (snapshot) {
+        // Render the embedded snapshot on first paint; later updates come from the API
+        renderDevices(snapshot.devices);
+        renderScenes(snapshot.scenes);
+        renderEnergyData(snapshot.energy);
+        markDashboardInteractive();
+    } else {
+        // Load devices immediately
+        Promise.all([loadDevices(), loadScenes(), loadEnergyData()]).then(markDashboardInteractive);
+    }
     
     // Refresh device states every 2 seconds
     setInterval(loadDevices, 2000);
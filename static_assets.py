@@ -0,0 +1,182 @@
+"""
+Static Asset Pipeline
+Fingerprinted, precompressed static files, a cached index page and compressed API responses
+
+At startup every file under static/ is read once, hashed and compressed (gzip, plus
+brotli when installed). Files are served from memory under content-hashed URLs such as
+/assets/css/style.3f2a9c1b7d4e.css, so browsers can cache them forever: a changed file
+gets a new URL. No build step is needed; restarting the app picks up edited files.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import namedtuple
+
+# Try to import brotli, make it optional
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    print("Warning: brotli not installed. Assets will be served with gzip only. Install with: pip install brotli")
+
+ASSET_URL_PREFIX = '/assets'
+# Fingerprinted URLs never change content, so they can be cached for a year
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Length of the content hash embedded in asset file names
+FINGERPRINT_LENGTH = 12
+
+# Bodies smaller than this gain little from compression
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Precompressed assets use the slowest, smallest settings; per-response compression stays cheap
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+RESPONSE_GZIP_LEVEL = 5
+
+Asset = namedtuple('Asset', ['mimetype', 'etag', 'bodies'])
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def accepted_encodings(accept_encoding):
+    """Return the content codings a client accepts from its Accept-Encoding header."""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        params = params.replace(' ', '')
+        if params.startswith('q=') and params[2:] in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+def choose_encoding(accept_encoding, available):
+    """Pick the best available coding (brotli, then gzip) the client accepts, or 'identity'."""
+    accepted = accepted_encodings(accept_encoding)
+    for coding in ('br', 'gzip'):
+        if coding in available and (coding in accepted or '*' in accepted):
+            return coding
+    return 'identity'
+
+
+def compress(data, level=STATIC_GZIP_LEVEL):
+    """Return {coding: body} with every compressed variant that is smaller than data."""
+    bodies = {'identity': data}
+    gzipped = gzip.compress(data, compresslevel=level, mtime=0)
+    if len(gzipped) < len(data):
+        bodies['gzip'] = gzipped
+    if BROTLI_AVAILABLE:
+        compressed = brotli.compress(data, quality=STATIC_BROTLI_QUALITY)
+        if len(compressed) < len(data):
+            bodies['br'] = compressed
+    return bodies
+
+
+def fingerprinted_name(filename, digest):
+    """Insert a content hash before the extension: css/style.css -> css/style.<hash>.css"""
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest[:FINGERPRINT_LENGTH]}{ext}'
+
+
+class AssetManifest:
+    """In-memory table of fingerprinted, precompressed static files."""
+
+    def __init__(self, static_folder, static_url_path='/static', url_prefix=ASSET_URL_PREFIX):
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path
+        self.url_prefix = url_prefix
+        # Logical file name -> fingerprinted URL
+        self.urls = {}
+        # Fingerprinted file name -> Asset
+        self.assets = {}
+
+    def build(self):
+        """Read, hash and compress every file in the static folder."""
+        urls = {}
+        assets = {}
+        for directory, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(directory, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                bodies = compress(data) if is_compressible(mimetype) else {'identity': data}
+                fingerprinted = fingerprinted_name(filename, digest)
+                assets[fingerprinted] = Asset(mimetype, digest[:FINGERPRINT_LENGTH], bodies)
+                urls[filename] = f'{self.url_prefix}/{fingerprinted}'
+        self.urls, self.assets = urls, assets
+        return self
+
+    def url(self, filename):
+        """Fingerprinted URL of a static file; falls back to the plain static URL."""
+        return self.urls.get(filename) or f'{self.static_url_path}/{filename}'
+
+    def get(self, fingerprinted, accept_encoding):
+        """Return (asset, coding, body) for a fingerprinted file name, or None."""
+        asset = self.assets.get(fingerprinted)
+        if asset is None:
+            return None
+        coding = choose_encoding(accept_encoding, asset.bodies)
+        return asset, coding, asset.bodies[coding]
+
+
+class PageCache:
+    """Rendered HTML pages kept in memory with a precompressed gzip variant."""
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, render, version=None):
+        """
+        Return (etag, {coding: body}) for a page, calling render() on a miss.
+
+        A page cached for a different version (e.g. of the data embedded in it)
+        is rendered again, so only the latest version of each page is kept.
+        """
+        cached = self._pages.get(key)
+        if cached is None or cached[0] != version:
+            html = render().encode('utf-8')
+            page = (hashlib.sha256(html).hexdigest()[:FINGERPRINT_LENGTH], compress(html))
+            with self._lock:
+                self._pages[key] = (version, page)
+            return page
+        return cached[1]
+
+    def invalidate(self):
+        with self._lock:
+            self._pages = {}
+
+
+def compress_response(response, accept_encoding, min_size=MIN_COMPRESS_SIZE):
+    """
+    Gzip a buffered Flask response in place when it is large enough to benefit.
+
+    Streamed responses (exports) and responses that already carry a
+    Content-Encoding are left untouched.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    if choose_encoding(accept_encoding, ('gzip',)) != 'gzip':
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
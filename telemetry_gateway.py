@@ -0,0 +1,365 @@
+"""
+Telemetry Gateway
+High-throughput local ingestion of device readings over a compact binary protocol
+
+Sensors stream fixed-layout 16-byte frames over TCP (a continuous stream of frames)
+or UDP (one or more whole frames per datagram):
+
+    offset  size  type     field
+    0       4     uint32   device id
+    4       1     uint8    field code (see FIELDS)
+    5       3              padding
+    8       4     float32  value
+    12      4     uint32   unix timestamp in seconds (0 = time of receipt)
+
+All integers are little-endian. Frames are parsed in place from memoryviews of the
+receive buffer. Readings are coalesced per device and field and applied in one
+transaction per batch: device columns are updated with the latest value, and
+every power reading is appended to energy_logs. With --hot-tier, or whenever the
+database already has a hot tier file (the dashboard creates one by default), sensor
+values, power, battery levels and on/off states go to the dashboard's shared-memory hot
+tier instead of the devices table (the dashboard checkpoints them), so a batch of
+readings alone costs no SQLite transaction. Writing those columns with SQL while the
+hot tier holds older readings for them would be hidden by the dashboard's overlay.
+
+Usage:
+    python telemetry_gateway.py --port 9750
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import struct
+import time
+
+import hot_tier
+
+FRAME = struct.Struct('<IB3xfI')
+FRAME_SIZE = FRAME.size
+FLOAT32_MAX = 3.4028234663852886e38
+
+# Field codes and the devices column each one updates
+FIELD_VALUE = 1
+FIELD_POWER = 2
+FIELD_BATTERY = 3
+FIELD_STATE = 4
+FIELDS = {
+    FIELD_VALUE: 'value',
+    FIELD_POWER: 'power_consumption',
+    FIELD_BATTERY: 'battery_level',
+    FIELD_STATE: 'state'
+}
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices.db')
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9750
+
+# Requested UDP receive buffer; bursts beyond it are dropped by the kernel (capped by net.core.rmem_max)
+UDP_RECEIVE_BUFFER = 8 * 1024 * 1024
+
+# A batch is flushed after this many seconds or this many buffered power readings
+FLUSH_INTERVAL = 0.1
+FLUSH_MAX_READINGS = 50000
+# Reading from sockets pauses while a flush is running and this many readings are buffered
+PAUSE_READINGS = 2 * FLUSH_MAX_READINGS
+
+# Inclusive range of accepted values per field code (state: any finite number, non-zero = on)
+FIELD_RANGES = {field: hot_tier.RANGES.get(column, (-FLOAT32_MAX, FLOAT32_MAX)) for field, column in FIELDS.items()}
+
+
+def convert(field, value):
+    """Convert a frame value to what the devices column stores."""
+    if field == FIELD_STATE:
+        return 'on' if value else 'off'
+    if field == FIELD_POWER:
+        return value
+    return int(round(value))
+
+
+def execute_rows(cursor, sql, rows):
+    """
+    executemany() inside a savepoint; if a row cannot be stored, retry row by row so
+    only that row is lost. Returns the number of rows skipped.
+    """
+    cursor.execute('SAVEPOINT rows')
+    try:
+        cursor.executemany(sql, rows)
+        return 0
+    except (OverflowError, ValueError, sqlite3.DataError, sqlite3.IntegrityError):
+        cursor.execute('ROLLBACK TO rows')
+        skipped = 0
+        for row in rows:
+            try:
+                cursor.execute(sql, row)
+            except (OverflowError, ValueError, sqlite3.DataError, sqlite3.IntegrityError):
+                skipped += 1
+        return skipped
+    finally:
+        cursor.execute('RELEASE rows')
+
+
+class TelemetryBatcher:
+    """Coalesces readings in memory and applies them to SQLite in batches."""
+
+    def __init__(self, database, hot=None):
+        self.database = database
+        # Optional opened hot_tier.HotTier for value, power and battery readings
+        self.hot = hot
+        # (device id, field code) -> latest value
+        self.latest = {}
+        # (device id, power, unix timestamp) rows for energy_logs
+        self.energy = []
+        self.stats = {'frames': 0, 'rejected': 0, 'batches': 0, 'applied': 0, 'pauses': 0}
+        self._flushing = None
+        # Open TCP connections and the UDP endpoint, paused together when buffers fill up
+        self.transports = set()
+        self.paused = False
+
+    def add_frames(self, view):
+        """Parse every whole frame in a memoryview; returns the number of bytes consumed."""
+        usable = len(view) - len(view) % FRAME_SIZE
+        if not usable:
+            return 0
+        now = int(time.time())
+        latest = self.latest
+        energy = self.energy
+        rejected = 0
+        ranges = FIELD_RANGES
+        for device_id, field, value, timestamp in FRAME.iter_unpack(view[:usable]):
+            # Unknown fields, NaN, infinities and out-of-range values are dropped here
+            # so they cannot fail the batch they would be written in
+            bounds = ranges.get(field)
+            if bounds is None or not bounds[0] <= value <= bounds[1]:
+                rejected += 1
+                continue
+            latest[device_id, field] = value
+            if field == FIELD_POWER:
+                energy.append((device_id, value, timestamp or now))
+        frames = usable // FRAME_SIZE
+        self.stats['frames'] += frames
+        self.stats['rejected'] += rejected
+        return usable
+
+    def take_batch(self):
+        """Swap out the pending readings for a new batch."""
+        latest, energy = self.latest, self.energy
+        self.latest, self.energy = {}, []
+        return latest, energy
+
+    def apply_batch(self, latest, energy):
+        """Write one batch in a single transaction (runs on an executor thread)."""
+        updates = {}
+        readings = {}
+        for (device_id, field), value in latest.items():
+            if self.hot is not None and FIELDS[field] in hot_tier.FIELDS:
+                readings.setdefault(device_id, {})[FIELDS[field]] = convert(field, value)
+            else:
+                updates.setdefault(field, []).append((convert(field, value), device_id))
+        column_fields = {column: field for field, column in FIELDS.items()}
+        # Power readings are counted once, as energy_logs rows
+        applied = 0
+        for device_id, values in readings.items():
+            try:
+                stored = self.hot.write(device_id, values)
+            except ValueError:
+                self.stats['rejected'] += len(values)
+                continue
+            if stored:
+                applied += len(values) - ('power_consumption' in values)
+            else:
+                # No slot for this device id; write the columns instead
+                for column, value in values.items():
+                    updates.setdefault(column_fields[column], []).append((value, device_id))
+        self.stats['applied'] += applied
+        if not updates and not energy:
+            self.stats['batches'] += 1
+            return
+
+        conn = sqlite3.connect(self.database)
+        applied = rejected = 0
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            for field, rows in updates.items():
+                skipped = execute_rows(cursor, f'UPDATE devices SET {FIELDS[field]} = ? WHERE id = ?', rows)
+                rejected += skipped
+                if field != FIELD_POWER:
+                    applied += len(rows) - skipped
+            if energy:
+                skipped = execute_rows(
+                    cursor,
+                    "INSERT INTO energy_logs (device_id, power_consumption, timestamp) "
+                    "VALUES (?, ?, datetime(?, 'unixepoch'))",
+                    energy
+                )
+                rejected += skipped
+                applied += len(energy) - skipped
+            conn.commit()
+        finally:
+            conn.close()
+        self.stats['batches'] += 1
+        self.stats['rejected'] += rejected
+        self.stats['applied'] += applied
+
+    async def run(self, interval=FLUSH_INTERVAL):
+        """Flush pending readings every interval seconds."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush(loop)
+
+    async def flush(self, loop=None):
+        loop = loop or asyncio.get_running_loop()
+        if self._flushing is not None:
+            # Only one writer at a time; readings keep accumulating meanwhile
+            return
+        if not self.latest and not self.energy:
+            return
+        latest, energy = self.take_batch()
+        self._flushing = loop.run_in_executor(None, self.apply_batch, latest, energy)
+        try:
+            await self._flushing
+        except Exception as e:
+            print(f"Error applying telemetry batch: {e}")
+        finally:
+            self._flushing = None
+            self.resume_reading()
+        self.maybe_flush()
+
+    def buffered(self):
+        return len(self.latest) + len(self.energy)
+
+    def maybe_flush(self):
+        """Start an early flush when too many readings are buffered, or pause reading behind a slow one."""
+        if self._flushing is None:
+            if len(self.energy) >= FLUSH_MAX_READINGS:
+                asyncio.ensure_future(self.flush())
+        elif self.buffered() >= PAUSE_READINGS:
+            self.pause_reading()
+
+    def pause_reading(self):
+        """Stop reading from every socket; unread data waits in the kernel (and TCP senders slow down)."""
+        if self.paused:
+            return
+        self.paused = True
+        self.stats['pauses'] += 1
+        for transport in self.transports:
+            transport.pause_reading()
+
+    def resume_reading(self):
+        if not self.paused:
+            return
+        self.paused = False
+        for transport in self.transports:
+            if not transport.is_closing():
+                transport.resume_reading()
+
+
+class TelemetryStreamProtocol(asyncio.Protocol):
+    """TCP connection carrying a continuous stream of frames."""
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.buffer = bytearray()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.batcher.transports.add(transport)
+        if self.batcher.paused:
+            transport.pause_reading()
+
+    def connection_lost(self, exc):
+        self.batcher.transports.discard(self.transport)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        if buffer:
+            buffer += data
+            with memoryview(buffer) as view:
+                consumed = self.batcher.add_frames(view)
+            del buffer[:consumed]
+        else:
+            # Common case: parse straight from the received bytes, keep only a partial tail
+            with memoryview(data) as view:
+                consumed = self.batcher.add_frames(view)
+            if consumed < len(data):
+                buffer += data[consumed:]
+        self.batcher.maybe_flush()
+
+
+class TelemetryDatagramProtocol(asyncio.DatagramProtocol):
+    """UDP endpoint; each datagram holds whole frames."""
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.batcher.transports.add(transport)
+
+    def connection_lost(self, exc):
+        self.batcher.transports.discard(self.transport)
+
+    def datagram_received(self, data, addr):
+        with memoryview(data) as view:
+            self.batcher.add_frames(view)
+        self.batcher.maybe_flush()
+
+
+async def serve(database=DEFAULT_DATABASE, host=DEFAULT_HOST, port=DEFAULT_PORT, stats_interval=0, hot=None):
+    """Run TCP and UDP listeners on the same port until cancelled."""
+    loop = asyncio.get_running_loop()
+    batcher = TelemetryBatcher(database, hot)
+    server = await loop.create_server(lambda: TelemetryStreamProtocol(batcher), host, port)
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: TelemetryDatagramProtocol(batcher), local_addr=(host, port)
+    )
+    try:
+        transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+    except OSError as e:
+        print(f"Warning: could not enlarge UDP receive buffer: {e}")
+    print(f"Telemetry gateway listening on {host}:{port} (TCP and UDP)", flush=True)
+
+    flusher = asyncio.ensure_future(batcher.run())
+    try:
+        if stats_interval:
+            while True:
+                await asyncio.sleep(stats_interval)
+                print(f"Telemetry stats: {batcher.stats}", flush=True)
+        else:
+            await server.serve_forever()
+    finally:
+        flusher.cancel()
+        transport.close()
+        server.close()
+        await batcher.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Binary telemetry gateway')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='SQLite database path')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Listen address')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP and UDP port')
+    parser.add_argument('--stats-interval', type=float, default=0, help='Print counters every N seconds')
+    parser.add_argument('--hot-tier', action='store_true',
+                        help="Write value, power, battery and state readings to the dashboard's hot tier "
+                             "(automatic when the database has a hot tier file)")
+    args = parser.parse_args()
+    hot = None
+    if args.hot_tier or os.path.exists(hot_tier.path_for(args.database)):
+        if hot_tier.HOT_TIER_AVAILABLE:
+            hot = hot_tier.HotTier(hot_tier.path_for(args.database)).open()
+        else:
+            print("Warning: hot tier needs fcntl, which this platform lacks. Writing readings to SQLite.")
+    try:
+        asyncio.run(serve(args.database, args.host, args.port, args.stats_interval, hot))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()